@@ -3,29 +3,103 @@ __author__ = 'jesse'
 
 import sys
 import os
+import pickle
+import multiprocessing
+import move_features
 
 
 # python meta_move_features.py [data_dir] [modalities] [behaviors] [dest_dir]
+#   [num_workers=1] [manifest_fn=dest_dir/features_manifest.pickle]
+# feature CSVs are spread over num_workers processes; the manifest records each CSV's size and modification
+# time and a digest of every object's rows, so re-ingesting skips unchanged CSVs and rewrites only the
+# features.csv of objects whose rows changed
 def main():
 
     data_dir = sys.argv[1]
     modalities = sys.argv[2].split(',')
     behaviors = sys.argv[3].split(',')
     dest = sys.argv[4]
+    num_workers = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+    manifest_fn = sys.argv[6] if len(sys.argv) > 6 else os.path.join(dest, 'features_manifest.pickle')
+
+    oname_to_oid = move_features.read_object_list(os.path.join(data_dir, 'etc', 'object_list.csv'))
 
     # loop through modality directories
+    sources = []
     for m in modalities:
         # loop through behavior directories
         for b in behaviors:
             csv_dir = os.path.join(data_dir, m, b+"_"+m)
             for root, dirs, files in os.walk(csv_dir):
                 csv_files = [f for f in files if len(f.split('.')) > 1 and f.split('.')[1] == 'csv']
-                if len(files) > 1:
+                if len(csv_files) != 1:
                     sys.exit("ERROR: Expected single CSV in "+csv_dir+" but found "+str(len(csv_files)))
-                cmd = " ".join(["python", "move_features.py", os.path.join(root, csv_files[0]),
-                          os.path.join(data_dir, 'etc', 'object_list.csv'), b, m, dest])
-                print cmd
-                os.system(cmd)
+                sources.append((os.path.join(root, csv_files[0]), b, m))
+
+    manifest = read_manifest(manifest_fn)
+    stale = []
+    for feat_fn, b, m in sources:
+        if not source_unchanged(manifest.get((b, m)), feat_fn, oname_to_oid, b, m, dest):
+            stale.append((feat_fn, oname_to_oid, b, m, dest, manifest[(b, m)][3] if (b, m) in manifest else {}))
+    print "ingesting "+str(len(stale))+" new or changed feature CSVs of "+str(len(sources))
+
+    if num_workers > 1 and len(stale) > 1:
+        pool = multiprocessing.Pool(min(num_workers, len(stale)))
+        ingested = pool.map(ingest_source, stale)
+        pool.close()
+        pool.join()
+    else:
+        ingested = [ingest_source(s) for s in stale]
+    for feat_fn, b, m, stat, digests, rewritten in ingested:
+        print feat_fn+" -> "+b+"/"+m+": rewrote "+str(len(rewritten))+" of "+str(len(digests))+" objects"
+        manifest[(b, m)] = (feat_fn, stat, sorted(oname_to_oid.items()), digests)
+
+    write_manifest(manifest_fn, {(b, m): manifest[(b, m)] for _, b, m in sources})
+
+
+# the size and modification time of a file, taken as unchanged if both are
+def file_stat(fn):
+    st = os.stat(fn)
+    return st.st_size, st.st_mtime
+
+
+# whether a source's manifest entry shows it was already ingested as it is now, with all its outputs in place
+def source_unchanged(entry, feat_fn, oname_to_oid, b, m, dest):
+    if entry is None or entry[0] != feat_fn or entry[1] != file_stat(feat_fn) or \
+            entry[2] != sorted(oname_to_oid.items()):
+        return False
+    return all([os.path.isfile(os.path.join(dest, 'obj'+str(oid), b, m, 'features.csv'))
+                for oid in oname_to_oid.values()])
+
+
+# route one feature CSV to its objects; takes a single tuple so it can be mapped over a pool
+def ingest_source(args):
+    feat_fn, oname_to_oid, b, m, dest, digests = args
+    stat = file_stat(feat_fn)
+    digests, rewritten = move_features.move_features(feat_fn, oname_to_oid, b, m, dest, digests)
+    return feat_fn, b, m, stat, digests, rewritten
+
+
+# manifest indexed by (behavior, modality), valued at (source CSV, its file_stat, object list, object digests)
+def read_manifest(manifest_fn):
+    if not os.path.isfile(manifest_fn):
+        return {}
+    try:
+        f = open(manifest_fn, 'rb')
+        manifest = pickle.load(f)
+        f.close()
+        return manifest
+    except (IOError, EOFError, pickle.UnpicklingError), e:
+        print "ignoring unreadable manifest "+manifest_fn+": "+str(e)
+        return {}
+
+
+# write the manifest through a temporary file so an interrupted run can't leave a partial one behind
+def write_manifest(manifest_fn, manifest):
+    f = open(manifest_fn+".tmp", 'wb')
+    pickle.dump(manifest, f, pickle.HIGHEST_PROTOCOL)
+    f.close()
+    os.rename(manifest_fn+".tmp", manifest_fn)
 
 if __name__ == "__main__":
         main()
@@ -3,6 +3,7 @@ __author__ = 'jesse'
 
 import sys
 import os
+import hashlib
 
 
 # python move_features.py [original features csv] [objects list csv] [behavior] [modality] [dest dir]
@@ -14,47 +15,82 @@ def main():
     mod = sys.argv[4]
     dest = sys.argv[5]
 
-    # get mapping from object names to IDs
+    oname_to_oid = read_object_list(obj_id_fn)
+    move_features(feat_fn, oname_to_oid, beh, mod, dest, {})
+
+
+# get mapping from object names to IDs
+def read_object_list(obj_id_fn):
     oname_to_oid = {}
-    oname_to_obs = {}
     f = open(obj_id_fn, 'r')
     for line in f:
         if len(line.strip()) == 0:
             continue
         oname, oid = line.strip().split(',')
         oname_to_oid[oname] = int(oid)
-        oname_to_obs[oname] = []
     f.close()
+    return oname_to_oid
 
-    # read in features
-    f = open(feat_fn, 'r')
-    for line in f:
-        oname_obs = line.strip().split(',')[0].split('_')
-        oname_p = []
-        for p in oname_obs:
-            if '.' in p:
-                p = ".".join(p.split('.')[:-1])
-            try:
-                _ = int(p)
-            except ValueError:
-                if len(p) > 0:
-                    p_wos = p.split('/')[-1]
-                    oname_p.append(p_wos)
-        oname = '_'.join(oname_p)
-        oname_to_obs[oname].append(line)
-    f.close()
 
-    # write out object directories
+# name of the object a feature line observes, from its first field, e.g. 'pics/Pink_crayon_bank_1.JPG'
+def observation_object_name(line):
+    oname_obs = line.strip().split(',')[0].split('_')
+    oname_p = []
+    for p in oname_obs:
+        if '.' in p:
+            p = ".".join(p.split('.')[:-1])
+        try:
+            _ = int(p)
+        except ValueError:
+            if len(p) > 0:
+                p_wos = p.split('/')[-1]
+                oname_p.append(p_wos)
+    return '_'.join(oname_p)
+
+
+# stream feat_fn once, routing each line to its object's features.csv under dest for behavior beh and modality
+# mod; lines go to a temporary file per object while their digest is taken, and an object's features.csv is
+# only replaced where that digest differs from its entry in digests or the file is missing
+# returns the new digests indexed by object ID and the IDs of objects whose features.csv was rewritten
+def move_features(feat_fn, oname_to_oid, beh, mod, dest, digests):
+    loc_fns = {}
+    tmp_fs = {}
+    hashes = {}
     for oname in oname_to_oid:
         oid = oname_to_oid[oname]
         loc_dir = os.path.join(dest, 'obj'+str(oid), beh, mod)
         if not os.path.isdir(loc_dir):
-            os.system("mkdir -p "+loc_dir)
-        fn = os.path.join(loc_dir, 'features.csv')
-        f = open(fn, 'w')
-        for obs in oname_to_obs[oname]:
-            f.write(obs)
+            os.makedirs(loc_dir)
+        loc_fns[oname] = os.path.join(loc_dir, 'features.csv')
+        tmp_fs[oname] = open(loc_fns[oname]+".tmp", 'wb')
+        hashes[oname] = hashlib.sha1()
+
+    routed = False
+    try:
+        f = open(feat_fn, 'rb')
+        for line in f:
+            oname = observation_object_name(line)
+            tmp_fs[oname].write(line)
+            hashes[oname].update(line)
         f.close()
+        routed = True
+    finally:
+        for oname in tmp_fs:
+            tmp_fs[oname].close()
+            if not routed:
+                os.remove(loc_fns[oname]+".tmp")
+
+    new_digests = {}
+    rewritten = []
+    for oname in oname_to_oid:
+        oid = oname_to_oid[oname]
+        new_digests[oid] = hashes[oname].hexdigest()
+        if digests.get(oid) != new_digests[oid] or not os.path.isfile(loc_fns[oname]):
+            os.rename(loc_fns[oname]+".tmp", loc_fns[oname])
+            rewritten.append(oid)
+        else:
+            os.remove(loc_fns[oname]+".tmp")
+    return new_digests, rewritten
 
 
 if __name__ == "__main__":
@@ -7,10 +7,17 @@ from std_srvs.srv import *
 import operator
 import math
 import random
+import threading
+import hashlib
 import cv2
 import numpy
 
 
+# agent attributes rebuilt on load rather than pickled or copied
+transient_agent_attributes = ['result_cache', 'pred_score_cache', 'sub_tensor_cache', 'cache_generation',
+                              'cache_lock', 'precompute_thread']
+
+
 def join_lists(a, b, allow_duplicates=True):
     c = a[:]
     for item in b:
@@ -49,6 +56,12 @@ def join_dicts(a, b, allow_duplicates=True, warn_duplicates=False):
     return c
 
 
+# identify a classifier training set independently of the order its examples were gathered in
+def training_set_fingerprint(oidxs, labels):
+    pairs = sorted(zip(oidxs, labels))
+    return hashlib.sha1(';'.join([str(oidx)+':'+('1' if label else '0') for oidx, label in pairs])).hexdigest()
+
+
 class SVM:
 
     def __init__(self, C=1, gamma=0.5):
@@ -92,6 +105,14 @@ class IspyAgent:
         self.classifier_to_predicate_map = {}
         self.classifier_data_modified = {}
 
+        # classifier results are cached until their classifier is retrained, and are fetched in the background
+        # while the human takes their turn if speculate is set
+        self.speculate = True
+        self.init_result_cache()
+
+        # prefix of the classifier_services node this agent talks to, eg. '/xval_3/'; empty for the default node
+        self.service_ns = ''
+
         # get stopwords
         self.stopwords = []
         if stopwords_fn is not None:
@@ -100,9 +121,36 @@ class IspyAgent:
                 self.stopwords.append(line.strip())
             fin.close()
 
+    # set up the result caches and background worker state, none of which is pickled
+    def init_result_cache(self):
+        self.result_cache = {}  # indexed by (classifier ID, object ID), valued at run_classifier_client results
+        self.pred_score_cache = {}  # indexed by (object ID, object IDs, (predicate, classifier ID) pairs)
+        self.sub_tensor_cache = {}  # indexed by (classifier IDs, object IDs), valued at get_sub_classifier_tensor
+        self.cache_generation = 0  # bumped on invalidation so in-flight results from before it aren't stored
+        self.cache_lock = threading.Lock()
+        self.precompute_thread = None
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        for k in transient_agent_attributes:
+            d.pop(k, None)
+        return d
+
+    # agents pickled before caching and service namespaces existed have neither attribute
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        if 'speculate' not in d:
+            self.speculate = True
+        if 'service_ns' not in d:
+            self.service_ns = ''
+        self.init_result_cache()
+
     # invite the human to describe an object, parse the description, and start formulating response strategy
     def human_take_turn(self):
 
+        # classifier results for this round are fetched while the human thinks and types
+        self.start_precompute()
+
         self.io.say("Please pick an object that you see and describe it to me in one phrase.")
 
         understood = False
@@ -178,22 +226,11 @@ class IspyAgent:
     def robot_take_turn(self, ob_pos):
         ob_idx = self.object_IDs[ob_pos]
 
-        # get results for each attribute for every object
+        # score each active predicate as a description of ob_idx, most of which was precomputed during the
+        # human's turn; only predicates introduced by the human's utterance should need new classifier calls
+        self.finish_precompute()
         active_predicates = [p for p in self.predicates if self.predicate_active[p]]
-        r = self.get_classifier_results(active_predicates, self.object_IDs)
-
-        # rank the classifiers favoring high confidence on ob_idx with low confidence or negative
-        # decisions on other objects
-        pred_scores = {}
-        pred_confidence = {}
-        for pred in active_predicates:
-            score = (r[ob_idx][pred][0]*r[ob_idx][pred][1])*len(self.object_IDs)
-            for oidx in self.object_IDs:
-                if ob_idx == oidx:
-                    continue
-                score -= r[oidx][pred][0]*r[oidx][pred][1]
-            pred_scores[pred] = score
-            pred_confidence[pred] = r[ob_idx][pred][1]
+        pred_scores, pred_confidence = self.get_pred_scores(ob_idx, active_predicates)
 
         if self.log_fn is not None:
             f = open(self.log_fn, 'a')
@@ -341,6 +378,62 @@ class IspyAgent:
 
         return match_scores
 
+    # rank the predicates as descriptions of ob_idx, favoring high confidence on ob_idx with low confidence or
+    # negative decisions on other objects; returns maps from predicates to scores and to confidence on ob_idx
+    def get_pred_scores(self, ob_idx, preds, object_IDs=None):
+        if object_IDs is None:
+            object_IDs = self.object_IDs
+        key = (ob_idx, tuple(object_IDs), tuple([(p, self.predicate_to_classifier_map[p]) for p in preds]))
+        self.cache_lock.acquire()
+        cached = self.pred_score_cache.get(key)
+        generation = self.cache_generation
+        self.cache_lock.release()
+        if cached is not None:
+            return dict(cached[0]), dict(cached[1])
+
+        r = self.get_classifier_results(preds, object_IDs)
+        pred_scores = {}
+        pred_confidence = {}
+        for pred in preds:
+            score = (r[ob_idx][pred][0]*r[ob_idx][pred][1])*len(object_IDs)
+            for oidx in object_IDs:
+                if ob_idx == oidx:
+                    continue
+                score -= r[oidx][pred][0]*r[oidx][pred][1]
+            pred_scores[pred] = score
+            pred_confidence[pred] = r[ob_idx][pred][1]
+
+        self.cache_lock.acquire()
+        if generation == self.cache_generation:
+            self.pred_score_cache[key] = (pred_scores, pred_confidence)
+        self.cache_lock.release()
+        return dict(pred_scores), dict(pred_confidence)
+
+    # start fetching results for all active predicates on the current objects in a background thread, scoring
+    # them as descriptions of every object so the robot's turn is ready when the human's turn ends
+    def start_precompute(self):
+        if not self.speculate or self.object_IDs is None:
+            return
+        if self.precompute_thread is not None and self.precompute_thread.is_alive():
+            return
+        preds = [p for p in self.predicates if self.predicate_active[p]]
+        self.precompute_thread = threading.Thread(target=self.precompute, args=(preds, self.object_IDs[:]))
+        self.precompute_thread.daemon = True
+        self.precompute_thread.start()
+
+    def precompute(self, preds, object_IDs):
+        try:
+            for ob_idx in object_IDs:
+                self.get_pred_scores(ob_idx, preds, object_IDs)
+        except Exception, e:  # the foreground will make and report the same calls itself
+            print "speculative classifier precomputation stopped: "+str(e)
+
+    # wait for any background precomputation to finish
+    def finish_precompute(self):
+        if self.precompute_thread is not None:
+            self.precompute_thread.join()
+            self.precompute_thread = None
+
     # get results for each perceptual classifier over all objects so that for any given perceptual classifier,
     # objects have locations in concept-dimensional space for that classifier
     # detect classifiers that should be split into two because this space has two distinct clusters of objects,
@@ -719,53 +812,55 @@ class IspyAgent:
 
     # given vectors of predicates and object idxs, return a map of results
     def get_classifier_results(self, preds, oidxs):
+        self.run_classifiers_cached([self.predicate_to_classifier_map[pred] for pred in preds], oidxs)
         m = {}
         for oidx in oidxs:
             om = {}
             for pred in preds:
                 cidx = self.predicate_to_classifier_map[pred]
-                result, confidence, _ = self.run_classifier_client(cidx, oidx)
+                result, confidence, _ = self.run_classifier_cached(cidx, oidx)
                 om[pred] = [result, confidence]
             m[oidx] = om
         return m
 
     # given vectors of predicates and object idxs, return a map of results
     def get_sub_classifier_results(self, preds, oidxs):
+        t = self.get_sub_classifier_tensor(preds, oidxs)
         m = {}
-        for oidx in oidxs:
-            om = {}
-            for pred in preds:
-                cidx = self.predicate_to_classifier_map[pred]
-                _, _, sub_results = self.run_classifier_client(cidx, oidx)
-                om[pred] = sub_results
-            m[oidx] = om
+        for o_idx in range(0, len(oidxs)):
+            m[oidxs[o_idx]] = {preds[p_idx]: t[o_idx, p_idx].tolist() for p_idx in range(0, len(preds))}
         return m
 
+    # given vectors of predicates and object idxs, return a read-only (objects x predicates x contexts) float32
+    # array of sub classifier decisions, contexts running over behaviors then modalities; it is fetched in one
+    # batch and kept until the classifiers behind it are retrained
+    def get_sub_classifier_tensor(self, preds, oidxs):
+        cidxs = tuple([self.predicate_to_classifier_map[pred] for pred in preds])
+        key = (cidxs, tuple(oidxs))
+        self.cache_lock.acquire()
+        t = self.sub_tensor_cache.get(key)
+        generation = self.cache_generation
+        self.cache_lock.release()
+        if t is not None:
+            return t
+        self.run_classifiers_cached(cidxs, oidxs)
+        rows = [[self.run_classifier_cached(cidx, oidx)[2] for cidx in cidxs] for oidx in oidxs]
+        num_contexts = len(rows[0][0]) if len(oidxs) > 0 and len(cidxs) > 0 else 0
+        t = numpy.array(rows, dtype=numpy.float32).reshape((len(oidxs), len(cidxs), num_contexts))
+        t.setflags(write=False)
+        self.cache_lock.acquire()
+        if generation == self.cache_generation:
+            self.sub_tensor_cache[key] = t
+        self.cache_lock.release()
+        return t
+
     # given predicate and object idxs, return a vector of behavior/modality decision*conf vectors
     def get_predicate_classifier_decision_conf_matrices(self, pred, oidxs):
-        ov = []
-        for oidx in oidxs:
-            cidx = self.predicate_to_classifier_map[pred]
-            _, _, sub_decisions = self.run_classifier_client(cidx, oidx)
-            ov.append(sub_decisions)
-        return ov
+        return numpy.array(self.get_sub_classifier_tensor([pred], oidxs)[:, 0, :])
 
     # given predicate and object idxs, return a vector of behavior/modality decision vectors
     def get_predicate_classifier_decision_matrices(self, pred, oidxs):
-        ov = []
-        for oidx in oidxs:
-            cidx = self.predicate_to_classifier_map[pred]
-            _, _, sub_decisions = self.run_classifier_client(cidx, oidx)
-            sds = []
-            for sd in sub_decisions:
-                if sd > 0:
-                    sds.append(1)
-                elif sd < 0:
-                    sds.append(-1)
-                else:
-                    sds.append(sd)  # 0
-            ov.append(sds)
-        return ov
+        return numpy.sign(self.get_sub_classifier_tensor([pred], oidxs)[:, 0, :])
 
     # given a string input, strip stopwords and use word to predicate map to build cnf clauses
     # such that each clause represents the predicates associated with each word
@@ -793,17 +888,20 @@ class IspyAgent:
 
         return cnfs
 
-    # add given attribute examples and re-train relevant classifiers
+    # add given attribute examples and re-train relevant classifiers; label lists are replaced rather than
+    # appended to so that a SessionView never writes into lists its base agent holds
     def update_predicate_data(self, pred, data):
         for oidx, label in data:
-            if oidx not in self.predicate_examples[pred]:
-                self.predicate_examples[pred][oidx] = []
-            self.predicate_examples[pred][oidx].append(label)
+            self.predicate_examples[pred][oidx] = self.predicate_examples[pred].get(oidx, []) + [label]
         cidx = self.predicate_to_classifier_map[pred]
         self.classifier_data_modified[cidx] = True
 
     # retrain classifiers that have modified data since last training
-    def retrain_predicate_classifiers(self):
+    # with checkpoint_every, classifiers are saved after every that many are retrained, so that a run stopped
+    # partway can be resumed by loading them back, where the saved fingerprints skip those already retrained
+    def retrain_predicate_classifiers(self, checkpoint_every=None):
+        retrained = []
+        unsaved = 0
         for cidx in self.classifier_data_modified:
             pred = self.classifier_to_predicate_map[cidx]
             if self.classifier_data_modified[cidx]:
@@ -820,8 +918,26 @@ class IspyAgent:
                         r_oidxs.append(oidx)
                         r_labels.append(True if t > 0 else False)
                 print r_oidxs, r_labels  # DEBUG
-                self.train_classifier_client(cidx, r_oidxs, r_labels)
+                # votes can change without changing the training set, which then needn't be retrained on
+                fingerprint = training_set_fingerprint(r_oidxs, r_labels)
+                if self.get_classifier_fingerprint_client(cidx) == fingerprint:
+                    print "... training set for '"+pred+"' unchanged; skipping retraining"
+                else:
+                    self.train_classifier_client(cidx, r_oidxs, r_labels, fingerprint=fingerprint)
+                    retrained.append(cidx)
+                    unsaved += 1
+                    if checkpoint_every is not None and unsaved >= checkpoint_every:
+                        print "... checkpointing "+str(len(retrained))+" retrained classifiers"
+                        self.save_classifiers()
+                        unsaved = 0
                 self.classifier_data_modified[cidx] = False
+        if checkpoint_every is not None and unsaved > 0:
+            self.save_classifiers()
+        self.invalidate_classifier_results(retrained)
+
+    # the agent as it should be pickled; views over a shared agent return a standalone agent instead
+    def standalone(self):
+        return self
 
     # fold in data structures from another dialog agent
     def unify_with_agent(self, other):
@@ -842,6 +958,7 @@ class IspyAgent:
             self.predicate_examples, other.predicate_examples, allow_duplicates=True)
 
         # establish new classifier IDs and mark all for retraining
+        self.invalidate_classifier_results()
         for i in range(0, len(self.predicates)):
             self.predicate_to_classifier_map[self.predicates[i]] = i
             self.classifier_to_predicate_map[i] = self.predicates[i]
@@ -891,6 +1008,7 @@ class IspyAgent:
 
     # load classifiers
     def load_classifiers(self):
+        self.invalidate_classifier_results()
         r = self.load_classifiers_client()
         if not r:
             print "ERROR when loading perceptual classifiers"
@@ -901,16 +1019,94 @@ class IspyAgent:
         if not r:
             print "ERROR when saving perceptual classifiers"
 
+    # run a classifier on an object, reusing its last result if the classifier hasn't been retrained since
+    def run_classifier_cached(self, cidx, oidx):
+        key = (cidx, oidx)
+        self.cache_lock.acquire()
+        r = self.result_cache.get(key)
+        generation = self.cache_generation
+        self.cache_lock.release()
+        if r is None:
+            r = self.run_classifier_client(cidx, oidx)
+            if r is not None:
+                self.cache_lock.acquire()
+                if generation == self.cache_generation:
+                    self.result_cache[key] = r
+                self.cache_lock.release()
+        return r
+
+    # run every given classifier on every given object, fetching the results not yet cached in one batch call
+    def run_classifiers_cached(self, cidxs, oidxs):
+        self.cache_lock.acquire()
+        missing = [(cidx, oidx) for cidx in cidxs for oidx in oidxs if (cidx, oidx) not in self.result_cache]
+        generation = self.cache_generation
+        self.cache_lock.release()
+        if len(missing) == 0:
+            return
+        m_cidxs = sorted(set([cidx for cidx, _ in missing]))
+        m_oidxs = sorted(set([oidx for _, oidx in missing]))
+        r = self.run_classifier_batch_client(m_cidxs, m_oidxs)
+        if r is None:
+            return
+        self.cache_lock.acquire()
+        if generation == self.cache_generation:
+            for c_idx in range(0, len(m_cidxs)):
+                for o_idx in range(0, len(m_oidxs)):
+                    self.result_cache[(m_cidxs[c_idx], m_oidxs[o_idx])] = r[c_idx][o_idx]
+        self.cache_lock.release()
+
+    # forget cached results of the given classifier IDs, or of every classifier if none are given
+    def invalidate_classifier_results(self, cidxs=None):
+        self.cache_lock.acquire()
+        if cidxs is None:
+            self.result_cache = {}
+        else:
+            cidxs = set(cidxs)
+            self.result_cache = {key: r for key, r in self.result_cache.items() if key[0] not in cidxs}
+        self.pred_score_cache = {}
+        self.sub_tensor_cache = {}
+        self.cache_generation += 1
+        self.cache_lock.release()
+
+    # create an empty classifier slot in the classifier services node
+    def create_classifier_slot(self, slot):
+        return self.classifier_slot_client("create", slot)[0]
+
+    # copy the classifiers of source (the active slot if None) into a new slot, sharing them until retrained
+    def clone_classifier_slot(self, slot, source=None):
+        return self.classifier_slot_client("clone", slot, source)[0]
+
+    # make slot the set of classifiers that is trained, run, saved, and loaded
+    def switch_classifier_slot(self, slot):
+        r = self.classifier_slot_client("switch", slot)[0]
+        if r:
+            self.invalidate_classifier_results()
+        return r
+
+    # release a slot that isn't active
+    def drop_classifier_slot(self, slot):
+        return self.classifier_slot_client("drop", slot)[0]
+
+    # name of the active classifier slot, or None if the classifier services node couldn't be asked
+    def get_active_classifier_slot(self):
+        success, active_slot = self.classifier_slot_client("active", '')
+        return active_slot if success else None
+
     # fetch all features from an object id
     def fetch_all_features(self, oidx):
         return self.fetch_all_features_client(oidx)
 
+    # resolve a classifier service name in this agent's service namespace
+    def service_name(self, name):
+        return self.service_ns+name
+
     # access the perceptual classifiers package load classifier service
     def get_free_classifier_id_client(self):
         req = getFreeClassifierIDRequest()
-        rospy.wait_for_service('get_free_classifier_ID')
+        rospy.wait_for_service(self.service_name('get_free_classifier_ID'))
         try:
-            get_free_classifier_id = rospy.ServiceProxy('get_free_classifier_ID', getFreeClassifierID)
+            get_free_classifier_id = rospy.ServiceProxy(self.service_name('get_free_classifier_ID'),
+                                                        getFreeClassifierID)
             res = get_free_classifier_id(req)
             return res.ID
         except rospy.ServiceException, e:
@@ -919,9 +1115,9 @@ class IspyAgent:
     # access the perceptual classifiers package load classifier service
     def load_classifiers_client(self):
         req = loadClassifiersRequest()
-        rospy.wait_for_service('load_classifiers')
+        rospy.wait_for_service(self.service_name('load_classifiers'))
         try:
-            load_classifiers = rospy.ServiceProxy('load_classifiers', loadClassifiers)
+            load_classifiers = rospy.ServiceProxy(self.service_name('load_classifiers'), loadClassifiers)
             res = load_classifiers(req)
             return res.success
         except rospy.ServiceException, e:
@@ -930,9 +1126,9 @@ class IspyAgent:
     # access the perceptual classifiers package save classifier service
     def save_classifiers_client(self):
         req = EmptyRequest()
-        rospy.wait_for_service('save_classifiers')
+        rospy.wait_for_service(self.service_name('save_classifiers'))
         try:
-            save_classifiers = rospy.ServiceProxy('save_classifiers', Empty)
+            save_classifiers = rospy.ServiceProxy(self.service_name('save_classifiers'), Empty)
             res = save_classifiers(req)  # TODO: give saveClassifiers a srv so it can respond with success flag
             return True
         except rospy.ServiceException, e:
@@ -944,29 +1140,87 @@ class IspyAgent:
         req = runClassifierRequest()
         req.classifier_ID = classifier_ID
         req.object_ID = object_ID
-        rospy.wait_for_service('run_classifier')
+        rospy.wait_for_service(self.service_name('run_classifier'))
         try:
-            run_classifier = rospy.ServiceProxy('run_classifier', runClassifier)
+            run_classifier = rospy.ServiceProxy(self.service_name('run_classifier'), runClassifier)
             res = run_classifier(req)
             return res.result, res.confidence, res.sub_classifier_decisions
         except rospy.ServiceException, e:
             print "Service call failed: %s" % e
 
+    # access the perceptual classifiers package run classifier batch service to get the decision result,
+    # confidence, and sub classifier weighted decisions of every classifier on every object in one call,
+    # indexed by position in classifier_IDs then in object_IDs
+    def run_classifier_batch_client(self, classifier_IDs, object_IDs):
+        req = runClassifierBatchRequest()
+        req.classifier_IDs = classifier_IDs
+        req.object_IDs = object_IDs
+        rospy.wait_for_service(self.service_name('run_classifier_batch'))
+        try:
+            run_classifier_batch = rospy.ServiceProxy(self.service_name('run_classifier_batch'), runClassifierBatch)
+            res = run_classifier_batch(req)
+        except rospy.ServiceException, e:
+            print "Service call failed: %s" % e
+            return None
+        num_objects = len(object_IDs)
+        num_contexts = len(res.sub_classifier_decisions) / len(res.result) if len(res.result) > 0 else 0
+        r = []
+        for c_idx in range(0, len(classifier_IDs)):
+            r.append([])
+            for o_idx in range(0, num_objects):
+                idx = c_idx*num_objects+o_idx
+                r[-1].append((res.result[idx], res.confidence[idx],
+                              res.sub_classifier_decisions[idx*num_contexts:(idx+1)*num_contexts]))
+        return r
+
     # access the perceptual classifiers package run classifier service to get
     # decision result, confidence, and sub classifier weighted decisions
-    def train_classifier_client(self, classifier_ID, object_IDs, positive_example):
+    def train_classifier_client(self, classifier_ID, object_IDs, positive_example, fingerprint=''):
         req = trainClassifierRequest()
         req.classifier_ID = classifier_ID
         req.object_IDs = object_IDs
         req.positive_example = positive_example
-        rospy.wait_for_service('train_classifier')
+        req.fingerprint = fingerprint
+        rospy.wait_for_service(self.service_name('train_classifier'))
         try:
-            train_classifier = rospy.ServiceProxy('train_classifier', trainClassifier)
+            train_classifier = rospy.ServiceProxy(self.service_name('train_classifier'), trainClassifier)
             res = train_classifier(req)
             return res.success
         except rospy.ServiceException, e:
             print "Service call failed: %s" % e
 
+    # access the perceptual classifiers package get classifier fingerprint service to get the fingerprint of the
+    # training set the classifier was last trained on, or an empty string if it is unknown
+    def get_classifier_fingerprint_client(self, classifier_ID):
+        req = getClassifierFingerprintRequest()
+        req.classifier_ID = classifier_ID
+        rospy.wait_for_service(self.service_name('get_classifier_fingerprint'))
+        try:
+            get_classifier_fingerprint = rospy.ServiceProxy(self.service_name('get_classifier_fingerprint'),
+                                                            getClassifierFingerprint)
+            res = get_classifier_fingerprint(req)
+            return res.fingerprint
+        except rospy.ServiceException, e:
+            print "Service call failed: %s" % e
+
+    # access the perceptual classifiers package classifier slot service, returning whether the operation
+    # succeeded and the slot active afterwards
+    def classifier_slot_client(self, operation, slot, source=None):
+        req = classifierSlotRequest()
+        req.operation = operation
+        req.slot = slot
+        req.source = source if source is not None else ''
+        rospy.wait_for_service(self.service_name('classifier_slot'))
+        try:
+            classifier_slot = rospy.ServiceProxy(self.service_name('classifier_slot'), classifierSlot)
+            res = classifier_slot(req)
+            if not res.success:
+                print "could not "+operation+" classifier slot '"+slot+"'; active slot is '"+res.active_slot+"'"
+            return res.success, res.active_slot
+        except rospy.ServiceException, e:
+            print "Service call failed: %s" % e
+            return False, None
+
     # fetch all features for a given object client
     def fetch_all_features_client(self, object_ID):
         req = FetchAllFeaturesRequest()
@@ -978,3 +1232,287 @@ class IspyAgent:
             return res.features
         except rospy.ServiceException, e:
             print "Service call failed: %s" % e
+
+
+# read-only view of an agent's predicate_examples with the labels of masked objects hidden and, optionally,
+# the labels in a second predicate_examples structure (eg. one user's) subtracted once each, as
+# subtract_predicate_examples would; nothing is copied until a predicate's labels for an object are read
+class MaskedPredicateExamples:
+
+    def __init__(self, examples, masked_oidxs=None, masked_examples=None):
+        self.examples = examples
+        self.masked_oidxs = set(masked_oidxs) if masked_oidxs is not None else set()
+        self.masked_examples = masked_examples if masked_examples is not None else {}
+
+    def __getitem__(self, pred):
+        return MaskedObjectExamples(self.examples[pred], self.masked_oidxs, self.masked_examples.get(pred, {}))
+
+    def __contains__(self, pred):
+        return pred in self.examples
+
+    def __iter__(self):
+        return iter(self.examples.keys())
+
+    def __len__(self):
+        return len(self.examples)
+
+    def keys(self):
+        return self.examples.keys()
+
+    def items(self):
+        return [(pred, self[pred]) for pred in self.examples]
+
+    def get(self, pred, default=None):
+        return self[pred] if pred in self.examples else default
+
+
+# one predicate's labels by object under a MaskedPredicateExamples; objects left with no labels are hidden
+class MaskedObjectExamples:
+
+    def __init__(self, labels, masked_oidxs, masked_labels):
+        self.labels = labels
+        self.masked_oidxs = masked_oidxs
+        self.masked_labels = masked_labels
+
+    def __getitem__(self, oidx):
+        if oidx in self.masked_oidxs:
+            raise KeyError(oidx)
+        ls = self.labels[oidx]
+        if oidx in self.masked_labels:
+            ls = ls[:]
+            for l in self.masked_labels[oidx]:
+                if l in ls:
+                    del ls[ls.index(l)]
+            if len(ls) == 0:
+                raise KeyError(oidx)
+        return ls
+
+    def __contains__(self, oidx):
+        try:
+            self[oidx]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter([oidx for oidx in self.labels.keys() if oidx in self])
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        return [oidx for oidx in self]
+
+    def items(self):
+        return [(oidx, self[oidx]) for oidx in self]
+
+    def get(self, oidx, default=None):
+        return self[oidx] if oidx in self else default
+
+
+# classifier_data_modified for a FoldView: every classifier of the base agent, unmodified unless marked in
+# this fold, so only the fold's own marks are stored
+class FoldModifications:
+
+    def __init__(self, base):
+        self.base = base
+        self.marks = {}
+
+    def __getitem__(self, cidx):
+        if cidx not in self.base and cidx not in self.marks:
+            raise KeyError(cidx)
+        return self.marks.get(cidx, False)
+
+    def __setitem__(self, cidx, modified):
+        self.marks[cidx] = modified
+
+    def __contains__(self, cidx):
+        return cidx in self.base or cidx in self.marks
+
+    # iterate over a snapshot so that retraining can clear marks as it goes
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return self.base.keys()+[cidx for cidx in self.marks if cidx not in self.base]
+
+
+# a held-out fold of an agent, sharing the agent's vocabulary, maps, and label lists instead of deep copying
+# them; examples of masked objects (and masked_examples, such as one user's) are hidden, and the fold keeps its
+# own retraining marks, classifier result caches, and service namespace
+# the view only reads the base agent's structures; learning new words through it changes the base agent
+class FoldView(IspyAgent):
+
+    def __init__(self, base, masked_oidxs=None, masked_examples=None):
+        self.base = base
+        self.io = None
+        self.log_fn = None
+        self.speculate = False
+        self.service_ns = base.service_ns
+        self.predicate_examples = MaskedPredicateExamples(base.predicate_examples, masked_oidxs, masked_examples)
+        self.classifier_data_modified = FoldModifications(base.classifier_data_modified)
+        self.init_result_cache()
+
+    # anything the fold doesn't hold itself is read from the base agent
+    def __getattr__(self, name):
+        if name == 'base' or name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+
+# a dict layered over a base dict that it only reads; entries set through the overlay are kept in it, shadowing
+# the base's, and with nested the base's values are dicts wrapped in overlays of their own the first time they
+# are read, so that writes into them stay out of the base too
+class OverlayDict:
+
+    def __init__(self, base, nested=False):
+        self.base = base
+        self.nested = nested
+        self.own = {}
+
+    def __getitem__(self, key):
+        if key in self.own:
+            return self.own[key]
+        v = self.base[key]
+        if self.nested:
+            v = OverlayDict(v)
+            self.own[key] = v
+        return v
+
+    def __setitem__(self, key, value):
+        self.own[key] = value
+
+    def __contains__(self, key):
+        return key in self.own or key in self.base
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        return self.base.keys()+[key for key in self.own if key not in self.base]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    # a plain dict of the overlay's entries, sharing the base's values that weren't written
+    def materialize(self):
+        d = dict(self.base)
+        for key in self.own:
+            d[key] = self.own[key].materialize() if isinstance(self.own[key], OverlayDict) else self.own[key]
+        return d
+
+
+# a list layered over a base list that it only reads; appended items are kept in the overlay, and the base is
+# copied into the overlay only if an item is removed from it
+class OverlayList:
+
+    def __init__(self, base):
+        self.base = base
+        self.base_copied = False
+        self.added = []
+
+    def append(self, item):
+        self.added.append(item)
+
+    def extend(self, items):
+        self.added.extend(items)
+
+    def remove(self, item):
+        if item not in self.base:
+            self.added.remove(item)
+            return
+        if not self.base_copied:
+            self.base = self.base[:]
+            self.base_copied = True
+        self.base.remove(item)
+
+    def index(self, item):
+        if item in self.base:
+            return self.base.index(item)
+        return len(self.base)+self.added.index(item)
+
+    def count(self, item):
+        return self.base.count(item)+self.added.count(item)
+
+    def __iter__(self):
+        for item in self.base:
+            yield item
+        for item in self.added:
+            yield item
+
+    def __len__(self):
+        return len(self.base)+len(self.added)
+
+    def __contains__(self, item):
+        return item in self.added or item in self.base
+
+    # slices come back as plain lists
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("list index out of range")
+        if idx < len(self.base):
+            return self.base[idx]
+        return self.added[idx-len(self.base)]
+
+    def __getslice__(self, i, j):
+        return self[max(0, i):max(0, j):]
+
+    def materialize(self):
+        return self.base+self.added
+
+
+# agent attributes a game writes to, which a SessionView layers over its base agent's
+session_overlay_attributes = ['word_counts', 'predicate_active', 'words_to_predicates', 'predicates_to_words',
+                              'predicate_to_classifier_map', 'classifier_to_predicate_map',
+                              'classifier_data_modified']
+
+
+# one game's agent over a base agent shared by every session; new words, predicates, and labels are kept in
+# overlays on the view, copying nothing of the base until the game writes it, so the base is never changed and
+# many sessions can play over one loaded agent; the view keeps its own io, objects, log, and result caches
+class SessionView(IspyAgent):
+
+    def __init__(self, base):
+        self.base = base
+        self.io = None
+        self.object_IDs = None
+        self.log_fn = None
+        self.speculate = base.speculate
+        self.service_ns = base.service_ns
+        self.words = OverlayList(base.words)
+        self.predicates = OverlayList(base.predicates)
+        for name in session_overlay_attributes:
+            setattr(self, name, OverlayDict(getattr(base, name)))
+        self.predicate_examples = OverlayDict(base.predicate_examples, nested=True)
+        self.init_result_cache()
+
+    # anything the session doesn't hold itself is read from the base agent
+    def __getattr__(self, name):
+        if name == 'base' or name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    # a plain agent holding the base's state with this session's writes applied, sharing the base's unwritten
+    # structures, so it should be pickled rather than played on
+    def standalone(self):
+        a = IspyAgent(None, None, None)
+        d = self.base.__dict__.copy()
+        d.update(self.__dict__)
+        del d['base']
+        for k in transient_agent_attributes:
+            d.pop(k, None)
+        for k in d:
+            if isinstance(d[k], OverlayDict) or isinstance(d[k], OverlayList):
+                d[k] = d[k].materialize()
+        a.__dict__.update(d)
+        return a
@@ -5,12 +5,24 @@ import os
 import sys
 import time
 import math
+import socket
+import threading
+import Queue
+import pickle
 import rospy
+from cStringIO import StringIO
+from std_msgs.msg import Header
+from sensor_msgs import point_cloud2
+from file_watch import *
+from socket_channel import *
 from segbot_arm_perception.srv import *
 from segbot_arm_manipulation.srv import *
 import roslib
-roslib.load_manifest('sound_play')
-from sound_play.libsoundplay import SoundClient
+try:
+    roslib.load_manifest('sound_play')
+    from sound_play.libsoundplay import SoundClient
+except ImportError:
+    SoundClient = None
 
 
 def append_to_file(s, fn):
@@ -22,6 +34,340 @@ vowels = ['a', 'e', 'i', 'o', 'u']
 secs_per_vowel = 0.3
 speech_sec_buffer = 1
 
+# how far a freshly detected table may drift from a cached scene before the cached scene is thrown out
+scene_plane_coef_tolerance = 0.02
+scene_point_count_tolerance = 0.15  # as a fraction of each cached cluster's point count
+scene_centroid_tolerance = 0.03  # in meters, between a cached cluster's centroid and the cluster detected there
+
+
+# estimate how long TTS takes to speak s when the sound client can't tell us
+def estimate_speech_secs(s):
+    return int(secs_per_vowel*len([v for v in s if v in vowels]) + 0.5 + speech_sec_buffer)
+
+
+# stand-in for sound_play's SoundClient when no sound_play node is available; records and prints utterances
+# and takes the estimated speaking time to 'speak' them
+class LocalSoundClient:
+    def __init__(self, secs_per_estimated_sec=1.0):
+        self.secs_per_estimated_sec = secs_per_estimated_sec
+        self.spoken = []
+
+    def say(self, s, voice=None):
+        self.spoken.append(s)
+        print "LOCAL TTS ("+str(voice)+"): "+s
+        time.sleep(estimate_speech_secs(s)*self.secs_per_estimated_sec)
+
+    def stopAll(self):
+        pass
+
+
+# build the best available sound client; returns the client and whether its say() blocks until speech ends
+def make_sound_client():
+    if SoundClient is None:
+        print "sound_play unavailable; using local stand-in for TTS"
+        return LocalSoundClient(), True
+    try:
+        return SoundClient(blocking=True), True
+    except TypeError:  # older sound_play clients can't report when an utterance has finished
+        return SoundClient(), False
+
+
+# speak utterances in order on a background thread so that the caller can keep computing and moving the
+# arm while the robot talks; callers synchronize with wait_until_done only when they need the user's reply
+class SpeechQueue:
+    def __init__(self, sound_client, blocking):
+        self.sound_client = sound_client
+        self.blocking = blocking
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.idle = threading.Event()
+        self.idle.set()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # queue s to be spoken and return immediately
+    def say(self, s, voice):
+        self.lock.acquire()
+        self.pending += 1
+        self.idle.clear()
+        self.lock.release()
+        self.queue.put((s, voice))
+
+    # block until every queued utterance has finished being spoken
+    def wait_until_done(self):
+        self.idle.wait()
+
+    def run(self):
+        while True:
+            s, voice = self.queue.get()
+            try:
+                # the robot has always said each utterance twice, whether or not the client blocks; a client
+                # that returns at once is given the estimated speaking time instead
+                self.sound_client.say(s, voice=voice)
+                self.sound_client.say(s, voice=voice)
+                if not self.blocking:
+                    time.sleep(estimate_speech_secs(s))
+            except Exception, e:
+                print "TTS failed: "+str(e)
+            self.lock.acquire()
+            self.pending -= 1
+            if self.pending == 0:
+                self.idle.set()
+            self.lock.release()
+
+
+# the eventual outcome of an arm or perception request running on an ActuationWorker
+class ActuationFuture:
+    def __init__(self):
+        self.finished = threading.Event()
+        self.value = None
+        self.error = None
+
+    def done(self):
+        return self.finished.is_set()
+
+    # block until the request finishes (up to timeout seconds, if given) and return its outcome
+    def result(self, timeout=None):
+        self.finished.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+# run arm and perception requests one at a time on a background thread, in the order submitted, so the
+# agent can talk and score predicates while the arm moves; the arm can only do one thing at a time anyway
+class ActuationWorker:
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # queue fn(*args) and return an ActuationFuture for its result
+    def submit(self, fn, *args):
+        future = ActuationFuture()
+        self.queue.put((future, fn, args))
+        return future
+
+    # block until every submitted request has finished
+    def wait_until_done(self):
+        self.queue.join()
+
+    def run(self):
+        while True:
+            future, fn, args = self.queue.get()
+            try:
+                future.value = fn(*args)
+            except Exception, e:
+                future.error = e
+            future.finished.set()
+            self.queue.task_done()
+
+
+# a service request whose serialized bytes were computed once up front; the tabletop plane and object clouds
+# sent with every touch and detect request never change during a game, so there's no reason to pack them again
+def preserialize_request(req):
+    buff = StringIO()
+    req.serialize(buff)
+    payload = buff.getvalue()
+    cls = preserialized_request_classes.get(req.__class__)
+    if cls is None:
+        cls = type('Preserialized'+req.__class__.__name__, (req.__class__,),
+                   {'serialize': lambda self, b: b.write(self.payload)})
+        preserialized_request_classes[req.__class__] = cls
+    r = cls()
+    r.payload = payload
+    return r
+
+preserialized_request_classes = {}
+
+
+# the tabletop perception and arm services used by IORobot; once the scene is set, touch and detect requests
+# are pre-serialized and sent over persistent connections
+class RobotServices:
+    def __init__(self):
+        self.touch_requests = {}  # indexed by touch index
+        self.detect_request = None
+        self.proxies = {}  # indexed by service name
+
+    # get the table plane, its coefficients, and the object clusters ordered left to right
+    def get_scene(self):
+        cloud_plane, cloud_plane_coef, _ = self.detect()
+
+        # re-index clusters so order matches left-to-right indexing expected
+        ordered_cloud_clusters = self.reorder_client("x", True)
+
+        return cloud_plane, cloud_plane_coef, ordered_cloud_clusters
+
+    # get the table plane, its coefficients, and the object clusters in arbitrary order
+    def detect(self):
+
+        # query to get the blobs on the table
+        req = TabletopPerceptionRequest()
+        rospy.wait_for_service('tabletop_object_detection_service')
+        try:
+            tabletop_object_detection_service = rospy.ServiceProxy(
+                'tabletop_object_detection_service', TabletopPerception)
+            res = tabletop_object_detection_service(req)
+
+            if len(res.cloud_clusters) == 0:
+                sys.exit("ERROR: no objects detected")
+
+            return res.cloud_plane, res.cloud_plane_coef, res.cloud_clusters
+        except rospy.ServiceException, e:
+            sys.exit("Service call failed: %s " % e)
+
+    # reorder PointCloud2 objects returned in arbitrary order from table detection
+    def reorder_client(self, coord, forward):
+        req = TabletopReorderRequest()
+        req.coord = coord
+        req.forward = forward
+        rospy.wait_for_service('tabletop_object_reorder_service')
+        try:
+            reorder = rospy.ServiceProxy('tabletop_object_reorder_service', TabletopReorder)
+            res = reorder(req)
+            return res.ordered_cloud_clusters
+        except rospy.ServiceException, e:
+            sys.exit("Service call failed: %s " % e)
+
+    # pre-serialize a touch request for every object (and for retracting, at -1) and the detect request
+    def set_scene(self, cloud_plane, cloud_plane_coef, objects):
+        self.touch_requests = {}
+        for idx in range(-1, len(objects)):
+            req = iSpyTouchRequest()
+            req.cloud_plane = cloud_plane
+            req.cloud_plane_coef = cloud_plane_coef
+            req.objects = objects
+            req.touch_index = idx
+            self.touch_requests[idx] = preserialize_request(req)
+        req = iSpyDetectTouchRequest()
+        req.cloud_plane = cloud_plane
+        req.cloud_plane_coef = cloud_plane_coef
+        req.objects = objects
+        self.detect_request = preserialize_request(req)
+
+    def call(self, name, srv_class, req):
+        if name not in self.proxies:
+            rospy.wait_for_service(name)
+            self.proxies[name] = rospy.ServiceProxy(name, srv_class, persistent=True)
+        try:
+            return self.proxies[name](req)
+        except rospy.ServiceException, e:
+            self.proxies[name].close()
+            del self.proxies[name]  # reconnect on the next call
+            print "Service call failed: %s" % e
+            return None
+
+    # use the arm to touch an object
+    def touch(self, idx):
+        res = self.call('ispy/touch_object_service', iSpyTouch, self.touch_requests[idx])
+        return res.success if res is not None else None
+
+    # detect a touch above an object
+    def detect_touch(self):
+        res = self.call('ispy/human_detect_touch_object_service', iSpyDetectTouch, self.detect_request)
+        return res.detected_touch_index if res is not None else None
+
+
+# stand-in PointCloud2 cluster of num_points points all at centroid, which is all the scene cache looks at
+def local_cloud(num_points, centroid):
+    return point_cloud2.create_cloud_xyz32(Header(), [centroid for _ in range(0, num_points)])
+
+
+# stand-in for RobotServices when no robot is attached, selected with the local_robot io type; reports a table
+# with the given plane coefficients and clusters of the given point counts at the given centroids (left to
+# right, 20cm apart by default), detected in reverse order the way the tabletop service may return them; takes
+# touch_secs to 'touch' each object, and answers touch detection from the scripted touches, then from stdin
+class LocalRobotServices:
+    def __init__(self, num_objects, touch_secs=1.0, touches=None, plane_coef=None, point_counts=None,
+                 centroids=None):
+        self.num_objects = num_objects
+        self.touch_secs = touch_secs
+        self.touches = touches if touches is not None else []
+        self.plane_coef = plane_coef if plane_coef is not None else [0, 0, 1, 0]
+        self.point_counts = point_counts if point_counts is not None else [1000 for _ in range(0, num_objects)]
+        self.centroids = centroids if centroids is not None else [[0.2*idx, 0.5, 0.1] for idx in range(0, num_objects)]
+        self.touched = []
+        self.num_detections = 0
+
+    def get_scene(self):
+        cloud_plane, cloud_plane_coef, objects = self.detect()
+        return cloud_plane, cloud_plane_coef, objects[::-1]
+
+    def detect(self):
+        self.num_detections += 1
+        objects = [local_cloud(self.point_counts[idx], self.centroids[idx]) for idx in range(0, self.num_objects)]
+        return local_cloud(100, [0, 0, 0]), self.plane_coef[:], objects[::-1]
+
+    def set_scene(self, cloud_plane, cloud_plane_coef, objects):
+        pass
+
+    def touch(self, idx):
+        self.touched.append(idx)
+        print "LOCAL ARM: touching "+str(idx)
+        time.sleep(self.touch_secs)
+        return True
+
+    def detect_touch(self):
+        if len(self.touches) > 0:
+            return self.touches.pop(0)
+        print "LOCAL ARM: enter the index of the touched object:"
+        return int(raw_input())
+
+
+def cloud_num_points(cloud):
+    return cloud.width*cloud.height
+
+
+# mean position of the points of a cloud
+def cloud_centroid(cloud):
+    c = [0.0, 0.0, 0.0]
+    n = 0
+    for p in point_cloud2.read_points(cloud, field_names=('x', 'y', 'z'), skip_nans=True):
+        for i in range(0, 3):
+            c[i] += p[i]
+        n += 1
+    return [v / n for v in c] if n > 0 else c
+
+
+# the tabletop scene IORobot last validated with the operator, with the object_IDs laid out on it
+def make_scene_cache(object_IDs, cloud_plane, cloud_plane_coef, objects):
+    return {'object_IDs': list(object_IDs),
+            'cloud_plane': cloud_plane,
+            'cloud_plane_coef': list(cloud_plane_coef),
+            'objects': objects,
+            'point_counts': [cloud_num_points(o) for o in objects],
+            'centroids': [cloud_centroid(o) for o in objects]}
+
+
+# whether a fresh, unordered detection looks like the same table and objects as a cached scene: same object
+# layout, same number of clusters, a plane within tolerance, and for each cached cluster, in order, a distinct
+# fresh cluster at the same place whose size is within tolerance of it
+def scene_matches(scene, object_IDs, cloud_plane_coef, objects):
+    if 'centroids' not in scene:  # cached before clusters were located
+        return False
+    if scene['object_IDs'] != list(object_IDs) or len(objects) != len(scene['objects']):
+        return False
+    if len(cloud_plane_coef) != len(scene['cloud_plane_coef']):
+        return False
+    for a, b in zip(cloud_plane_coef, scene['cloud_plane_coef']):
+        if abs(a-b) > scene_plane_coef_tolerance:
+            return False
+    centroids = [cloud_centroid(o) for o in objects]
+    unmatched = range(0, len(objects))
+    for idx in range(0, len(scene['objects'])):
+        dists = [math.sqrt(sum([(a-b)**2 for a, b in zip(centroids[j], scene['centroids'][idx])]))
+                 for j in unmatched]
+        nearest = unmatched[dists.index(min(dists))]
+        m = scene['point_counts'][idx]
+        if min(dists) > scene_centroid_tolerance or abs(cloud_num_points(objects[nearest])-m) > \
+                scene_point_count_tolerance*m:
+            return False
+        unmatched.remove(nearest)
+    return True
+
 
 class IOStd:
     def __init__(self, trans_fn):
@@ -49,29 +395,23 @@ class IOStd:
 
 
 class IOFile:
-    def __init__(self, get_fn, guess_fn, say_fn, point_fn, trans_fn):
+    def __init__(self, get_fn, guess_fn, say_fn, point_fn, trans_fn, timeout=60*60, watcher=None):
         self.get_fn = get_fn
         self.guess_fn = guess_fn
         self.say_fn = say_fn
         self.point_fn = point_fn
         self.trans_fn = trans_fn
+        self.timeout = timeout
+
+        # watch the communications directory so replies are picked up as soon as they are written
+        self.watchers = {}
+        if watcher is not None:
+            self.watchers[os.path.dirname(get_fn)] = watcher
 
     def get(self):
 
-        # spin until input get exists, then read
-        print "waiting for "+self.get_fn
-        t = 60*60
-        while not os.path.isfile(self.get_fn):
-            time.sleep(1)
-            t -= 1
-            if t == 0:
-                print "... FATAL: timed out waiting for "+self.get_fn
-                sys.exit()
-        f = open(self.get_fn, 'r')
-        c = f.read()
-        f.close()
-        os.system("rm -f "+self.get_fn)
-        print "...returning contents of "+self.get_fn+" : '"+str(c)+"'"
+        # block until input get exists, then read
+        c = self.wait_and_consume(self.get_fn)
 
         # log gotten get
         append_to_file("get:"+str(c)+"\n", self.trans_fn)
@@ -83,20 +423,8 @@ class IOFile:
         if block_until_prompted:
             _ = self.get()
 
-        # spin until guess exists, then read
-        print "waiting for "+self.guess_fn
-        t = 60*60
-        while not os.path.isfile(self.guess_fn):
-            time.sleep(1)
-            t -= 1
-            if t == 0:
-                print "... FATAL: timed out waiting for "+self.guess_fn
-                sys.exit()
-        f = open(self.guess_fn, 'r')
-        idx = f.read()
-        f.close()
-        os.system("rm -f "+self.guess_fn)
-        print "...returning contents of "+self.guess_fn+" : '"+str(idx)+"'"
+        # block until guess exists, then read
+        idx = self.wait_and_consume(self.guess_fn)
 
         # log gotten guess
         append_to_file("guess:"+str(idx)+"\n", self.trans_fn)
@@ -107,40 +435,144 @@ class IOFile:
         f = open(self.say_fn, 'a')
         f.write(s+"\n")
         f.close()
-        os.system("chmod 777 "+self.say_fn)
+        os.chmod(self.say_fn, 0777)
         append_to_file("say:"+s+"\n", self.trans_fn)
 
     def point(self, idx):
         f = open(self.point_fn, 'w')
         f.write(str(idx))
         f.close()
-        os.system("chmod 777 "+self.point_fn)
+        os.chmod(self.point_fn, 0777)
         append_to_file("point:"+str(idx)+"\n", self.trans_fn)
 
+    # wait on filesystem notifications for fn to be written, then read and unlink it
+    def wait_and_consume(self, fn):
+        print "waiting for "+fn
+        d = os.path.dirname(fn)
+        if d not in self.watchers:
+            self.watchers[d] = DirectoryWatcher(d if len(d) > 0 else '.')
+        if not self.watchers[d].wait_for(fn, self.timeout):
+            print "... FATAL: timed out waiting for "+fn
+            sys.exit()
+        c = consume_file(fn)
+        print "...returning contents of "+fn+" : '"+str(c)+"'"
+        return c
+
+
+class IOSocket:
+    def __init__(self, address, session_id, trans_fn, timeout=60*60):
+        self.address = address
+        self.session_id = session_id
+        self.trans_fn = trans_fn
+        self.timeout = timeout
+        self.pending = {'get': [], 'guess': []}  # input that arrived while waiting for the other kind
+
+        # connect to the ispy server's session channel and claim this session
+        family, addr = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(addr)
+        send_message(self.sock, {'type': 'hello', 'id': session_id})
+
+    def get(self):
+
+        # block until input get arrives
+        c = self.wait_for_input('get')
+
+        # log gotten get
+        append_to_file("get:"+str(c)+"\n", self.trans_fn)
+
+        return c
+
+    def get_guess(self, block_until_prompted=False):
+
+        if block_until_prompted:
+            _ = self.get()
+
+        # block until guess arrives
+        idx = self.wait_for_input('guess')
+
+        # log gotten guess
+        append_to_file("guess:"+str(idx)+"\n", self.trans_fn)
+
+        return int(idx)
+
+    def say(self, s):
+        send_message(self.sock, {'type': 'say', 'data': s})
+        append_to_file("say:"+s+"\n", self.trans_fn)
+
+    def point(self, idx):
+        send_message(self.sock, {'type': 'point', 'data': idx})
+        append_to_file("point:"+str(idx)+"\n", self.trans_fn)
+
+    def wait_for_input(self, t):
+        print "waiting for "+t+" on "+self.address
+        self.sock.settimeout(self.timeout)
+        while len(self.pending[t]) == 0:
+            try:
+                msg = recv_message(self.sock)
+            except socket.timeout:
+                print "... FATAL: timed out waiting for "+t
+                sys.exit()
+            if msg is None:
+                print "... FATAL: session channel closed while waiting for "+t
+                sys.exit()
+            if msg.get('type') in self.pending:
+                self.pending[msg['type']].append(to_str(msg['data']))
+        c = self.pending[t].pop(0)
+        print "...returning "+t+" : '"+str(c)+"'"
+        return c
+
 
 class IORobot:
 
-    def __init__(self, get_fn, trans_fn, object_IDs):
+    def __init__(self, get_fn, trans_fn, object_IDs, sound_client=None, robot_services=None, scene_cache_fn=None):
         self.get_fn = get_fn
         self.trans_fn = trans_fn
         self.object_IDs = object_IDs
         self.last_say = None
-
-        # get the point cloud objects on the table for pointing / recognizing touches
-        tries = 10
-        while tries > 0:
-            self.pointCloud2_plane, self.cloud_plane_coef, self.pointCloud2_objects = self.get_pointCloud2_objects()
-            if len(self.pointCloud2_objects) == len(self.object_IDs):
-                break
-            tries -= 1
-        if tries == 0:
-            sys.exit("ERROR: "+str(len(self.pointCloud2_objects))+" PointCloud2 objects detected " +
-                     "while "+str(len(self.object_IDs))+" objects were expected")
-
-        # initialize a sound client instance for TTS
-        self.sound_client = SoundClient()
+        self.services = robot_services if robot_services is not None else RobotServices()
+        self.actuation = ActuationWorker()
+
+        # get the point cloud objects on the table for pointing / recognizing touches, reusing the last
+        # validated scene if a single detection shows the table hasn't changed since; objects of about the same
+        # size that traded places look unchanged to detection, so the operator confirms their order
+        scene = self.load_cached_scene(scene_cache_fn)
+        if scene is not None:
+            op_resp = None
+            while op_resp != "Y" and op_resp != "N":
+                print "tabletop matches the scene cached in "+scene_cache_fn+"; objects still in the same order?[Y/N]:"
+                op_resp = raw_input()
+            if op_resp == "N":
+                scene = None
+        if scene is not None:
+            print "... reusing cached tabletop scene from "+scene_cache_fn
+            self.pointCloud2_plane = scene['cloud_plane']
+            self.cloud_plane_coef = scene['cloud_plane_coef']
+            self.pointCloud2_objects = scene['objects']
+        else:
+            tries = 10
+            while tries > 0:
+                self.pointCloud2_plane, self.cloud_plane_coef, self.pointCloud2_objects = self.services.get_scene()
+                if len(self.pointCloud2_objects) == len(self.object_IDs):
+                    break
+                tries -= 1
+            if tries == 0:
+                sys.exit("ERROR: "+str(len(self.pointCloud2_objects))+" PointCloud2 objects detected " +
+                         "while "+str(len(self.object_IDs))+" objects were expected")
+        self.services.set_scene(self.pointCloud2_plane, self.cloud_plane_coef, self.pointCloud2_objects)
+
+        # initialize a sound client instance for TTS, speaking through a queue so speech overlaps other work
+        if sound_client is None:
+            self.sound_client, blocking = make_sound_client()
+        else:
+            self.sound_client, blocking = sound_client, True
         rospy.sleep(1)
         self.sound_client.stopAll()
+        self.speech = SpeechQueue(self.sound_client, blocking)
+
+        # the cached scene was already checked by the operator
+        if scene is not None:
+            return
 
         # have operator interaction to confirm ordering of objects is correct, terminate if it isn't
         op_resp = None
@@ -151,9 +583,9 @@ class IORobot:
                 print "touching objects from left-most to right-most... please watch and confirm detection and order"
                 for i in range(0, len(object_IDs)):
                     print "... touching object in position "+str(i)
-                    self.point(i, log=False)
+                    self.point(i, log=False).result()
                     rospy.sleep(2)
-                    self.point(-1, log=False)
+                    self.point(-1, log=False).result()
                     rospy.sleep(2)
                 op_resp = None
                 while op_resp != "Y" and op_resp != "N":
@@ -177,11 +609,43 @@ class IORobot:
                     print "...touching at detected position "+str(t_idx)
                     self.point(t_idx, log=False)
                 op_resp = None
-            self.point(-1, log=False)
+            self.point(-1, log=False).result()
+
+        if scene_cache_fn is not None:
+            self.save_scene(scene_cache_fn)
+
+    # load the scene cached at fn if a quick detection agrees with it; returns None otherwise
+    def load_cached_scene(self, fn):
+        if fn is None or not os.path.isfile(fn):
+            return None
+        try:
+            f = open(fn, 'rb')
+            scene = pickle.load(f)
+            f.close()
+        except Exception, e:  # a torn or foreign pickle can fail in many ways, all meaning 'detect it again'
+            print "... ignoring unreadable tabletop scene cache "+fn+": "+str(e)
+            return None
+        _, cloud_plane_coef, objects = self.services.detect()
+        if not scene_matches(scene, self.object_IDs, cloud_plane_coef, objects):
+            print "... tabletop has changed since the scene was cached; detecting it again"
+            return None
+        return scene
+
+    # write the current scene to fn, through a temporary file so a crash can't leave a partial cache behind
+    def save_scene(self, fn):
+        f = open(fn+".tmp", 'wb')
+        pickle.dump(make_scene_cache(self.object_IDs, self.pointCloud2_plane, self.cloud_plane_coef,
+                                     self.pointCloud2_objects), f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(fn+".tmp", fn)
 
     # for now, default to IOFile behavior, but might eventually do ASR instead
     def get(self, log=True, repeat_timeout=None):
 
+        # the user replies to what the robot said and pointed at, so let queued speech and gestures finish first
+        self.speech.wait_until_done()
+        self.actuation.wait_until_done()
+
         # spin until input get exists, then read
         print "waiting for "+self.get_fn
         t = 0
@@ -226,7 +690,8 @@ class IORobot:
         if block_until_prompted:
             _ = self.get(repeat_timeout=20)
             self.say("Okay, go on")
-        idx = self.detect_touch_client()
+        self.speech.wait_until_done()
+        idx = self.detect_touch_client().result()
         if log:
             append_to_file("guess:"+str(idx)+"\n", self.trans_fn)
         return int(idx)
@@ -242,76 +707,19 @@ class IORobot:
         if log:
             append_to_file("say:"+str(s)+"\n", self.trans_fn)
 
-        self.sound_client.say(str(s), voice=voice)
-        self.sound_client.say(str(s), voice=voice)
-        rospy.sleep(int(secs_per_vowel*len([v for v in s if v in vowels]) + 0.5 + speech_sec_buffer))
+        self.speech.say(str(s), voice)
         print "SYSTEM: "+s
 
-    # point using the robot arm
+    # point using the robot arm; returns immediately with an ActuationFuture for the touch's success
     def point(self, idx, log=True):
         if log:
             append_to_file("point:"+str(idx)+"\n", self.trans_fn)
-        self.touch_client(idx)
-
-    # get PointCloud2 objects from service
-    def get_pointCloud2_objects(self):
-
-        # query to get the blobs on the table
-        req = TabletopPerceptionRequest()
-        rospy.wait_for_service('tabletop_object_detection_service')
-        try:
-            tabletop_object_detection_service = rospy.ServiceProxy(
-                'tabletop_object_detection_service', TabletopPerception)
-            res = tabletop_object_detection_service(req)
+        return self.touch_client(idx)
 
-            if len(res.cloud_clusters) == 0:
-                sys.exit("ERROR: no objects detected")
-
-            # re-index clusters so order matches left-to-right indexing expected
-            ordered_cloud_clusters = self.reorder_client("x", True)
-
-            return res.cloud_plane, res.cloud_plane_coef, ordered_cloud_clusters
-        except rospy.ServiceException, e:
-            sys.exit("Service call failed: %s " % e)
-
-    # reorder PointCloud2 objects returned in arbitrary order from table detection
-    def reorder_client(self, coord, forward):
-        req = TabletopReorderRequest()
-        req.coord = coord
-        req.forward = forward
-        rospy.wait_for_service('tabletop_object_reorder_service')
-        try:
-            reorder = rospy.ServiceProxy('tabletop_object_reorder_service', TabletopReorder)
-            res = reorder(req)
-            return res.ordered_cloud_clusters
-        except rospy.ServiceException, e:
-            sys.exit("Service call failed: %s " % e)
-
-    # use the arm to touch an object
+    # use the arm to touch an object, after any gestures already queued
     def touch_client(self, idx):
-        req = iSpyTouchRequest()
-        req.cloud_plane = self.pointCloud2_plane
-        req.cloud_plane_coef = self.cloud_plane_coef
-        req.objects = self.pointCloud2_objects
-        req.touch_index = idx
-        rospy.wait_for_service('ispy/touch_object_service')
-        try:
-            touch = rospy.ServiceProxy('ispy/touch_object_service', iSpyTouch)
-            res = touch(req)
-            return res.success
-        except rospy.ServiceException, e:
-            print "Service call failed: %s" % e
+        return self.actuation.submit(self.services.touch, idx)
 
-    # detect a touch above an object
+    # detect a touch above an object once the arm has finished any queued gestures
     def detect_touch_client(self):
-        req = iSpyDetectTouchRequest()
-        req.cloud_plane = self.pointCloud2_plane
-        req.cloud_plane_coef = self.cloud_plane_coef
-        req.objects = self.pointCloud2_objects
-        rospy.wait_for_service('ispy/human_detect_touch_object_service')
-        try:
-            detect_touch = rospy.ServiceProxy('ispy/human_detect_touch_object_service', iSpyDetectTouch)
-            res = detect_touch(req)
-            return res.detected_touch_index
-        except rospy.ServiceException, e:
-            print "Service call failed: %s" % e
+        return self.actuation.submit(self.services.detect_touch)
@@ -4,11 +4,18 @@ __author__ = 'jesse'
 import sys
 import pickle
 import os
-import math
 import operator
+import numpy
 
+# rows of the similarity matrix computed at once, bounding memory at this many rows of every classifier
+similarity_chunk_rows = 256
 
-# python analyze_predicates.py [out_dir] [agent pickle] [classifier config] [classifier conf]
+# number of most similar predicates kept for each predicate unless all pairs are asked for
+default_top_k = 10
+
+
+# python analyze_predicates.py [out_dir] [agent pickle] [classifier config] [classifier conf] [top_k=10|all]
+# only the pairs among each predicate's top_k most similar predicates are written, or every pair with 'all'
 def main():
 
     # read command-line args
@@ -16,6 +23,9 @@ def main():
     agent_fn = sys.argv[2]
     config_fn = sys.argv[3]
     conf_fn = sys.argv[4]
+    top_k = default_top_k
+    if len(sys.argv) > 5:
+        top_k = None if sys.argv[5] == "all" else int(sys.argv[5])
 
     # read in pickled agent
     f = open(agent_fn, 'rb')
@@ -39,60 +49,75 @@ def main():
         for p_idx in range(1, len(p)):
             context_feature_sizes[behaviors[-1]][modalities[p_idx-1]] = int(p[p_idx])
 
-    # read in context confidences
+    # read in context confidences as one classifier by (behavior, modality) context matrix
     f = open(conf_fn, 'r')
     lines = f.readlines()
     f.close()
-    context_confidences = {}  # indexed first by classifier id, then behavior, then modality
-    pred_confidences = {}  # indexed by classifier id, valued at sum of all kappa
-    for line in lines:
-        p = line.split(',')
-        context_confidences[int(p[0])] = {}
-        pred_confidences[int(p[0])] = 0
-        p_idx = 1
-        for b in behaviors:
-            context_confidences[int(p[0])][b] = {}
-            for m in modalities:
-                context_confidences[int(p[0])][b][m] = float(p[p_idx])
-                pred_confidences[int(p[0])] += float(p[p_idx])
-                p_idx += 1
-        pred_confidences[int(p[0])] = len(a.predicate_examples[a.classifier_to_predicate_map[int(p[0])]])
+    classifier_ids = [int(line.split(',')[0]) for line in lines]
+    context_confidences = numpy.array([[float(v) for v in line.split(',')[1:len(behaviors)*len(modalities)+1]]
+                                       for line in lines]).reshape((len(lines), len(behaviors)*len(modalities)))
+    classifier_rows = {}  # indexed by classifier id, valued at its row of context_confidences
+    pred_confidences = {}  # indexed by classifier id, valued at number of objects with examples
+    for r in range(0, len(classifier_ids)):
+        c = classifier_ids[r]
+        classifier_rows[c] = r
+        pred_confidences[c] = len(a.predicate_examples[a.classifier_to_predicate_map[c]])
 
     # save predicates and their context matrices to file
     f = open(os.path.join(out_dir, 'pred_conf_matrices.txt'), 'w')
     for c, v in sorted(pred_confidences.items(), key=operator.itemgetter(1), reverse=True):
+        row = context_confidences[classifier_rows[c]]
         f.write(str(c) + ":" + a.classifier_to_predicate_map[c] + '\t' + str(v) + '\n')
-        f.write(matrix_str(context_confidences[c], context_feature_sizes) + '\n')
+        f.write(matrix_str({behaviors[b_idx]: {modalities[m_idx]: row[b_idx*len(modalities)+m_idx]
+                                               for m_idx in range(0, len(modalities))}
+                            for b_idx in range(0, len(behaviors))}, context_feature_sizes) + '\n')
     f.close()
 
     # calculate cosine distance between predicates in the kappa classifier space
-    norm = {}  # indexed by classifier id
-    cos_sim = {}  # indexed by (classifier id, classifier id)
-    for aidx in context_confidences:
-        if aidx not in norm:
-            norm[aidx] = calc_norm([context_confidences[aidx][b][m] for b in behaviors for m in modalities])
-        if norm[aidx] == 0:
-            continue
-        for bidx in context_confidences:
-            if aidx == bidx or (bidx, aidx) in cos_sim:
-                continue
-            if bidx not in norm:
-                norm[bidx] = calc_norm([context_confidences[bidx][b][m] for b in behaviors for m in modalities])
-            if norm[bidx] == 0:
-                continue
-            cos_sim[(aidx, bidx)] = sum([context_confidences[aidx][b][m]*context_confidences[bidx][b][m]
-                                        for b in behaviors for m in modalities]) / (norm[aidx]*norm[bidx])
+    firsts, seconds, sims = cosine_similarity_pairs(context_confidences, top_k)
 
     # save distances to file
     f = open(os.path.join(out_dir, 'pred_cos_distances.txt'), 'w')
-    for k, v in sorted(cos_sim.items(), key=operator.itemgetter(1), reverse=True):
-        f.write(','.join([a.classifier_to_predicate_map[k[0]], a.classifier_to_predicate_map[k[1]], str(v)])+'\n')
+    for idx in range(0, len(sims)):
+        f.write(','.join([a.classifier_to_predicate_map[classifier_ids[firsts[idx]]],
+                          a.classifier_to_predicate_map[classifier_ids[seconds[idx]]], str(float(sims[idx]))])+'\n')
     f.close()
 
 
-# take in a list of numbers and return the 2 norm
-def calc_norm(l):
-    return math.sqrt(sum([math.pow(l[idx], 2) for idx in range(0, len(l))]))
+# cosine similarity of pairs of rows of x, as arrays of the lower row, the higher row, and their similarity,
+# ordered from most to least similar; rows with a zero norm are left out, and only pairs where one row is among
+# the other's top_k most similar are kept, or every pair if top_k is None; similarities are computed a chunk of
+# rows at a time from the row-normalized matrix, and only the kept pairs are sorted
+def cosine_similarity_pairs(x, top_k=default_top_k):
+    norms = numpy.sqrt((x ** 2).sum(axis=1))
+    rows = numpy.nonzero(norms > 0)[0]
+    xn = x[rows] / norms[rows][:, numpy.newaxis]
+    k = len(rows)-1 if top_k is None else min(top_k, len(rows)-1)
+    firsts = []
+    seconds = []
+    sims_kept = []
+    for start in range(0, len(rows) if k > 0 else 0, similarity_chunk_rows):
+        sims = numpy.dot(xn[start:start+similarity_chunk_rows], xn.T)
+        chunk = numpy.arange(0, sims.shape[0])
+        sims[chunk, start+chunk] = -numpy.inf  # a row isn't its own neighbor
+        if top_k is None:
+            i, j = numpy.nonzero(numpy.arange(0, len(rows))[numpy.newaxis, :] > (start+chunk)[:, numpy.newaxis])
+        else:
+            i = numpy.repeat(chunk, k)
+            j = numpy.argpartition(-sims, k-1, axis=1)[:, :k].ravel()
+        firsts.append(numpy.minimum(start+i, j))
+        seconds.append(numpy.maximum(start+i, j))
+        sims_kept.append(sims[i, j])
+    if len(firsts) == 0:
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int), numpy.zeros(0)
+    first = numpy.concatenate(firsts)
+    second = numpy.concatenate(seconds)
+    sim = numpy.concatenate(sims_kept)
+    if top_k is not None:  # pairs found from both of their rows are kept once
+        _, unique_idxs = numpy.unique(first*len(rows)+second, return_index=True)
+        first, second, sim = first[unique_idxs], second[unique_idxs], sim[unique_idxs]
+    order = numpy.argsort(-sim, kind='mergesort')
+    return rows[first[order]], rows[second[order]], sim[order]
 
 # take in a data map and produce a string representation
 def matrix_str(d, fs):
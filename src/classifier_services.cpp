@@ -1,13 +1,17 @@
 #include "perception_classifiers/getFreeClassifierID.h"
 #include "perception_classifiers/loadClassifiers.h"
 #include "perception_classifiers/runClassifier.h"
+#include "perception_classifiers/runClassifierBatch.h"
 #include "perception_classifiers/trainClassifier.h"
 #include "perception_classifiers/FetchFeatures.h"
+#include "perception_classifiers/classifierSlot.h"
+#include "perception_classifiers/getClassifierFingerprint.h"
 
 #include <opencv2/core/core.hpp>
 #include <opencv2/ml/ml.hpp>
 
 #include <boost/lexical_cast.hpp>
+#include <boost/shared_ptr.hpp>
 
 #include <ros/ros.h>
 #include <ros/package.h>
@@ -41,14 +45,24 @@ bool deleteClassifiers(std_srvs::Empty::Request &,
 bool runClassifier(perception_classifiers::runClassifier::Request &req,
 				   perception_classifiers::runClassifier::Response &res);
 
+bool runClassifierBatch(perception_classifiers::runClassifierBatch::Request &req,
+						perception_classifiers::runClassifierBatch::Response &res);
+
 bool trainClassifier(perception_classifiers::trainClassifier::Request &req,
 				     perception_classifiers::trainClassifier::Response &res);
 
+bool classifierSlot(perception_classifiers::classifierSlot::Request &req,
+				    perception_classifiers::classifierSlot::Response &res);
+
+bool getClassifierFingerprint(perception_classifiers::getClassifierFingerprint::Request &req,
+							  perception_classifiers::getClassifierFingerprint::Response &res);
+
 // filepath data
 string condition;
 string config_fn;
 string class_fn;
 string conf_fn;
+string fingerprint_fn;
 
 // variables related to feature space, to be read in from configuration file
 int max_classifier_ID;
@@ -57,9 +71,12 @@ int num_behaviors;
 int num_modalities;
 vector< vector<int> > num_features;
 
-// variables related to classifiers
-map<int, vector< vector<CvSVM*> > > classifiers;
+// variables related to classifiers; sub-classifiers are reference counted so that slots cloned from one
+// another share them until one of the slots retrains that classifier
+typedef boost::shared_ptr<CvSVM> svm_ptr;
+map<int, vector< vector<svm_ptr> > > classifiers;
 map<int, vector< vector<float> > > confidences;
+map<int, string> fingerprints;  // caller-supplied fingerprints of the training sets classifiers were trained on
 
 // services we will call
 ros::ServiceClient fetch_features;
@@ -69,15 +86,30 @@ struct cache_response
 {
 	int result;
 	float confidence;
-	vector<float>* sub_classifier_decisions;
+	vector<float> sub_classifier_decisions;
 };
-map<int, map<int, cache_response*> > run_classifier_cache;
+typedef boost::shared_ptr<cache_response> cache_ptr;
+map<int, map<int, cache_ptr> > run_classifier_cache;
+
+// named sets of classifiers held in memory; the active slot lives in the globals above, while the others
+// are parked here, each with its own IDs and run cache
+struct classifier_slot
+{
+	int max_classifier_ID;
+	vector<int> classifier_IDs;
+	map<int, vector< vector<svm_ptr> > > classifiers;
+	map<int, vector< vector<float> > > confidences;
+	map<int, string> fingerprints;
+	map<int, map<int, cache_ptr> > run_classifier_cache;
+};
+map<string, classifier_slot> slots;
+string active_slot = "default";
 
 // calculate kappa statistic
 float kappa(int cm[2][2])
 {
-	double sr[2];
-    double sc[2];
+	double sr[2] = {0.0, 0.0};
+    double sc[2] = {0.0, 0.0};
     double sw = 0.0;
     for (int i = 0; i < 2; i++)
     {
@@ -108,61 +140,72 @@ float kappa(int cm[2][2])
 
 void freeClassifierCache(int cid)
 {
-	for (map<int, cache_response*>::iterator oiter = run_classifier_cache[cid].begin();
-	 oiter != run_classifier_cache[cid].end(); ++oiter)
-	{
-		if (run_classifier_cache[cid][oiter->first] != NULL)
-		{
-			delete run_classifier_cache[cid][oiter->first]->sub_classifier_decisions;
-			delete run_classifier_cache[cid][oiter->first];
-			run_classifier_cache[cid][oiter->first] = NULL;
-		}
-	}
+	run_classifier_cache.erase(cid);
 }
 
+// release the active slot's classifiers; sub-classifiers still used by parked slots stay in memory
 void freeClassifierMemory()
 {
-	// delete classifiers from memory
-	for (map<int, vector< vector<CvSVM*> > >::iterator iter = classifiers.begin();
-		 iter != classifiers.end(); ++iter)
-	{
-		for (int b_idx=0; b_idx < num_behaviors; b_idx++)
-		{
-			for (int m_idx=0; m_idx < num_modalities; m_idx++)
-			{
-				if (classifiers[iter->first][b_idx][m_idx] != NULL)
-				{
-					delete classifiers[iter->first][b_idx][m_idx];
-				}
-			}
-		}
-	}
+	classifiers.clear();
+	confidences.clear();
+	fingerprints.clear();
+	run_classifier_cache.clear();
+}
 
-	// delete run classifier cache
-	for (map<int, map<int, cache_response*> >::iterator citer = run_classifier_cache.begin();
-		 citer != run_classifier_cache.end(); ++citer)
-	{
-		freeClassifierCache(citer->first);
-	}
+// move the active slot's classifiers out of the globals and park them under its name
+void parkActiveSlot()
+{
+	classifier_slot& s = slots[active_slot];
+	s.max_classifier_ID = max_classifier_ID;
+	s.classifier_IDs.swap(classifier_IDs);
+	s.classifiers.swap(classifiers);
+	s.confidences.swap(confidences);
+	s.fingerprints.swap(fingerprints);
+	s.run_classifier_cache.swap(run_classifier_cache);
+}
+
+// make a parked slot the active one; the active slot must have been parked first
+void activateSlot(const string& name)
+{
+	classifier_slot& s = slots[name];
+	max_classifier_ID = s.max_classifier_ID;
+	classifier_IDs.swap(s.classifier_IDs);
+	classifiers.swap(s.classifiers);
+	confidences.swap(s.confidences);
+	fingerprints.swap(s.fingerprints);
+	run_classifier_cache.swap(s.run_classifier_cache);
+	slots.erase(name);
+	active_slot = name;
 }
 
 void customShutdown(int sig)
 {
 	ROS_INFO("caught sigint, freeing memory and starting shutdown sequence...");
 	freeClassifierMemory();
+	slots.clear();
 	ros::shutdown();
 }
 
 // initialize node and offer services
 int main(int argc, char **argv)
 {
+	// ros::init strips remapping arguments, so read our own arguments after it
+	// usage: classifier_services [condition] [classifier_dir=<package>/<condition>_classifiers/]
+	ros::init(argc, argv, "classifier_services");
+  	ros::NodeHandle n;
+
 	string condition = argv[1];
 	config_fn = ros::package::getPath("perception_classifiers") + "/" + condition +".config";
-	class_fn = ros::package::getPath("perception_classifiers") + "/" + condition +"_classifiers/";
+	if (argc > 2)
+	{
+		class_fn = argv[2];
+		if (class_fn[class_fn.length()-1] != '/')
+			class_fn += "/";
+	}
+	else
+		class_fn = ros::package::getPath("perception_classifiers") + "/" + condition +"_classifiers/";
 	conf_fn = class_fn + "confidences.csv";
-
-	ros::init(argc, argv, "classifier_services");
-  	ros::NodeHandle n;
+	fingerprint_fn = class_fn + "fingerprints.csv";
 
   	// set shutdown procedure call
   	signal(SIGINT, customShutdown);
@@ -173,7 +216,11 @@ int main(int argc, char **argv)
 	ros::ServiceServer save_classifiers = n.advertiseService("save_classifiers", saveClassifiers);
 	ros::ServiceServer delete_classifiers = n.advertiseService("delete_classifiers", deleteClassifiers);
 	ros::ServiceServer run_classifier = n.advertiseService("run_classifier", runClassifier);
+	ros::ServiceServer run_classifier_batch = n.advertiseService("run_classifier_batch", runClassifierBatch);
 	ros::ServiceServer train_classifier = n.advertiseService("train_classifier", trainClassifier);
+	ros::ServiceServer classifier_slot = n.advertiseService("classifier_slot", classifierSlot);
+	ros::ServiceServer get_classifier_fingerprint = n.advertiseService("get_classifier_fingerprint",
+																	   getClassifierFingerprint);
 
 	// connect to helper services
 	fetch_features = n.serviceClient<perception_classifiers::FetchFeatures>("fetch_feature_service");
@@ -282,10 +329,10 @@ bool loadClassifiers(perception_classifiers::loadClassifiers::Request &req,
 	for (int idx=0; idx < classifier_IDs.size(); idx++)
 	{
 		//read classifier from file
-		vector< vector<CvSVM*> > sub_c;
+		vector< vector<svm_ptr> > sub_c;
 		for (int b_idx=0; b_idx < num_behaviors; b_idx++)
 		{
-			vector<CvSVM*> m_c;
+			vector<svm_ptr> m_c;
 			for (int m_idx=0; m_idx < num_modalities; m_idx++)
 			{
 				ostringstream fn;
@@ -295,11 +342,11 @@ bool loadClassifiers(perception_classifiers::loadClassifiers::Request &req,
 				if (num_features[b_idx][m_idx] == 0
 					|| stat (fn.str().c_str(), &buffer) != 0)
 				{
-					m_c.push_back(NULL);
+					m_c.push_back(svm_ptr());
 					continue;
 				}
 				cout << "...loaded in " << fn.str().c_str() << "\n";
-				CvSVM* c = new CvSVM;
+				svm_ptr c(new CvSVM);
 				c->load(fn.str().c_str());
 				m_c.push_back(c);
 			}
@@ -308,6 +355,19 @@ bool loadClassifiers(perception_classifiers::loadClassifiers::Request &req,
 		classifiers[classifier_IDs[idx]] = sub_c;
 	}
 
+	// read the fingerprints of the training sets the classifiers were trained on, if they were recorded
+	ifstream fingerprint_file(fingerprint_fn.c_str());
+	while (fingerprint_file)
+	{
+		string line;
+		if (!getline(fingerprint_file, line))
+			break;
+		size_t sep = line.find(',');
+		if (sep == string::npos)
+			continue;
+		fingerprints[atoi(line.substr(0, sep).c_str())] = line.substr(sep+1);
+	}
+
 	// debug
 	cout << "... loaded " << classifier_IDs.size() << " classifiers from file\n";
 
@@ -344,7 +404,7 @@ bool saveClassifiers(std_srvs::Empty::Request &,
 	ofstream conf_file;
 	conf_file.open(conf_fn.c_str());
 
-	for (map<int, vector< vector<CvSVM*> > >::iterator iter = classifiers.begin();
+	for (map<int, vector< vector<svm_ptr> > >::iterator iter = classifiers.begin();
 		 iter != classifiers.end(); ++iter)
 	{
 		conf_file << boost::lexical_cast<string>(iter->first);  // confidences headed by classifier ID
@@ -358,7 +418,7 @@ bool saveClassifiers(std_srvs::Empty::Request &,
 
 				if (num_features[b_idx][m_idx] == 0
 					|| confidences[iter->first][b_idx][m_idx] == 0
-					|| classifiers[iter->first][b_idx][m_idx] == NULL)
+					|| !classifiers[iter->first][b_idx][m_idx])
 					continue;
 
 				// write classifier out to file
@@ -373,6 +433,13 @@ bool saveClassifiers(std_srvs::Empty::Request &,
 
 	conf_file.close();
 
+	// write training set fingerprints out so an unchanged training set isn't retrained after loading
+	ofstream fingerprint_file;
+	fingerprint_file.open(fingerprint_fn.c_str());
+	for (map<int, string>::iterator iter = fingerprints.begin(); iter != fingerprints.end(); ++iter)
+		fingerprint_file << iter->first << ',' << iter->second << '\n';
+	fingerprint_file.close();
+
 	// debug
 	cout << "... saved classifiers and confidences to file\n";
 
@@ -386,7 +453,7 @@ bool deleteClassifiers(std_srvs::Empty::Request &,
 	// debug
 	cout << "deleteClassifiers called\n";
 
-	for (map<int, vector< vector<CvSVM*> > >::iterator iter = classifiers.begin();
+	for (map<int, vector< vector<svm_ptr> > >::iterator iter = classifiers.begin();
 		 iter != classifiers.end(); ++iter)
 	{
 		//delete all subclassifier files
@@ -395,7 +462,7 @@ bool deleteClassifiers(std_srvs::Empty::Request &,
 			for (int m_idx=0; m_idx < num_modalities; m_idx++)
 			{
 				if (num_features[b_idx][m_idx] == 0 ||
-					classifiers[iter->first][b_idx][m_idx] == NULL)
+					!classifiers[iter->first][b_idx][m_idx])
 					continue;
 				ostringstream fn;
 				fn << class_fn << "classifier" << iter->first
@@ -406,6 +473,7 @@ bool deleteClassifiers(std_srvs::Empty::Request &,
 
 		// delete classifier confidences file
 		remove(conf_fn.c_str());
+		remove(fingerprint_fn.c_str());
 	}
 
 	// delete any existing classifier pointers
@@ -420,66 +488,79 @@ bool deleteClassifiers(std_srvs::Empty::Request &,
 }
 
 // run a specified classifier on a vector of objects and report results and confidences
-bool runClassifier(perception_classifiers::runClassifier::Request &req,
-				     perception_classifiers::runClassifier::Response &res)
+// observations of one object, fetched from the feature service the first time each behavior, modality is needed
+// so that every classifier run on the object shares them
+struct object_features
 {
-	// debug
-	// cout << "classifier " << req.classifier_ID << " for object " << req.object_ID << " called\n";
+	int object_ID;
+	map<pair<int, int>, Mat> test_data;
+
+	object_features(int oid) : object_ID(oid) {}
 
-	// if in cache, just set response params and return
-	if (run_classifier_cache.count(req.classifier_ID) == 1 &&
-		run_classifier_cache[req.classifier_ID].count(req.object_ID) == 1 &&
-		run_classifier_cache[req.classifier_ID][req.object_ID] != NULL)
+	Mat& get(int b_idx, int m_idx)
 	{
-		res.result = run_classifier_cache[req.classifier_ID][req.object_ID]->result;
-		res.confidence = run_classifier_cache[req.classifier_ID][req.object_ID]->confidence;
-		res.sub_classifier_decisions = *(run_classifier_cache[req.classifier_ID][req.object_ID]->sub_classifier_decisions);
-		return true;
+		pair<int, int> key(b_idx, m_idx);
+		if (test_data.count(key) == 0)
+		{
+			// access feature-getting service and use it to populate rows of test matrix
+			Mat rows;
+			perception_classifiers::FetchFeatures ff;
+			ff.request.object = object_ID;
+			ff.request.behavior = b_idx;
+			ff.request.modality = m_idx;
+			ff.request.allow_missing = false;
+			fetch_features.call(ff);
+			for (int obs_idx=0; obs_idx < ff.response.rows.size(); obs_idx++)
+			{
+				Mat observation;
+				for (int f=0; f < num_features[b_idx][m_idx]; f++)
+					observation.push_back(ff.response.rows[obs_idx].features[f]);
+				transpose(observation, observation);
+				rows.push_back(observation);
+			}
+			test_data[key] = rows;
+		}
+		return test_data[key];
 	}
+};
+
+// run a classifier on an object, or return its cached response if it has been run on the object already
+cache_ptr runClassifierOn(int classifier_ID, object_features &features)
+{
+	int object_ID = features.object_ID;
+
+	// if in cache, just return it
+	if (run_classifier_cache.count(classifier_ID) == 1 &&
+		run_classifier_cache[classifier_ID].count(object_ID) == 1 &&
+		run_classifier_cache[classifier_ID][object_ID])
+		return run_classifier_cache[classifier_ID][object_ID];
 
 	// run classifier in each relevant behavior, modality combination 
 	float decision = 0;
 	int sub_classifiers_used = 0;
-	vector<float>* _dec = new vector<float>();
+	vector<float> _dec;
 	for (int b_idx=0; b_idx < num_behaviors; b_idx++)
 	{
 		for (int m_idx=0; m_idx < num_modalities; m_idx++)
 		{
-			if (num_features[b_idx][m_idx] == 0 || classifiers.count(req.classifier_ID) == 0
-				|| confidences[req.classifier_ID][b_idx][m_idx] == 0
-				|| classifiers[req.classifier_ID][b_idx][m_idx] == NULL)
+			if (num_features[b_idx][m_idx] == 0 || classifiers.count(classifier_ID) == 0
+				|| confidences[classifier_ID][b_idx][m_idx] == 0
+				|| !classifiers[classifier_ID][b_idx][m_idx])
 			{
-				_dec->push_back(0);
+				_dec.push_back(0);
 				continue;
 			}
 
 			sub_classifiers_used += 1;
 			float _decision = 0;
 			float num_positive = 0;
-			int observation_count = 1;
-
-			// access feature-getting service and use it to populate rows of test matrix
-			Mat test_data;
-			perception_classifiers::FetchFeatures ff;
-			ff.request.object = req.object_ID;
-			ff.request.behavior = b_idx;
-			ff.request.modality = m_idx;
-			ff.request.allow_missing = false;
-			fetch_features.call(ff);
-			observation_count = ff.response.rows.size();
-			for (int obs_idx=0; obs_idx < ff.response.rows.size(); obs_idx++)
-			{
-				Mat observation;
-				for (int f=0; f < num_features[b_idx][m_idx]; f++)
-					observation.push_back(ff.response.rows[obs_idx].features[f]);
-				transpose(observation, observation);
-				test_data.push_back(observation);
-			}
+			Mat &test_data = features.get(b_idx, m_idx);
+			int observation_count = test_data.rows;
 
 			// run classifier on each observation
-			for (int obs_idx=0; obs_idx < ff.response.rows.size(); obs_idx++)
+			for (int obs_idx=0; obs_idx < observation_count; obs_idx++)
 			{
-				int response = classifiers[req.classifier_ID][b_idx][m_idx]->predict(test_data.row(obs_idx));
+				int response = classifiers[classifier_ID][b_idx][m_idx]->predict(test_data.row(obs_idx));
 				if (response == 1)
 					num_positive += 1.0;
 			}
@@ -487,34 +568,72 @@ bool runClassifier(perception_classifiers::runClassifier::Request &req,
 			// average observation decisions to decide this sub classifier's decision
 			// could instead do majority voting
 			_decision = 2*(num_positive / observation_count) - 1;
-			_dec->push_back(_decision);
+			_dec.push_back(_decision);
 
 			// add to overall decision with confidence weight
-			decision += _decision * confidences[req.classifier_ID][b_idx][m_idx];
+			decision += _decision * confidences[classifier_ID][b_idx][m_idx];
 		}
 	}
 
 	//set return value based on decision score
+	cache_ptr res_cache(new cache_response());
 	if (decision > 0)
-		res.result = 1;
+		res_cache->result = 1;
 	else
-		res.result = -1;
+		res_cache->result = -1;
 	if (sub_classifiers_used > 0)
-		res.confidence = abs(decision / sub_classifiers_used);
+		res_cache->confidence = abs(decision / sub_classifiers_used);
 	else
-		res.confidence = 0;
-	res.sub_classifier_decisions = *_dec;
+		res_cache->confidence = 0;
+	res_cache->sub_classifier_decisions = _dec;
 
 	// add to cache
-	cache_response* res_cache = new cache_response();
-	res_cache->result = res.result;
-	res_cache->confidence = res.confidence;
-	res_cache->sub_classifier_decisions = _dec;
-	run_classifier_cache[req.classifier_ID][req.object_ID] = res_cache;
+	run_classifier_cache[classifier_ID][object_ID] = res_cache;
+
+	// debug
+	// cout << "classifier " << classifier_ID << " for object " << object_ID << ": " << res_cache->result << ", " << res_cache->confidence << "\n";
 
+	return res_cache;
+}
+
+bool runClassifier(perception_classifiers::runClassifier::Request &req,
+				     perception_classifiers::runClassifier::Response &res)
+{
 	// debug
-	// cout << "classifier " << req.classifier_ID << " for object " << req.object_ID << ": " << res.result << ", " << res.confidence << "\n";
+	// cout << "classifier " << req.classifier_ID << " for object " << req.object_ID << " called\n";
+
+	object_features features(req.object_ID);
+	cache_ptr r = runClassifierOn(req.classifier_ID, features);
+	res.result = r->result;
+	res.confidence = r->confidence;
+	res.sub_classifier_decisions = r->sub_classifier_decisions;
+	return true;
+}
 
+// run every given classifier on every given object in one call, fetching each object's features once for all
+// classifiers; responses are laid out classifier-major, with each object's sub classifier decisions consecutive
+bool runClassifierBatch(perception_classifiers::runClassifierBatch::Request &req,
+						perception_classifiers::runClassifierBatch::Response &res)
+{
+	int num_classifiers = static_cast<int>(req.classifier_IDs.size());
+	int num_objects = static_cast<int>(req.object_IDs.size());
+	int num_contexts = num_behaviors*num_modalities;
+	res.result.resize(num_classifiers*num_objects);
+	res.confidence.resize(num_classifiers*num_objects);
+	res.sub_classifier_decisions.resize(num_classifiers*num_objects*num_contexts);
+	for (int o_idx=0; o_idx < num_objects; o_idx++)
+	{
+		object_features features(req.object_IDs[o_idx]);
+		for (int c_idx=0; c_idx < num_classifiers; c_idx++)
+		{
+			cache_ptr r = runClassifierOn(req.classifier_IDs[c_idx], features);
+			int idx = c_idx*num_objects + o_idx;
+			res.result[idx] = r->result;
+			res.confidence[idx] = r->confidence;
+			for (int ctx_idx=0; ctx_idx < num_contexts; ctx_idx++)
+				res.sub_classifier_decisions[idx*num_contexts + ctx_idx] = r->sub_classifier_decisions[ctx_idx];
+		}
+	}
 	return true;
 }
 
@@ -547,12 +666,12 @@ bool trainClassifier(perception_classifiers::trainClassifier::Request &req,
     params.term_crit   = cvTermCriteria(CV_TERMCRIT_ITER, 100, 1e-6);
 
 	// for each behavior and modality, retrieve relevant features for each object and train sub-classifiers
-	vector< vector<CvSVM*> > sub_classifiers;
+	vector< vector<svm_ptr> > sub_classifiers;
 	vector< vector<float> > sub_confidence;
 	for (int b_idx=0; b_idx < num_behaviors; b_idx++)
 	{
 		cout << "...behavior " << b_idx << "\n"; // debug
-		vector<CvSVM*> modality_classifiers;
+		vector<svm_ptr> modality_classifiers;
 		vector<float> modality_confidence;
 		for (int m_idx=0; m_idx < num_modalities; m_idx++)
 		{
@@ -561,7 +680,7 @@ bool trainClassifier(perception_classifiers::trainClassifier::Request &req,
 			if (num_features[b_idx][m_idx] == 0)
 			{
 				cout << "......no features\n"; // debug
-				modality_classifiers.push_back(NULL);
+				modality_classifiers.push_back(svm_ptr());
 				modality_confidence.push_back(0);
 				continue;
 			}
@@ -663,7 +782,7 @@ bool trainClassifier(perception_classifiers::trainClassifier::Request &req,
 				}
 
 				// train classifier with all gathered data and store it
-				CvSVM* c = new CvSVM;
+				svm_ptr c(new CvSVM);
 				cout << "......training primary classifier\n";  // debug
 				c->train(train_data, responses, Mat(), Mat(), params);
 				modality_classifiers.push_back(c);
@@ -673,7 +792,7 @@ bool trainClassifier(perception_classifiers::trainClassifier::Request &req,
 			{
 				// store a null pointer to the classifier
 				cout << "......primary classifier cannot be trained on uniform class data\n";  // debug
-				modality_classifiers.push_back(NULL);
+				modality_classifiers.push_back(svm_ptr());
 			}
 
 			// calculate confidence and store it
@@ -698,7 +817,82 @@ bool trainClassifier(perception_classifiers::trainClassifier::Request &req,
 	}
 	classifiers[classifier_ID] = sub_classifiers;
 	confidences[classifier_ID] = sub_confidence;
+	fingerprints[classifier_ID] = req.fingerprint;
 
 	res.success = true;
 	return true;
 }
+
+// create, clone, switch to, or drop a named classifier slot, or with operation "active" just report the active
+// slot; clones share sub-classifiers and cached results with their source until either retrains a classifier,
+// so switching between model sets never touches disk
+bool classifierSlot(perception_classifiers::classifierSlot::Request &req,
+				    perception_classifiers::classifierSlot::Response &res)
+{
+	// debug
+	cout << "classifierSlot called to " << req.operation << " slot '" << req.slot << "'\n";
+
+	res.success = false;
+	bool exists = (req.slot == active_slot || slots.count(req.slot) == 1);
+	if (req.operation == "create" && !exists)
+	{
+		classifier_slot s;
+		s.max_classifier_ID = 0;
+		slots[req.slot] = s;
+		res.success = true;
+	}
+	else if (req.operation == "clone" && !exists)
+	{
+		string source = req.source.length() > 0 ? req.source : active_slot;
+		if (source == active_slot)
+		{
+			classifier_slot s;
+			s.max_classifier_ID = max_classifier_ID;
+			s.classifier_IDs = classifier_IDs;
+			s.classifiers = classifiers;
+			s.confidences = confidences;
+			s.fingerprints = fingerprints;
+			s.run_classifier_cache = run_classifier_cache;
+			slots[req.slot] = s;
+			res.success = true;
+		}
+		else if (slots.count(source) == 1)
+		{
+			classifier_slot s = slots[source];
+			slots[req.slot] = s;
+			res.success = true;
+		}
+	}
+	else if (req.operation == "switch" && exists)
+	{
+		if (req.slot != active_slot)
+		{
+			parkActiveSlot();
+			activateSlot(req.slot);
+		}
+		res.success = true;
+	}
+	else if (req.operation == "drop" && exists && req.slot != active_slot)
+	{
+		slots.erase(req.slot);
+		res.success = true;
+	}
+	else if (req.operation == "active")
+		res.success = true;
+
+	if (!res.success)
+		cout << "... could not " << req.operation << " slot '" << req.slot << "'\n";
+	res.active_slot = active_slot;
+	return true;
+}
+
+// report the fingerprint of the training set a classifier was last trained on, or an empty string if unknown
+bool getClassifierFingerprint(perception_classifiers::getClassifierFingerprint::Request &req,
+							  perception_classifiers::getClassifierFingerprint::Response &res)
+{
+	if (fingerprints.count(req.classifier_ID) == 1 && classifiers.count(req.classifier_ID) == 1)
+		res.fingerprint = fingerprints[req.classifier_ID];
+	else
+		res.fingerprint = "";
+	return true;
+}
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+__author__ = 'jesse'
+
+import numpy
+import metrics
+
+
+# (objects x predicates x behaviors x modalities) view of an (objects x predicates x contexts) tensor of
+# sub-classifier decisions as get_sub_classifier_tensor returns them
+def split_contexts(t, num_behaviors, num_modalities):
+    return t.reshape((t.shape[0], t.shape[1], num_behaviors, num_modalities))
+
+
+# (predicates x behaviors x modalities) confidence table from a map like read_confidences returns; predicates
+# without confidences get 0 everywhere, so they never decide positive
+def confidence_tensor(conf, preds, num_behaviors, num_modalities):
+    c = numpy.zeros((len(preds), num_behaviors, num_modalities))
+    for p_idx in range(0, len(preds)):
+        if preds[p_idx] in conf:
+            c[p_idx] = conf[preds[p_idx]]
+    return c
+
+
+# (predicates x objects) numbers of positive and negative labels agent a holds for each predicate and object
+def label_counts(a, preds, oidxs):
+    pos = numpy.zeros((len(preds), len(oidxs)), dtype=int)
+    neg = numpy.zeros((len(preds), len(oidxs)), dtype=int)
+    for p_idx in range(0, len(preds)):
+        examples = a.predicate_examples[preds[p_idx]]
+        for o_idx in range(0, len(oidxs)):
+            if oidxs[o_idx] in examples:
+                pos[p_idx, o_idx], neg[p_idx, o_idx] = metrics.count_labels(examples[oidxs[o_idx]])
+    return pos, neg
+
+
+# aggregate decisions of sub-classifier tensor t weighted by confidence table conf, as (objects x predicates),
+# or as (objects x predicates x behaviors) if per_behavior; mask broadcasts against conf, e.g. a (behaviors x
+# modalities) boolean array dropping contexts from an ablation, and masked-out contexts contribute nothing
+def decisions(t, conf, mask=None, per_behavior=False):
+    w = conf if mask is None else conf * mask
+    if per_behavior:
+        return numpy.einsum('opbm,pbm->opb', t, w)
+    return numpy.einsum('opbm,pbm->op', t, w)
+
+
+# confusion matrices of aggregate decisions dec from decisions() against label counts pos and neg from
+# label_counts(), as (predicates [x behaviors] x 2 x 2); 0 confidence is assigned a False label
+def decision_confusion_matrices(dec, pos, neg):
+    d = numpy.rollaxis(dec > 0, 0, dec.ndim)
+    if d.ndim == 3:
+        pos = pos[:, numpy.newaxis, :]
+        neg = neg[:, numpy.newaxis, :]
+    return metrics.confusion_matrices(pos, neg, d)
+
+
+# save a sub-classifier tensor along with the object idxs and predicates its axes follow
+def save_tensor(fn, t, oidxs, preds):
+    f = open(fn, 'wb')
+    numpy.savez(f, t=t, oidxs=numpy.array(oidxs), preds=numpy.array(preds))
+    f.close()
+
+
+# load a tensor saved with save_tensor as t, oidxs, preds
+def load_tensor(fn):
+    f = open(fn, 'rb')
+    d = numpy.load(f)
+    t, oidxs, preds = d['t'], d['oidxs'].tolist(), d['preds'].tolist()
+    f.close()
+    return t, oidxs, preds
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+__author__ = 'jesse'
+
+import os
+import time
+import heapq
+import threading
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# inotify event flags for a file that has finished being written or was moved into place
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+inotify_event_header = struct.Struct('iIII')
+
+# interval used to check for files when inotify is unavailable on this platform
+fallback_poll_secs = 0.05
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    libc.inotify_init
+    libc.inotify_add_watch
+except (OSError, AttributeError):
+    libc = None
+
+
+# remove a file in-process, ignoring a file that is already gone
+def unlink_quietly(fn):
+    try:
+        os.remove(fn)
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+# read a file's contents and remove it
+def consume_file(fn):
+    f = open(fn, 'r')
+    c = f.read()
+    f.close()
+    unlink_quietly(fn)
+    return c
+
+
+# watch a single directory for files that are closed after writing or moved into it
+class DirectoryWatcher:
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        if libc is not None:
+            fd = libc.inotify_init()
+            if fd >= 0:
+                if libc.inotify_add_watch(fd, path, IN_CLOSE_WRITE | IN_MOVED_TO) >= 0:
+                    self.fd = fd
+                else:
+                    os.close(fd)
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    # block up to timeout seconds (forever if None) for write events; returns the list of base
+    # filenames seen, or None if this platform can't tell us which files changed
+    def read_names(self, timeout=None):
+        if self.fd is None:
+            time.sleep(fallback_poll_secs if timeout is None else min(timeout, fallback_poll_secs))
+            return None
+        try:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+        except select.error, e:
+            if e[0] == errno.EINTR:
+                return []
+            raise
+        if len(ready) == 0:
+            return []
+        return self.read_available_names()
+
+    # drain pending inotify events without blocking
+    def read_available_names(self):
+        buff = os.read(self.fd, 4096)
+        names = []
+        offset = 0
+        while offset + inotify_event_header.size <= len(buff):
+            _, _, _, name_len = inotify_event_header.unpack_from(buff, offset)
+            offset += inotify_event_header.size
+            names.append(buff[offset:offset+name_len].rstrip('\0'))
+            offset += name_len
+        return names
+
+    # block until fn exists in the watched directory; returns False if timeout seconds pass first
+    def wait_for(self, fn, timeout):
+        name = os.path.basename(fn)
+        deadline = time.time() + timeout
+        while not os.path.isfile(fn):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            names = self.read_names(remaining)
+            if names is not None and name in names:
+                break
+        return True
+
+
+# a single blocked request for a file managed by a FileMonitor
+class FileWaiter:
+
+    def __init__(self, name, ready, deadline):
+        self.name = name
+        self.ready = ready
+        self.deadline = deadline
+        self.done = False
+        self.lock = threading.Lock()
+        self.lock.acquire()
+
+
+# watch a directory from one background thread and wake any number of threads blocked on files in it;
+# blocked threads sit on a lock rather than a sleep loop, and timeouts are enforced by the monitor thread,
+# so idle waiters cost no CPU
+class FileMonitor:
+
+    def __init__(self, path):
+        self.path = path
+        self.watcher = DirectoryWatcher(path)
+        self.lock = threading.Lock()
+        self.waiters = {}  # indexed by base filename, valued at lists of FileWaiters
+        self.deadlines = []  # heap of (deadline, FileWaiter)
+        self.wake_r, self.wake_w = os.pipe()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # block until fn exists (or ready() is true, if given); returns False if timeout seconds pass first
+    def wait_for(self, fn, timeout, ready=None):
+        if ready is None:
+            ready = lambda: os.path.isfile(fn)
+        w = FileWaiter(os.path.basename(fn), ready, time.time() + timeout)
+        self.lock.acquire()
+        self.waiters.setdefault(w.name, []).append(w)
+        heapq.heappush(self.deadlines, (w.deadline, w))
+        self.lock.release()
+        os.write(self.wake_w, 'w')  # have the monitor thread pick up the new deadline
+        if ready():
+            self.lock.acquire()
+            self.finish(w)
+            self.lock.release()
+        w.lock.acquire()
+        return ready()
+
+    # wake waiters on name whose conditions are now met without needing a filesystem event
+    def notify(self, name):
+        self.lock.acquire()
+        for w in self.waiters.get(name, [])[:]:
+            if w.ready():
+                self.finish(w)
+        self.lock.release()
+
+    # release a waiter; must be called with self.lock held
+    def finish(self, w):
+        if w.done:
+            return
+        w.done = True
+        self.waiters[w.name].remove(w)
+        if len(self.waiters[w.name]) == 0:
+            del self.waiters[w.name]
+        w.lock.release()
+
+    def run(self):
+        while True:
+            self.lock.acquire()
+            while len(self.deadlines) > 0 and self.deadlines[0][1].done:
+                heapq.heappop(self.deadlines)
+            timeout = max(0, self.deadlines[0][0] - time.time()) if len(self.deadlines) > 0 else None
+            self.lock.release()
+
+            fds = [self.wake_r]
+            if self.watcher.fileno() is not None:
+                fds.append(self.watcher.fileno())
+            elif len(self.waiters) > 0:
+                timeout = fallback_poll_secs if timeout is None else min(timeout, fallback_poll_secs)
+            try:
+                ready_fds, _, _ = select.select(fds, [], [], timeout)
+            except select.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+            if self.wake_r in ready_fds:
+                os.read(self.wake_r, 4096)
+            names = None
+            if self.watcher.fileno() is not None:
+                names = self.watcher.read_available_names() if self.watcher.fileno() in ready_fds else []
+
+            self.lock.acquire()
+            candidates = self.waiters.keys() if names is None else [n for n in set(names) if n in self.waiters]
+            for name in candidates:
+                for w in self.waiters.get(name, [])[:]:
+                    if w.ready():
+                        self.finish(w)
+            now = time.time()
+            while len(self.deadlines) > 0 and self.deadlines[0][0] <= now:
+                _, w = heapq.heappop(self.deadlines)
+                self.finish(w)
+            self.lock.release()
@@ -10,13 +10,37 @@ from perception_classifiers.srv import *
 
 
 # rosrun perception_classifiers ispy.py
-#   [object_IDs] [num_rounds] [user_id] [iotype=std|file|robot] [agent_to_load] [condition]
+#   [object_IDs] [num_rounds] [user_id] [iotype=std|file|socket|robot|local_robot] [agent_to_load] [condition]
 # start a game of ispy with user_id or with the keyboard/screen
 # if user_id provided, agents are pickled so that an aggregator can later extract
 # all examples across users for retraining classifiers and performing splits/merges
 # is user_id not provided, classifiers are retrained and saved after each game with just single-user data
 def main():
 
+    path_to_ispy, stopwords_fn, pp, cp, path_to_logs = get_paths()
+
+    object_IDs = [int(oid) for oid in sys.argv[1].split(',')]
+    num_rounds = int(sys.argv[2])
+    user_id = None if sys.argv[3] == "None" else sys.argv[3]
+    io_type = sys.argv[4]
+    if io_type not in ["std", "file", "socket", "robot", "local_robot"]:
+        sys.exit("Unrecognized 'iotype'; options std|file|socket|robot|local_robot")
+    agent_fn = None if sys.argv[5] == "None" else sys.argv[5]
+    cond = None if sys.argv[6] == "None" else sys.argv[6]
+
+    unique_name, log_fn = start_transcript(path_to_logs, cond, user_id, object_IDs, num_rounds, agent_fn)
+
+    print "calling ROSpy init"
+    node_name = 'ispy' if user_id is None else 'ispy' + str(user_id)
+    rospy.init_node(node_name)
+
+    A = load_agent(pp, agent_fn, object_IDs, stopwords_fn, log_fn)
+    io = make_io(A, io_type, cp, user_id, object_IDs, log_fn)
+    play_game(A, io, io_type, num_rounds, pp, unique_name)
+
+
+# locate the package's directories, creating those the web front end shares with agents if necessary
+def get_paths():
     path_to_perception_classifiers = rospkg.RosPack().get_path('perception_classifiers')
     stopwords_fn = os.path.join(path_to_perception_classifiers, 'src', 'stopwords_en.txt')
     path_to_ispy = os.path.join(path_to_perception_classifiers, 'www/')
@@ -29,16 +53,11 @@ def main():
     if not os.path.isdir(cp):
         os.system("mkdir "+cp)
         os.system("chmod 777 "+cp)
+    return path_to_ispy, stopwords_fn, pp, cp, path_to_logs
 
-    object_IDs = [int(oid) for oid in sys.argv[1].split(',')]
-    num_rounds = int(sys.argv[2])
-    user_id = None if sys.argv[3] == "None" else sys.argv[3]
-    io_type = sys.argv[4]
-    if io_type != "std" and io_type != "file" and io_type != "robot":
-        sys.exit("Unrecognized 'iotype'; options std|file|robot")
-    agent_fn = None if sys.argv[5] == "None" else sys.argv[5]
-    cond = None if sys.argv[6] == "None" else sys.argv[6]
 
+# name the game and write the header of its transcript log
+def start_transcript(path_to_logs, cond, user_id, object_IDs, num_rounds, agent_fn):
     if cond is None:
         unique_name = str(user_id)+"_"+"-".join([str(oid) for oid in object_IDs])
     else:
@@ -49,11 +68,12 @@ def main():
     f.write("num_rounds:"+str(num_rounds)+"\n")
     f.write("agent_fn:"+str(agent_fn)+"\n")
     f.close()
+    return unique_name, log_fn
 
-    print "calling ROSpy init"
-    node_name = 'ispy' if user_id is None else 'ispy' + str(user_id)
-    rospy.init_node(node_name)
 
+# unpickle the requested agent and load its classifiers from the classifier_services node under service_ns,
+# or start a new agent from scratch
+def load_agent(pp, agent_fn, object_IDs, stopwords_fn, log_fn, service_ns=''):
     print "instantiating ispyAgent"
     if agent_fn is not None and os.path.isfile(os.path.join(pp, agent_fn)):
         print "... from file"
@@ -61,13 +81,19 @@ def main():
         A = pickle.load(f)
         A.object_IDs = object_IDs
         A.log_fn = log_fn
+        A.service_ns = service_ns
         f.close()
         print "... loading perceptual classifiers"
         A.load_classifiers()
     else:
         print "... from scratch"
         A = IspyAgent.IspyAgent(None, object_IDs, stopwords_fn, log_fn=log_fn)
+        A.service_ns = service_ns
+    return A
+
 
+# build the IO structure the game will be played through
+def make_io(A, io_type, cp, user_id, object_IDs, log_fn):
     io = None
     if io_type == "std":
         print "... with input from keyboard and output to screen"
@@ -78,15 +104,34 @@ def main():
                     os.path.join(cp, str(user_id)+".guess.in"),
                     os.path.join(cp, str(user_id)+".say.out"),
                     os.path.join(cp, str(user_id)+".point.out"),
-                    log_fn)
-    elif io_type == "robot":
+                    log_fn, timeout=rospy.get_param('~io_timeout', 60*60))
+    elif io_type == "socket":
+        print "... with input and output through the ispy server's session channel"
+        io = IOSocket(rospy.get_param('~channel_address', os.path.join(cp, "ispy.sock")), str(user_id), log_fn,
+                      timeout=rospy.get_param('~io_timeout', 60*60))
+    elif io_type == "robot" or io_type == "local_robot":
         print "... preemptively calling active predicates on objects to cache results"
         active_predicates = [p for p in A.predicates if A.predicate_active[p]]
         _ = A.get_classifier_results(A.predicates, A.object_IDs)
-        
-        print "... with input and output through embodied robot"
-        io = IORobot(os.path.join(cp, str(user_id))+".get.in", log_fn, object_IDs)
 
+        # local_robot plays the robot game against stand-ins for TTS, the arm, and tabletop perception
+        sound_client = None
+        robot_services = None
+        if io_type == "local_robot":
+            print "... with input and output through a local stand-in for the robot"
+            sound_client = LocalSoundClient()
+            robot_services = LocalRobotServices(len(object_IDs))
+        else:
+            print "... with input and output through embodied robot"
+        io = IORobot(os.path.join(cp, str(user_id))+".get.in", log_fn, object_IDs, sound_client=sound_client,
+                     robot_services=robot_services,
+                     scene_cache_fn=rospy.get_param('~scene_cache', os.path.join(cp, "tabletop_scene.pickle")))
+    return io
+
+
+# play num_rounds of the game through io, then pickle the agent so its examples can be aggregated later
+def play_game(A, io, io_type, num_rounds, pp, unique_name):
+    object_IDs = A.object_IDs
     A.io = io
 
     print "beginning game"
@@ -108,7 +153,7 @@ def main():
         r_utterance, r_predicates, num_guesses = A.robot_take_turn(idx_selection)
         
         # special case for 'robot' io; clear 'say' cache in case user asks for repeat
-        if io_type == "robot":
+        if io_type == "robot" or io_type == "local_robot":
             io.last_say = None
         
         # get labels after robot turn
@@ -117,14 +162,14 @@ def main():
             A.update_predicate_data(r_predicates[idx], [[object_IDs[idx_selection], labels[idx]]])
 
         # special case for 'robot' io; clear 'say' cache in case user asks for repeat
-        if io_type == "robot":
+        if io_type == "robot" or io_type == "local_robot":
             io.last_say = None
 
     A.io.say("Thanks for playing!")
     A.io = None  # don't want to pickle IO structures, which get re-instantiated through this script on agent load
 
     f = open(os.path.join(pp, unique_name+".agent"), 'wb')
-    pickle.dump(A, f)
+    pickle.dump(A.standalone(), f)
     f.close()
 
 
@@ -10,12 +10,17 @@ from perception_classifiers.srv import *
 
 
 # python ispyRetrain.py [experimental_cond=control/classifiers/clusters] [out_fn_prefix] [num_objects] [base_agent]
+#   [checkpoint_every=25]
+# progress is journaled to the pickles folder and classifiers are saved every checkpoint_every retrained, so
+# rerunning the same command after a crash merges the same agents from the previous directory and retrains only
+# the classifiers that hadn't been saved yet
 def main():
 
     experimental_cond = sys.argv[1]
     out_fn_prefix = sys.argv[2]
     num_objects = int(sys.argv[3])
     base_agent = None if sys.argv[4] == "None" else sys.argv[4]
+    checkpoint_every = int(sys.argv[5]) if len(sys.argv) > 5 else 25
 
     if experimental_cond != "control" and experimental_cond != "classifiers" and experimental_cond != "clusters":
         sys.exit("Unrecognized experimental condition")
@@ -34,45 +39,53 @@ def main():
     print "loading existing perceptual classifiers"
     A.load_classifiers()
 
-    found_agents = False
-    if base_agent is None:
-        prev_dir = str(time.time())+"_previous"
+    journal_fn = os.path.join(pp, out_fn_prefix+".local.retrain_journal")
+    journal = read_retrain_journal(journal_fn)
+    if journal is not None:
+        prev_dir = journal["prev_dir"]
+        print "resuming interrupted retraining; agents already merged are in '"+prev_dir+"'"
     else:
-        prev_dir = str(base_agent)+"_"+str(time.time())+"_previous"
+        if base_agent is None:
+            prev_dir = str(time.time())+"_previous"
+        else:
+            prev_dir = str(base_agent)+"_"+str(time.time())+"_previous"
+        journal = {"prev_dir": prev_dir, "merged": []}
+        append_retrain_journal(journal_fn, "prev_dir", prev_dir)
     if not os.path.isdir(os.path.join(pp, prev_dir)):
         os.system("mkdir "+os.path.join(pp, prev_dir))
 
     if base_agent is not None:
         print "loading and unifying base agent"
-        pfn = os.path.join(pp, base_agent)
-        f = open(pfn, 'rb')
-        B = pickle.load(f)
-        f.close()
+        B = load_and_retire_agent(pp, prev_dir, base_agent, journal_fn, journal)
         A.unify_with_agent(B)
-        os.system("mv "+pfn+" "+os.path.join(pp, prev_dir, base_agent))
     else:
         B = IspyAgent.IspyAgent(None, None, stopwords_fn)
 
+    # merge agents in the order they were first merged in, so a resumed run rebuilds the same agent
+    found_agents = False
+    for fn in journal["merged"][:]:
+        if fn != base_agent:
+            print "...loading and unifying previously merged agent '"+fn+"'"
+            user_agent = load_and_retire_agent(pp, prev_dir, fn, journal_fn, journal)
+            A.unify_with_agent(user_agent)
+            A.subtract_predicate_examples(B.predicate_examples)
+            found_agents = True
+
     print "tracing pickles folder to gather data from user agents"
     for root, dirs, files in os.walk(pp):
         if 'previous' not in root:
             for fn in files:
                 if 'local' not in fn.split('.') and (base_agent is None or fn[:len(out_fn_prefix)] == str(out_fn_prefix)):
-                    pfn = os.path.join(pp, fn)
-                    print "...loading and unifying agent '"+pfn+"'"
-                    f = open(pfn, 'rb')
-                    user_agent = pickle.load(f)
-                    f.close()
+                    print "...loading and unifying agent '"+os.path.join(pp, fn)+"'"
+                    user_agent = load_and_retire_agent(pp, prev_dir, fn, journal_fn, journal)
                     A.unify_with_agent(user_agent)
                     A.subtract_predicate_examples(B.predicate_examples)
-                    mv_cmd = "mv "+os.path.join(root, pfn)+" "+os.path.join(root, prev_dir, fn)
-                    os.system(mv_cmd)
                     found_agents = True
     if not found_agents:
         sys.exit("ERROR: found no previous agents against which to train")
 
     print "retraining classifiers from gathered data"
-    A.retrain_predicate_classifiers()
+    A.retrain_predicate_classifiers(checkpoint_every=checkpoint_every)
 
     if experimental_cond != "control":
         print "detecting synonymy and polysemy across and within attributes using "+str(experimental_cond)
@@ -88,6 +101,63 @@ def main():
     pickle.dump(A, f)
     f.close()
 
+    # the run is complete, so a rerun should start over rather than resume
+    os.remove(journal_fn)
+
+
+# read the journal of an interrupted retraining run: its previous directory and the agents it merged, in order;
+# None if there is no run to resume
+def read_retrain_journal(journal_fn):
+    if not os.path.isfile(journal_fn):
+        return None
+    journal = {"prev_dir": None, "merged": []}
+    f = open(journal_fn, 'r')
+    for line in f.readlines():
+        if not line.endswith('\n'):
+            continue  # the last line of a journal interrupted mid-write
+        parts = line.rstrip('\n').split(' ', 1)
+        if parts[0] == "prev_dir":
+            journal["prev_dir"] = parts[1]
+        elif parts[0] == "merged":
+            journal["merged"].append(parts[1])
+    f.close()
+    if journal["prev_dir"] is None:
+        return None
+    return journal
+
+
+# record one step of a retraining run, flushed to disk before the step's effects
+def append_retrain_journal(journal_fn, key, value):
+    if os.path.isfile(journal_fn):
+        f = open(journal_fn, 'r+')
+        contents = f.read()
+        if not contents.endswith('\n'):
+            f.truncate(contents.rfind('\n')+1)  # drop a line left incomplete by an interrupted write
+        f.close()
+    f = open(journal_fn, 'a')
+    f.write(key+" "+value+"\n")
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+
+# load agent pickle fn, journaling that it was merged and moving it into prev_dir; an agent merged by an
+# interrupted run is read from prev_dir, or from the pickles folder if the run stopped before moving it
+def load_and_retire_agent(pp, prev_dir, fn, journal_fn, journal):
+    pfn = os.path.join(pp, fn)
+    retired_fn = os.path.join(pp, prev_dir, fn)
+    if fn not in journal["merged"]:
+        append_retrain_journal(journal_fn, "merged", fn)
+        journal["merged"].append(fn)
+    if not os.path.isfile(pfn):
+        pfn = retired_fn
+    f = open(pfn, 'rb')
+    agent = pickle.load(f)
+    f.close()
+    if pfn != retired_fn:
+        os.system("mv "+pfn+" "+retired_fn)
+    return agent
+
 
 if __name__ == "__main__":
         main()
@@ -3,8 +3,11 @@ __author__ = 'jesse'
 
 import os
 import subprocess
-import time
+import threading
 import rospy
+from file_watch import *
+from session_host import SessionHost
+from socket_channel import ChannelServer
 from perception_classifiers.srv import *
 
 
@@ -18,21 +21,76 @@ class IspyServer:
         if not os.path.isdir(self.logs_folder):
             os.system("mkdir "+self.logs_folder+" ; chmod 777 "+self.logs_folder)
         self.package = "perception_classifiers"
-        self.script = "ispy.py"
+        self.worker_script = "ispyWorker.py"
 
         rospy.init_node('ispy_server')
         self.timeout = rospy.get_param('~timeout', 600.0)
+        self.say_timeout = rospy.get_param('~say_timeout', 120.0)
+        self.point_timeout = rospy.get_param('~point_timeout', 10.0)
         print "initialized node 'ispy_server'"
 
+        # a single monitor thread wakes handlers blocked on agent output; each waiting handler still holds its
+        # service thread, so ~max_waiting_handlers caps the number of concurrent waits, past which a request is
+        # answered with whatever output is ready rather than left to tie up another thread
+        self.communications = os.path.join(self.path_to_ispy, 'communications')
+        if not os.path.isdir(self.communications):
+            os.makedirs(self.communications)
+            os.chmod(self.communications, 0777)
+        self.monitor = FileMonitor(self.communications)
+        self.max_waiting_handlers = rospy.get_param('~max_waiting_handlers', 256)
+        self.waiting_handlers = 0
+        self.waiting_lock = threading.Lock()
+
+        # agents can talk over a framed socket instead of files; the web front end's input is routed to socket
+        # agents through the same channel, and written to files for file agents
+        self.agent_io = rospy.get_param('~agent_io', 'file')
+        if self.agent_io != "file" and self.agent_io != "socket":
+            rospy.logerr("unrecognized ~agent_io '"+str(self.agent_io)+"'; options file|socket")
+            self.agent_io = "file"
+        self.channel_address = rospy.get_param('~channel_address', os.path.join(self.communications, 'ispy.sock'))
+        self.channel = ChannelServer(self.channel_address, self.monitor,
+                                     buffer_unclaimed_input=self.agent_io == "socket")
+
         self.send_say_server = rospy.Service(
             'get_say', getSay, self.get_say)
 
         self.send_point_server = rospy.Service(
             'get_point', getPoint, self.get_point)
 
+        # keep warm workers per condition that have already loaded the condition's agent and classifiers,
+        # and bound the total number of agent processes, idle or in a session, that the server will run
+        self.conditions = ["control", "classifiers", "clusters"]
+        self.warm_workers_per_condition = rospy.get_param('~warm_workers_per_condition', 2)
+        self.max_processes = rospy.get_param('~max_processes', 64)
+        self.process_lock = threading.Lock()
+        self.processes = []  # workers assigned to sessions, as [process, log]
+        self.warm_workers = {cond: [] for cond in self.conditions}  # idle workers, as [process, log]
+        self.worker_serial = 0
+
+        # alternatively, play every session in threads of this process against one loaded agent per condition;
+        # ~classifier_namespaces maps each condition to its own classifier_services node, and without one node
+        # per condition the server falls back to worker processes
+        self.host = None
+        if rospy.get_param('~in_process_sessions', False):
+            host = SessionHost(self.monitor, max_sessions=rospy.get_param('~max_sessions', 512),
+                               channel_address=self.channel_address,
+                               service_namespaces=rospy.get_param('~classifier_namespaces', {}))
+            try:
+                host.preload(self.conditions)
+                self.host = host
+                self.warm_workers_per_condition = 0
+            except ValueError, e:
+                rospy.logerr("can't host sessions in process: "+str(e)+"; using worker processes instead")
+
+        self.process_lock.acquire()
+        for cond in self.conditions:
+            self._fill_warm_workers(cond)
+        self.process_lock.release()
+        rospy.on_shutdown(self._close_all_processes)
+        self.reap_timer = rospy.Timer(rospy.Duration(rospy.get_param('~reap_period', 5.0)), self.reap)
+
         self.start_dialog_server = rospy.Service(
             'start_dialog', startDialog, self.start_dialog)
-        self.processes = []
 
     def __exit__(self):
         self._close_all_processes()
@@ -47,72 +105,158 @@ class IspyServer:
 
     def get_say(self, req):
 
-        # spin on say file until it exists, then read
+        # block until the agent says something over the channel or in the say file, then read
         res = getSayResponse()
-        fn = os.path.join(self.path_to_ispy, 'communications', req.id+".say.out")
+        fn = os.path.join(self.communications, req.id+".say.out")
         print "waiting for "+fn
-        t = 120
-        while not os.path.isfile(fn):
-            time.sleep(1)
-            t -= 1
-            if t == 0:
-                print "...ERROR: timeout waiting for "+fn
-                return "ERROR: timeout"
-        f = open(fn, 'r')
-        res.s = f.read()
-        f.close()
-        os.system("rm "+fn)
+        if not self.wait_for_agent_output(fn, self.say_timeout,
+                                          lambda: self.channel.has_say(req.id) or os.path.isfile(fn)):
+            print "...ERROR: timeout waiting for "+fn
+            return "ERROR: timeout"
+        res.s = self.channel.take_say(req.id)
+        if res.s is None:
+            res.s = consume_file(fn)
         print "...returning contents of "+fn+" : '"+str(res.s)+"'"
 
         return res
 
     def get_point(self, req):
 
-        # check for and read point file, allowing up to 5 seconds for the write
+        # check for and read point file, allowing a short time for the write
         res = getPointResponse()
-        fn = os.path.join(self.path_to_ispy, 'communications', req.id+".point.out")
+        fn = os.path.join(self.communications, req.id+".point.out")
         print "checking for "+fn
-        t = 10
-        while not os.path.isfile(fn) and t > 0:
-            time.sleep(1)
-            t -= 1
-        if os.path.isfile(fn):
-            f = open(fn, 'r')
-            res.oidx = int(f.read())
-            f.close()
-            os.system("rm "+fn)
+        if self.wait_for_agent_output(fn, self.point_timeout,
+                                      lambda: self.channel.has_point(req.id) or os.path.isfile(fn)):
+            res.oidx = self.channel.take_point(req.id)
+            if res.oidx is None:
+                res.oidx = int(consume_file(fn))
             print "...returning contents of "+fn+" : '"+str(res.oidx)+"'"
         else:
             res.oidx = -2  # code for not changing behavior
 
         return res
 
+    # block the calling handler until ready() or timeout passes; this is a cap on concurrent waits, not a pool,
+    # so past max_waiting_handlers the handler checks ready() once and returns instead of waiting
+    def wait_for_agent_output(self, fn, timeout, ready):
+        self.waiting_lock.acquire()
+        if self.waiting_handlers >= self.max_waiting_handlers:
+            self.waiting_lock.release()
+            print "...ERROR: "+str(self.waiting_handlers)+" handlers already waiting; refusing to wait for "+fn
+            return ready()
+        self.waiting_handlers += 1
+        self.waiting_lock.release()
+        try:
+            return self.monitor.wait_for(fn, timeout, ready=ready)
+        finally:
+            self.waiting_lock.acquire()
+            self.waiting_handlers -= 1
+            self.waiting_lock.release()
+
     def start_dialog(self, req):
-        std_log = open(os.path.join(self.logs_folder, req.id + '.std.log'), 'w')
-        err_log = open(os.path.join(self.logs_folder, req.id + '.err.log'), 'w')
-        log = [std_log, err_log]
-        rospy.loginfo("  Logs at: " + self.logs_folder + '/' + req.id + "*.log")
-        args = [req.object_ids, "1",
-                "/u/jesse/catkin_ws/src/perception_classifiers/src/stopwords_en.txt",
-                req.id, "file"]
-        if req.exp_cond == "clusters":
-            args.append("clusters.local.agent")
-        elif req.exp_cond == "classifiers":
-            args.append("classifiers.local.agent")
+        if req.exp_cond == "clusters" or req.exp_cond == "classifiers":
+            cond = req.exp_cond
         else:
-            args.append("control.local.agent")
-        process = self.start_rosrun_process(self.package, self.script, args=args, log=log)
-        self.processes.append([process, log])
+            cond = "control"
+
+        if self.host is not None:
+            try:
+                if not self.host.start_session(req.id, [int(oid) for oid in req.object_ids.split(',')], 1, cond,
+                                               io_type=self.agent_io):
+                    rospy.logerr("refusing session '"+req.id+"'; already hosting "+str(self.host.max_sessions))
+            except ValueError, e:
+                rospy.logerr("refusing session '"+req.id+"': "+str(e))
+            return startDialogResponse()
+
+        self.process_lock.acquire()
+        self._reap_finished()
+
+        # hand the session to a warm worker, starting one cold only if none are waiting
+        if len(self.warm_workers[cond]) > 0:
+            worker = self.warm_workers[cond].pop(0)
+        elif self._num_processes() < self.max_processes:
+            rospy.logwarn("no warm worker for condition '"+cond+"'; starting one cold")
+            worker = self._start_worker(cond)
+        else:
+            self.process_lock.release()
+            rospy.logerr("refusing session '"+req.id+"'; already running "+str(self.max_processes)+" processes")
+            return startDialogResponse()
+        process, log = worker
+        process.stdin.write(" ".join([req.id, req.object_ids, "1"])+"\n")
+        process.stdin.close()
+
+        # logs were opened before the session was known, so move them to the session's name
+        for lf, ext in zip(log, ['.std.log', '.err.log']):
+            os.rename(lf.name, os.path.join(self.logs_folder, req.id + ext))
+        rospy.loginfo("  Logs at: " + self.logs_folder + '/' + req.id + "*.log")
+        self.processes.append(worker)
+
+        self._fill_warm_workers(cond)
+        self.process_lock.release()
         return startDialogResponse()
 
-    def _close_all_processes(self):
+    # periodically close out workers whose sessions have ended and replace any warm workers that died
+    def reap(self, event=None):
+        self.process_lock.acquire()
+        self._reap_finished()
+        for cond in self.conditions:
+            self._fill_warm_workers(cond)
+        self.process_lock.release()
+
+    def _reap_finished(self):
+        running = []
         for process, log in self.processes:
-            process.terminate()
+            if process.poll() is None:
+                running.append([process, log])
+            else:
+                for lf in log:
+                    lf.close()
+        self.processes = running
+        for cond in self.conditions:
+            warm = []
+            for process, log in self.warm_workers[cond]:
+                if process.poll() is None:
+                    warm.append([process, log])
+                else:
+                    rospy.logwarn("warm worker for condition '"+cond+"' exited with code "+str(process.returncode))
+                    for lf in log:
+                        lf.close()
+            self.warm_workers[cond] = warm
+
+    def _fill_warm_workers(self, cond):
+        while (len(self.warm_workers[cond]) < self.warm_workers_per_condition and
+               self._num_processes() < self.max_processes):
+            self.warm_workers[cond].append(self._start_worker(cond))
+
+    def _num_processes(self):
+        return len(self.processes) + sum([len(self.warm_workers[cond]) for cond in self.conditions])
+
+    def _start_worker(self, cond):
+        self.worker_serial += 1
+        name = "worker_" + cond + "_" + str(self.worker_serial)
+        std_log = open(os.path.join(self.logs_folder, name + '.std.log'), 'w')
+        err_log = open(os.path.join(self.logs_folder, name + '.err.log'), 'w')
+        log = [std_log, err_log]
+        process = self.start_rosrun_process(self.package, self.worker_script,
+                                            args=[cond, cond+".local.agent", self.agent_io,
+                                                  "_channel_address:="+self.channel_address],
+                                            log=log, stdin=subprocess.PIPE)
+        return [process, log]
+
+    def _close_all_processes(self):
+        workers = self.processes[:]
+        for cond in self.conditions:
+            workers.extend(self.warm_workers[cond])
+            self.warm_workers[cond] = []
+        for process, log in workers:
+            if process.poll() is None:
+                process.terminate()
             for lf in log:
                 lf.close()
         self.processes = []
 
-    def start_rosrun_process(self, package, binary, args=None, log=None):
+    def start_rosrun_process(self, package, binary, args=None, log=None, stdin=None):
         if args is None:
             args = []
         if package is not None:
@@ -121,8 +265,8 @@ class IspyServer:
             command_args = ['rosrun', binary]
         command_args.extend(args)
         print "Running command: " + ' '.join(command_args)
-        return (subprocess.Popen(command_args, stdout=log[0], stderr=log[1])
-                if log is not None else subprocess.Popen(command_args))
+        return (subprocess.Popen(command_args, stdin=stdin, stdout=log[0], stderr=log[1])
+                if log is not None else subprocess.Popen(command_args, stdin=stdin))
 
 
 if __name__ == "__main__":
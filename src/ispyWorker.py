@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+__author__ = 'jesse'
+
+import ispy
+from agent_io import *
+
+
+# rosrun perception_classifiers ispyWorker.py [condition] [agent_to_load] [iotype=file|socket]
+# a pre-started ispy.py that loads the condition's agent and classifiers up front, then blocks on stdin for
+# a session assignment line of the form '[user_id] [object_IDs] [num_rounds]' and plays that one game
+# through file or socket IO; started and reaped by ispyServer so that new web sessions begin without a cold start
+def main():
+
+    argv = rospy.myargv()
+    cond = argv[1]
+    agent_fn = None if argv[2] == "None" else argv[2]
+    io_type = argv[3] if len(argv) > 3 else "file"
+
+    path_to_ispy, stopwords_fn, pp, cp, path_to_logs = ispy.get_paths()
+
+    print "calling ROSpy init"
+    rospy.init_node('ispy_worker_'+cond, anonymous=True)
+
+    # warm up before any session exists
+    A = ispy.load_agent(pp, agent_fn, None, stopwords_fn, None)
+
+    print "waiting for session assignment"
+    line = sys.stdin.readline()
+    if len(line.strip()) == 0:
+        sys.exit("no session assigned; exiting")
+    user_id, object_ids_str, num_rounds_str = line.strip().split()
+    print "...assigned session '"+user_id+"' with objects "+object_ids_str
+    object_IDs = [int(oid) for oid in object_ids_str.split(',')]
+    num_rounds = int(num_rounds_str)
+
+    unique_name, log_fn = ispy.start_transcript(path_to_logs, cond, user_id, object_IDs, num_rounds, agent_fn)
+    A.object_IDs = object_IDs
+    A.log_fn = log_fn
+    io = ispy.make_io(A, io_type, cp, user_id, object_IDs, log_fn)
+    ispy.play_game(A, io, io_type, num_rounds, pp, unique_name)
+
+
+if __name__ == "__main__":
+        main()
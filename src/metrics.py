@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+__author__ = 'jesse'
+
+import numpy
+
+
+# confusion matrices of decisions against labels, indexed [..., label][decision]; pos and neg count the positive
+# and negative labels of each entry along the last axis, shaped like (predicates x objects) or (predicates x
+# behaviors x objects), and decisions is true where the entry was decided positive, broadcasting against them
+def confusion_matrices(pos, neg, decisions):
+    pos = numpy.asarray(pos)
+    neg = numpy.asarray(neg)
+    d = numpy.asarray(decisions, dtype=bool)
+    cms = numpy.zeros(numpy.broadcast(pos, neg, d).shape[:-1]+(2, 2), dtype=numpy.result_type(pos, neg))
+    cms[..., 0, 0] = numpy.where(d, 0, neg).sum(axis=-1)
+    cms[..., 0, 1] = numpy.where(d, neg, 0).sum(axis=-1)
+    cms[..., 1, 0] = numpy.where(d, 0, pos).sum(axis=-1)
+    cms[..., 1, 1] = numpy.where(d, pos, 0).sum(axis=-1)
+    return cms
+
+
+# numbers of positive and negative labels in a list of boolean labels
+def count_labels(labels):
+    pos = sum([1 for label in labels if label])
+    return pos, len(labels) - pos
+
+
+# number of labels counted in each confusion matrix
+def total(cms):
+    return cms.sum(axis=(-2, -1))
+
+
+# whether a confusion matrix saw only one class of label, so that its metrics are meaningless
+def single_class(cms):
+    return (cms[..., 0, :].sum(axis=-1) == 0) | (cms[..., 1, :].sum(axis=-1) == 0)
+
+
+# precision of each confusion matrix, 0 where nothing was decided positive
+def precision(cms):
+    return safe_divide(cms[..., 1, 1], cms[..., 0, 1] + cms[..., 1, 1])
+
+
+# recall of each confusion matrix, 0 where there were no positive labels
+def recall(cms):
+    return safe_divide(cms[..., 1, 1], cms[..., 1, 0] + cms[..., 1, 1])
+
+
+# f1 of each confusion matrix, 0 where there were no true positives
+def f1(cms):
+    p = precision(cms)
+    r = recall(cms)
+    return numpy.where(cms[..., 1, 1] == 0, 0.0, safe_divide(2 * p * r, p + r))
+
+
+# Cohen's kappa of each confusion matrix; as in classifier_services, 0 for empty matrices and 1 where chance
+# agreement is already perfect
+def kappa(cms):
+    c = total(cms).astype(numpy.float64)
+    p_o = safe_divide(cms[..., 1, 1] + cms[..., 0, 0], c)
+    gy = safe_divide(cms[..., 1, 0] + cms[..., 1, 1], c)
+    cy = safe_divide(cms[..., 0, 1] + cms[..., 1, 1], c)
+    p_e = (gy * cy) + ((1 - gy) * (1 - cy))
+    k = numpy.where(p_e < 1, safe_divide(p_o - p_e, 1 - p_e), 1.0)
+    return numpy.where(c == 0, 0.0, k)
+
+
+# elementwise a / b as floats, 0 where b is 0
+def safe_divide(a, b):
+    a = numpy.asarray(a, dtype=numpy.float64)
+    b = numpy.asarray(b, dtype=numpy.float64)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.where(b == 0, 0.0, a / numpy.where(b == 0, 1, b))
+
+
+# csv records of precision, recall, f1, kappa, and label count for each predicate's confusion matrix in cms,
+# skipping predicates that saw only one class of label
+def predicate_metric_records(preds, cms, cond):
+    cms = numpy.asarray(cms)
+    ps = precision(cms)
+    rs = recall(cms)
+    fs = f1(cms)
+    ks = kappa(cms)
+    ns = total(cms)
+    one_class = single_class(cms)
+    d = []
+    for p_idx in range(0, len(preds)):
+        cm = cms[p_idx].tolist()
+        if one_class[p_idx]:
+            print "... pred '" + preds[p_idx] + "' has only one class label " + str(cm)
+            continue
+        r = {'cond': cond, 'pred': preds[p_idx]}
+        r["precision"] = 0 if cm[0][1] + cm[1][1] == 0 else float(ps[p_idx])
+        r["recall"] = 0 if cm[1][0] + cm[1][1] == 0 else float(rs[p_idx])
+        r["f1"] = 0 if cm[1][1] == 0 else float(fs[p_idx])
+        r["n"] = float(ns[p_idx])
+        r["kappa"] = float(ks[p_idx])
+        d.append(r)
+    return d
@@ -2,7 +2,8 @@
 __author__ = 'jesse'
 
 import pickle
-import operator
+import numpy
+import metrics
 from agent_io import *
 from perception_classifiers.srv import *
 
@@ -11,6 +12,9 @@ from perception_classifiers.srv import *
 #   [train_agent_pickle] [test_agent_pickle]
 #   [retrain_classifiers=True/False] [cond] [obj_ids]
 #   [metrics_out_csv] [objects_out_file]
+#   [checkpoint_every=25]
+# when retraining, classifiers are saved every checkpoint_every retrained, and those saved by an interrupted
+# run with the same training data are loaded back rather than retrained
 def main():
 
     agent_fn = sys.argv[1]
@@ -26,6 +30,7 @@ def main():
             obj_ids.append(int(id_span))
     out_fn = sys.argv[6]
     obj_fn = sys.argv[7]
+    checkpoint_every = int(sys.argv[8]) if len(sys.argv) > 8 else 25
 
     print "calling ROSpy init"
     rospy.init_node('ispy_retrain')
@@ -36,29 +41,32 @@ def main():
     f.close()
 
     if retrain_classifiers:
+        print "loading existing perceptual classifiers to resume from"
+        a.load_classifiers()
         print "training classifiers"
         for pred in a.predicates:
             a.classifier_data_modified[a.predicate_to_classifier_map[pred]] = True
-        a.retrain_predicate_classifiers()
+        a.retrain_predicate_classifiers(checkpoint_every=checkpoint_every)
         print "saving classifiers to file"
         a.save_classifiers()
     else:
         print "loading existing perceptual classifiers"
         a.load_classifiers()
 
-    # get results of every classifier on every object
+    # get results of every classifier on every object in one batch, as predicate by object matrices
     print "getting classifier results over all predicates for objects "+str(obj_ids)
     r = a.get_classifier_results(a.predicates, obj_ids)  # indexed by oidx, then pred
+    results = numpy.array([[r[oidx][pred][0] for oidx in obj_ids] for pred in a.predicates])
+    confidences = numpy.array([[r[oidx][pred][1] for oidx in obj_ids] for pred in a.predicates])
 
     # write decisions and confidences out to file in sorted order
     f = open(obj_fn, 'w')
-    pred_decs = {pred:
-                 {oidx: r[oidx][pred][0]*r[oidx][pred][1]
-                  for oidx in obj_ids} for pred in a.predicates}
-    for pred in a.predicates:
-        f.write(pred+":")
-        s = sorted(pred_decs[pred].items(), key=operator.itemgetter(1), reverse=True)
-        f.write(";".join([str(oidx)+","+str(dec) for oidx, dec in s]))
+    pred_decs = results*confidences
+    rankings = numpy.argsort(-pred_decs, axis=1, kind='mergesort')
+    for p_idx in range(0, len(a.predicates)):
+        f.write(a.predicates[p_idx]+":")
+        f.write(";".join([str(obj_ids[o_idx])+","+str(float(pred_decs[p_idx, o_idx]))
+                          for o_idx in rankings[p_idx]]))
         f.write("\n")
     f.close()
 
@@ -67,39 +75,24 @@ def main():
     b = pickle.load(f)
     f.close()
 
-    # get confusion matrix for each predicate
+    # count the testing agent's positive and negative labels of each predicate for each object
+    preds = [pred for pred in a.predicates if pred in b.predicate_examples]
+    pos = numpy.zeros((len(preds), len(obj_ids)), dtype=int)
+    neg = numpy.zeros((len(preds), len(obj_ids)), dtype=int)
+    for p_idx in range(0, len(preds)):
+        for o_idx in range(0, len(obj_ids)):
+            if obj_ids[o_idx] in b.predicate_examples[preds[p_idx]]:
+                pos[p_idx, o_idx], neg[p_idx, o_idx] = \
+                    metrics.count_labels(b.predicate_examples[preds[p_idx]][obj_ids[o_idx]])
+
+    # get confusion matrix for every predicate at once
     print "calculating confusion matrix of training agent decisions against testing agent labels"
-    p_cm = {}
-    for pred in b.predicates:
-        cm = [[0, 0], [0, 0]]
-        for i in obj_ids:
-            if i in b.predicate_examples[pred]:
-                d = 0 if r[i][pred][0] == -1 else 1  # 0 confidence is assigned a False label
-                for label in b.predicate_examples[pred][i]:
-                    ld = 1 if label else 0
-                    cm[ld][d] += 1
-        p_cm[pred] = cm
+    dec = results[[a.predicates.index(pred) for pred in preds]] != -1  # 0 confidence is assigned a False label
+    cms = metrics.confusion_matrices(pos, neg, dec)
 
     # calculate precision, recall, f1, and kappa of predicates
     print "calculating metrics of interest"
-    d = []
-    for pred in a.predicates:
-        cm = p_cm[pred]
-        if cm[0][0] + cm[0][1] == 0 or cm[1][0] + cm[1][1] == 0:  # only one class label
-            print "... pred '" + pred + "' has only one class label " + str(cm)
-            continue
-        r = {'cond': cond, 'pred': pred}
-        r["precision"] = 0 if cm[0][1] + cm[1][1] == 0 else float(cm[1][1]) / (cm[0][1] + cm[1][1])
-        r["recall"] = 0 if cm[1][0] + cm[1][1] == 0 else float(cm[1][1]) / (cm[1][0] + cm[1][1])
-        r["f1"] = 0 if cm[1][1] == 0 else 2 * (r["precision"] * r["recall"]) / (r["precision"] + r["recall"])
-        c = float(sum([cm[i][j] for i in range(0, 2) for j in range(0, 2)]))
-        r["n"] = c
-        p_o = (cm[1][1] + cm[0][0]) / c
-        gy = (cm[1][0] + cm[1][1]) / c
-        cy = (cm[0][1] + cm[1][1]) / c
-        p_e = (gy * cy) + ((1 - gy) * (1 - cy))
-        r["kappa"] = (p_o - p_e) / (1 - p_e)
-        d.append(r)
+    d = metrics.predicate_metric_records(preds, cms, cond)
 
     # write out to csv
     if len(d) > 0:
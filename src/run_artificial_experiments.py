@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+__author__ = 'jesse'
+
+import os
+import sys
+import subprocess
+import threading
+import Queue
+import rospy
+import xval_runner
+from test_artificial_agent import fold_to_user_ids, get_log_fn_properties
+
+# metrics of the recomputed match scores to report for each condition and held-out fold
+metrics_to_report = ["avg_reg", "avg_rr@1"]
+
+
+# python run_artificial_experiments.py
+#   [pickle_dir] [log_dir] [out_root] [results_fn]
+#   [conds=con,exp] [num_parallel=4] [base_seed=0]
+# run test_artificial_agent.py for every condition with each fold held out in turn and the others trained on,
+# several jobs at once; every job gets its own classifier_services node and classifier directory under its own
+# output directory, a seed fixed by its place in the matrix, and is skipped if its outputs are newer than its
+# inputs; the metrics of all jobs are then written to results_fn as one table
+def main():
+
+    pickle_dir = sys.argv[1]
+    log_dir = sys.argv[2]
+    out_root = sys.argv[3]
+    results_fn = sys.argv[4]
+    conds = sys.argv[5].split(',') if len(sys.argv) > 5 else ["con", "exp"]
+    num_parallel = int(sys.argv[6]) if len(sys.argv) > 6 else 4
+    base_seed = int(sys.argv[7]) if len(sys.argv) > 7 else 0
+
+    print "calling ROSpy init"
+    rospy.init_node('ispy_artificial_experiments')
+
+    jobs = []
+    for cond in conds:
+        for fold_to_test in range(0, len(fold_to_user_ids)):
+            jobs.append(ArtificialJob(pickle_dir, log_dir, out_root, cond, fold_to_test, base_seed+len(jobs)))
+
+    q = Queue.Queue()
+    for job in jobs:
+        if job.is_current():
+            print "... '"+job.name+"' is up to date; skipping"
+        else:
+            q.put(job)
+    failed = []
+
+    def work():
+        while True:
+            try:
+                job = q.get_nowait()
+            except Queue.Empty:
+                return
+            if not job.run():
+                failed.append(job.name)
+
+    threads = [threading.Thread(target=work) for _ in range(0, num_parallel)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        while t.is_alive():
+            t.join(1)  # joining with a timeout keeps the main thread responsive to ctrl-c
+
+    if len(failed) > 0:
+        print "jobs failed, see their job.log: "+str(failed)
+
+    print "writing aggregated results to "+results_fn
+    write_results_table(results_fn, conds, [job for job in jobs if job.is_current()])
+
+
+# one (condition, held-out fold) run of test_artificial_agent.py
+class ArtificialJob:
+
+    def __init__(self, pickle_dir, log_dir, out_root, cond, fold_to_test, seed):
+        self.pickle_dir = pickle_dir
+        self.log_dir = log_dir
+        self.cond = cond
+        self.fold_to_test = fold_to_test
+        self.folds_to_train = [fold for fold in range(0, len(fold_to_user_ids)) if fold != fold_to_test]
+        self.seed = seed
+        self.fold_name = ''.join([str(fold) for fold in self.folds_to_train])+"_"+str(fold_to_test)
+        self.name = cond+"_"+self.fold_name
+        self.out_dir = os.path.join(out_root, self.name)
+        self.classifier_dir = os.path.join(self.out_dir, "classifiers")
+        self.out_pickle_fn = self.name+".agent"
+        self.done_fn = os.path.join(self.out_dir, "job.done")
+
+    # newest modification time among the pickles and logs the job reads
+    def newest_input_mtime(self):
+        newest = os.path.getmtime(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                               "test_artificial_agent.py"))
+        for d in [self.pickle_dir, self.log_dir]:
+            for root, dirs, files in os.walk(d):
+                for fn in files:
+                    newest = max(newest, os.path.getmtime(os.path.join(root, fn)))
+        return newest
+
+    def is_current(self):
+        return os.path.isfile(self.done_fn) and os.path.getmtime(self.done_fn) >= self.newest_input_mtime()
+
+    # start a classifier backend for the job and run it without prompting; returns whether it succeeded
+    def run(self):
+        if not os.path.isdir(self.classifier_dir):
+            os.makedirs(self.classifier_dir)
+        if os.path.isfile(self.done_fn):
+            os.remove(self.done_fn)
+        log = open(os.path.join(self.out_dir, "job.log"), 'w')
+        backend = xval_runner.XvalBackend(self.cond, '/artificial_'+self.name, classifier_dir=self.classifier_dir,
+                                          log=log)
+        try:
+            command_args = ['rosrun', 'perception_classifiers', 'test_artificial_agent.py',
+                            self.pickle_dir, self.cond, ','.join([str(fold) for fold in self.folds_to_train]),
+                            str(self.fold_to_test), self.out_pickle_fn, self.log_dir, self.out_dir,
+                            backend.service_ns(), str(self.seed), "N"]
+            print "... starting '"+self.name+"': " + ' '.join(command_args)
+            r = subprocess.call(command_args, stdout=log, stderr=log)
+        finally:
+            backend.close()
+            log.close()
+        if r != 0:
+            print "... '"+self.name+"' exited with status "+str(r)
+            return False
+        open(self.done_fn, 'w').close()
+        print "... '"+self.name+"' finished"
+        return True
+
+    # the test logs this job rewrote with its own match scores
+    def output_logs(self):
+        fns = []
+        if not os.path.isdir(self.out_dir):
+            return fns
+        for fn in os.listdir(self.out_dir):
+            if fn == self.out_pickle_fn or not os.path.isfile(os.path.join(self.out_dir, fn)):
+                continue
+            try:
+                valid, _ = get_log_fn_properties(fn, self.cond, fold_to_user_ids[self.fold_to_test])
+            except ValueError:
+                continue
+            if valid:
+                fns.append(os.path.join(self.out_dir, fn))
+        return fns
+
+
+# average each reported metric over the logs of every job, written as one table per metric with a row per
+# condition and a column per held-out fold, in the manner of artificial_results.txt
+def write_results_table(results_fn, conds, jobs):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'subjects_testing'))
+    import extract_from_logs
+
+    fold_names = []
+    r = {}  # indexed by cond, then fold name
+    for job in jobs:
+        if job.fold_name not in fold_names:
+            fold_names.append(job.fold_name)
+        d = [extract_from_logs.extract_data_from_log(fn) for fn in job.output_logs()]
+        if len(d) > 0:
+            r.setdefault(job.cond, {})[job.fold_name] = \
+                {m: sum([d_log[m] for d_log in d])/float(len(d)) for m in metrics_to_report}
+    fold_names.sort(key=lambda n: n.split('_')[1])
+
+    f = open(results_fn, 'w')
+    for m in metrics_to_report:
+        f.write(m+"\n")
+        f.write("\t\t"+"\t".join(fold_names)+"\n")
+        for cond in conds:
+            f.write(cond+"\t\t"+"\t".join(["%.3f" % r[cond][n][m] if cond in r and n in r[cond] else "-"
+                                           for n in fold_names])+"\n")
+        f.write("\n")
+    f.close()
+
+
+if __name__ == "__main__":
+        main()
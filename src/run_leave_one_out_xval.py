@@ -3,8 +3,10 @@ __author__ = 'jesse'
 
 import pickle
 import operator
-import copy
+import numpy
 import IspyAgent
+import xval_runner
+import metrics
 from agent_io import *
 from perception_classifiers.srv import *
 
@@ -13,12 +15,16 @@ from perception_classifiers.srv import *
 #   [full_data_agent_pickle]
 #   [cond]
 #   [metrics_out_csv] [objects_out_file]
+#   [num_workers=None]
+# with num_workers, folds are spread over that many classifier_services backends started for cond; otherwise
+# they run one after another on the classifier_services node already running
 def main():
 
     agent_fn = sys.argv[1]
     cond = sys.argv[2]
     out_fn = sys.argv[3]
     obj_fn = sys.argv[4]
+    num_workers = int(sys.argv[5]) if len(sys.argv) > 5 else None
 
     print "calling ROSpy init"
     rospy.init_node('ispy_retrain')
@@ -35,31 +41,20 @@ def main():
     a.object_IDs = fa.object_IDs
     a.stopwords = fa.stopwords
 
-    print "setting all agent predicates to be retrained"
-    for pred in a.predicates:
-        a.classifier_data_modified[a.predicate_to_classifier_map[pred]] = True
+    # get classifier results for all predicates on the held-out object, and the fold's confusion matrices
+    # of those decisions against the held-out object's labels
+    def evaluate(b, oidx):
+        r_oidx = b.get_classifier_results(b.predicates, [oidx])[oidx]
+        preds = [pred for pred in a.predicates if oidx in a.predicate_examples[pred]]
+        counts = numpy.array([metrics.count_labels(a.predicate_examples[pred][oidx]) for pred in preds],
+                             dtype=int).reshape((len(preds), 2))
+        d = numpy.array([r_oidx[pred][0] != -1 for pred in preds])  # 0 confidence is assigned a False label
+        cms = metrics.confusion_matrices(counts[:, 0:1], counts[:, 1:2], d[:, numpy.newaxis])
+        return r_oidx, dict(zip(preds, cms))
 
     print "performing leave-one-out xval..."
-    r = {}
-    for oidx in range(1, 33):
-        print "... object "+str(oidx)
-
-        print "...... updating classifier training data"
-        b = copy.deepcopy(a)
-        for pred in b.predicates:
-            if oidx in b.predicate_examples[pred]:
-                print "......... removing '"+pred+"' examples "+str(b.predicate_examples[pred][oidx])
-                del b.predicate_examples[pred][oidx]
-                b.classifier_data_modified[b.predicate_to_classifier_map[pred]] = True
-
-        print "...... training updated classifiers"
-        b.retrain_predicate_classifiers()
-        for pred in a.predicates:
-            a.classifier_data_modified[a.predicate_to_classifier_map[pred]] = False
-
-        print "...... getting classifier results for all predicates on object"
-        r_oidx = b.get_classifier_results(b.predicates, [oidx])
-        r[oidx] = r_oidx[oidx]
+    folds = xval_runner.run_folds(a, cond, range(1, 33), evaluate, num_workers=num_workers)
+    r = {oidx: folds[oidx][0] for oidx in folds}
 
     # write decisions and confidences out to file in sorted order
     f = open(obj_fn, 'w')
@@ -75,37 +70,12 @@ def main():
 
     # get confusion matrix for each predicate
     print "calculating confusion matrix of training agent decisions against testing agent labels"
-    p_cm = {}
-    for pred in a.predicates:
-        cm = [[0, 0], [0, 0]]
-        for i in range(1, 33):
-            if i in b.predicate_examples[pred]:
-                d = 0 if r[i][pred][0] == -1 else 1  # 0 confidence is assigned a False label
-                for label in b.predicate_examples[pred][i]:
-                    ld = 1 if label else 0
-                    cm[ld][d] += 1
-        p_cm[pred] = cm
+    p_cm = xval_runner.merge_confusion_matrices([folds[oidx][1] for oidx in folds])
+    cms = numpy.array([p_cm[pred] if pred in p_cm else numpy.zeros((2, 2), dtype=int) for pred in a.predicates])
 
     # calculate precision, recall, f1, and kappa of predicates
     print "calculating metrics of interest"
-    d = []
-    for pred in a.predicates:
-        cm = p_cm[pred]
-        if cm[0][0] + cm[0][1] == 0 or cm[1][0] + cm[1][1] == 0:  # only one class label
-            print "... pred '" + pred + "' has only one class label " + str(cm)
-            continue
-        r = {'cond': cond, 'pred': pred}
-        r["precision"] = 0 if cm[0][1] + cm[1][1] == 0 else float(cm[1][1]) / (cm[0][1] + cm[1][1])
-        r["recall"] = 0 if cm[1][0] + cm[1][1] == 0 else float(cm[1][1]) / (cm[1][0] + cm[1][1])
-        r["f1"] = 0 if cm[1][1] == 0 else 2 * (r["precision"] * r["recall"]) / (r["precision"] + r["recall"])
-        c = float(sum([cm[i][j] for i in range(0, 2) for j in range(0, 2)]))
-        r["n"] = c
-        p_o = (cm[1][1] + cm[0][0]) / c
-        gy = (cm[1][0] + cm[1][1]) / c
-        cy = (cm[0][1] + cm[1][1]) / c
-        p_e = (gy * cy) + ((1 - gy) * (1 - cy))
-        r["kappa"] = (p_o - p_e) / (1 - p_e)
-        d.append(r)
+    d = metrics.predicate_metric_records(a.predicates, cms, cond)
 
     # write out to csv
     if len(d) > 0:
@@ -2,8 +2,10 @@
 __author__ = 'jesse'
 
 import pickle
-import copy
+import numpy
 import IspyAgent
+import xval_runner
+import decision_tensor
 from agent_io import *
 from perception_classifiers.srv import *
 
@@ -13,12 +15,22 @@ from perception_classifiers.srv import *
 #   [config_fn]
 #   [confidences_fn]
 #   [confusion_matrix_out_fn]
+#   [num_workers=None] [cond=None] [tensor_fn=None]
+# with num_workers, folds are spread over that many classifier_services backends started for cond; otherwise
+# they run one after another on the classifier_services node already running
+# with tensor_fn, the held-out sub-classifier decisions are saved there, and if it already exists they are
+# loaded from it instead of running the folds again, so other confidence tables can be evaluated in moments
 def main():
 
     agent_fn = sys.argv[1]
     config_fn = sys.argv[2]
     conf_fn = sys.argv[3]
     out_fn = sys.argv[4]
+    num_workers = int(sys.argv[5]) if len(sys.argv) > 5 else None
+    cond = sys.argv[6] if len(sys.argv) > 6 and sys.argv[6] != "None" else None
+    tensor_fn = sys.argv[7] if len(sys.argv) > 7 else None
+    if num_workers is not None and cond is None:
+        sys.exit("a condition is needed to start classifier backends for workers")
     
     obj_interval = range(1, 33)
 
@@ -47,84 +59,35 @@ def main():
     a.object_IDs = fa.object_IDs
     a.stopwords = fa.stopwords
 
-    print "setting all agent predicates to be retrained"
-    for pred in a.predicates:
-        a.classifier_data_modified[a.predicate_to_classifier_map[pred]] = True
-
-    print "performing leave-one-out xval..."
-    s = {}
-    c = {}
-    for oidx in obj_interval:
-        print "... object "+str(oidx)
-
-        print "...... updating classifier training data"
-        b = copy.deepcopy(a)
-        for pred in b.predicates:
-            if oidx in b.predicate_examples[pred]:
-                print "......... removing '"+pred+"' examples "+str(b.predicate_examples[pred][oidx])
-                del b.predicate_examples[pred][oidx]
-                b.classifier_data_modified[b.predicate_to_classifier_map[pred]] = True
-
-        print "...... training updated classifiers"
-        b.retrain_predicate_classifiers()
-        for pred in a.predicates:
-            a.classifier_data_modified[a.predicate_to_classifier_map[pred]] = False
-
-        print "...... getting sub classifier results for all predicates on object"
-        s_oidx = b.get_sub_classifier_results(b.predicates, [oidx])
-        s[oidx] = {}
-        for pred in a.predicates:
-            s[oidx][pred] = [[0 for m_idx in range(0, len(modalities))] for b_idx in range(0, len(behaviors))]
-            c_idx = 0
-            for b_idx in range(0, len(behaviors)):
-                for m_idx in range(0, len(modalities)):
-                    s[oidx][pred][b_idx][m_idx] = s_oidx[oidx][pred][c_idx]
-                    c_idx += 1
-
-        # read in predicate context confidence values
-        print "...... reading in predicate confidence values"
-        f = open(conf_fn, 'r')
-        conf = {}  # indexed by predicate
-        for line in f.readlines():
-            parts = line.strip().split(',')
-            pred = a.classifier_to_predicate_map[int(parts[0])]
-            conf[pred] = \
-                [[0 for m_idx in range(0, len(modalities))] for b_idx in range(0, len(behaviors))]
-            i = 1
-            for b_idx in range(0, len(behaviors)):
-                for m_idx in range(0, len(modalities)):
-                    conf[pred][b_idx][m_idx] = float(parts[i])
-                    i += 1
-        f.close()
-        c[oidx] = conf
-
-    # calculate decisions for each (pred, behavior)
-    print "calculating decisions across each predicate, behavior tuple"
-    r = {}
-    for oidx in obj_interval:
-        r_oidx = {}
-        for pred in a.predicates:
-            for b_idx in range(0, len(behaviors)):
-                key = (pred, b_idx)
-                dec = sum([s[oidx][pred][b_idx][m_idx]*c[oidx][pred][b_idx][m_idx]
-                           for m_idx in range(0, len(modalities))])
-                r_oidx[key] = dec
-        r[oidx] = r_oidx
-
-    # get confusion matrix for each predicate
+    # the confidence table doesn't change across folds, so read it once
+    print "reading in predicate confidence values"
+    conf = xval_runner.read_confidences(conf_fn, a, len(behaviors), len(modalities))
+
+    # get sub classifier decisions of all predicates on the held-out object, as (predicates x contexts)
+    def evaluate(b, oidx):
+        return b.get_sub_classifier_tensor(a.predicates, [oidx])[0]
+
+    if tensor_fn is not None and os.path.isfile(tensor_fn):
+        print "loading held-out sub classifier decisions"
+        t, oidxs, preds = decision_tensor.load_tensor(tensor_fn)
+        if oidxs != obj_interval or preds != a.predicates:
+            sys.exit("saved sub classifier decisions in '"+tensor_fn+"' don't match the agent's predicates")
+    else:
+        print "performing leave-one-out xval..."
+        folds = xval_runner.run_folds(a, cond, obj_interval, evaluate, num_workers=num_workers)
+        t = decision_tensor.split_contexts(numpy.array([folds[oidx] for oidx in obj_interval]),
+                                           len(behaviors), len(modalities))
+        if tensor_fn is not None:
+            decision_tensor.save_tensor(tensor_fn, t, obj_interval, a.predicates)
+
+    # get confusion matrix for each predicate and behavior
     print "calculating confusion matrix of training agent decisions against testing agent labels"
-    pb_cm = {}
-    for pred in a.predicates:
-        for b_idx in range(0, len(behaviors)):
-            key = (pred, b_idx)
-            cm = [[0, 0], [0, 0]]
-            for i in obj_interval:
-                if i in b.predicate_examples[pred]:
-                    d = 0 if r[i][key] <= 0 else 1  # 0 confidence is assigned a False label
-                    for label in b.predicate_examples[pred][i]:
-                        ld = 1 if label else 0
-                        cm[ld][d] += 1
-            pb_cm[key] = cm
+    pos, neg = decision_tensor.label_counts(a, a.predicates, obj_interval)
+    dec = decision_tensor.decisions(t, decision_tensor.confidence_tensor(conf, a.predicates, len(behaviors),
+                                                                         len(modalities)), per_behavior=True)
+    cms = decision_tensor.decision_confusion_matrices(dec, pos, neg)
+    pb_cm = {(a.predicates[p_idx], b_idx): cms[p_idx, b_idx]
+             for p_idx in range(0, len(a.predicates)) for b_idx in range(0, len(behaviors))}
 
     # write out confusion matrices to csv
     print "writing confusion matrices out to file"
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+__author__ = 'jesse'
+
+import threading
+import ispy
+import IspyAgent
+from agent_io import *
+
+
+# host many dialog sessions inside one process; each condition's agent is unpickled and its classifiers
+# loaded once, then every session plays on a copy-on-write view of that agent in its own thread, blocking
+# on a shared FileMonitor so that waiting sessions cost no CPU
+# a classifier_services node keeps only the first classifiers loaded into it, so each condition must name its
+# own node in service_namespaces, indexed by condition; a condition sharing a node with one already loaded is
+# refused with a ValueError rather than left playing on the other condition's classifiers
+class SessionHost:
+
+    def __init__(self, monitor, max_sessions=512, channel_address=None, service_namespaces=None):
+        self.monitor = monitor
+        self.service_namespaces = service_namespaces if service_namespaces is not None else {}
+        self.channel_address = channel_address
+        self.max_sessions = max_sessions
+        self.path_to_ispy, self.stopwords_fn, self.pp, _, self.path_to_logs = ispy.get_paths()
+        self.cp = monitor.path  # sessions must talk through the directory the monitor watches
+        self.lock = threading.Lock()
+        self.base_agents = {}  # indexed by condition, never played on directly
+        self.sessions = {}  # indexed by session id, valued at running threads
+        self.io_types = ["file", "socket"]
+
+    # load each condition's agent ahead of the first session that needs it
+    def preload(self, conds):
+        for cond in conds:
+            self.base_agent(cond)
+
+    # start a game for user_id in a new thread; returns False if the host is full, and raises ValueError
+    # before starting anything if the condition can't be hosted
+    def start_session(self, user_id, object_IDs, num_rounds, cond, io_type="file"):
+        if io_type not in self.io_types:
+            raise ValueError("unrecognized session io_type '"+str(io_type)+"'; options "+"|".join(self.io_types))
+        self.base_agent(cond)
+        self.lock.acquire()
+        self.sessions = {sid: t for sid, t in self.sessions.items() if t.is_alive()}
+        if len(self.sessions) >= self.max_sessions:
+            self.lock.release()
+            return False
+        t = threading.Thread(target=self.run_session, args=(user_id, object_IDs, num_rounds, cond, io_type))
+        t.daemon = True
+        self.sessions[user_id] = t
+        self.lock.release()
+        t.start()
+        return True
+
+    def num_sessions(self):
+        self.lock.acquire()
+        n = len([t for t in self.sessions.values() if t.is_alive()])
+        self.lock.release()
+        return n
+
+    def run_session(self, user_id, object_IDs, num_rounds, cond, io_type):
+        agent_fn = cond+".local.agent"
+        unique_name, log_fn = ispy.start_transcript(self.path_to_logs, cond, user_id, object_IDs, num_rounds,
+                                                    agent_fn)
+        A = self.session_agent(cond)
+        A.object_IDs = object_IDs
+        A.log_fn = log_fn
+        io = self.make_io(A, io_type, user_id, log_fn)
+        ispy.play_game(A, io, io_type, num_rounds, self.pp, unique_name)
+        print "session '"+str(user_id)+"' finished"
+
+    def make_io(self, A, io_type, user_id, log_fn):
+        if io_type == "file":
+            return IOFile(os.path.join(self.cp, str(user_id)+".get.in"),
+                          os.path.join(self.cp, str(user_id)+".guess.in"),
+                          os.path.join(self.cp, str(user_id)+".say.out"),
+                          os.path.join(self.cp, str(user_id)+".point.out"),
+                          log_fn, timeout=rospy.get_param('~io_timeout', 60*60), watcher=self.monitor)
+        elif io_type == "socket":
+            return IOSocket(self.channel_address, str(user_id), log_fn, timeout=rospy.get_param('~io_timeout', 60*60))
+        raise ValueError("unrecognized session io_type '"+str(io_type)+"'")
+
+    def base_agent(self, cond):
+        self.lock.acquire()
+        try:
+            if cond not in self.base_agents:
+                ns = self.service_namespaces.get(cond, '')
+                for other in self.base_agents:
+                    if self.base_agents[other].service_ns == ns:
+                        raise ValueError("conditions '"+other+"' and '"+cond+"' would share the classifier_services "
+                                         "node at '"+ns+"'; give each its own namespace")
+                self.base_agents[cond] = ispy.load_agent(self.pp, cond+".local.agent", None, self.stopwords_fn,
+                                                         None, service_ns=ns)
+            return self.base_agents[cond]
+        finally:
+            self.lock.release()
+
+    # a view of the shared agent keeping one game's new words and labels to itself
+    def session_agent(self, cond):
+        return IspyAgent.SessionView(self.base_agent(cond))
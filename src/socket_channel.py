@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+__author__ = 'jesse'
+
+import os
+import json
+import errno
+import select
+import socket
+import struct
+import threading
+
+# every message is a JSON object preceded by its length as a 4-byte, big-endian unsigned integer
+frame_header = struct.Struct('!I')
+max_frame_len = 1 << 20
+
+# file in the communications directory naming the address the channel server listens on
+channel_address_fn = "ispy.channel"
+
+
+# address strings are either a path to a Unix domain socket or 'host:port' for local TCP
+def parse_address(address):
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def encode_message(msg):
+    payload = json.dumps(msg)
+    return frame_header.pack(len(payload)) + payload
+
+
+def send_message(sock, msg):
+    sock.sendall(encode_message(msg))
+
+
+# read exactly n bytes from a blocking socket, or None if the peer closed it
+def recv_exactly(sock, n):
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(n)
+        if len(chunk) == 0:
+            return None
+        chunks.append(chunk)
+        n -= len(chunk)
+    return ''.join(chunks)
+
+
+# read one message from a blocking socket, or None if the peer closed it
+def recv_message(sock):
+    header = recv_exactly(sock, frame_header.size)
+    if header is None:
+        return None
+    n = frame_header.unpack(header)[0]
+    if n > max_frame_len:
+        raise ValueError("frame of "+str(n)+" bytes exceeds limit")
+    payload = recv_exactly(sock, n)
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+
+# split complete messages off the front of a receive buffer; returns (messages, remaining buffer)
+def decode_messages(buff):
+    msgs = []
+    while len(buff) >= frame_header.size:
+        n = frame_header.unpack_from(buff)[0]
+        if n > max_frame_len:
+            raise ValueError("frame of "+str(n)+" bytes exceeds limit")
+        if len(buff) < frame_header.size + n:
+            break
+        msgs.append(json.loads(buff[frame_header.size:frame_header.size+n]))
+        buff = buff[frame_header.size+n:]
+    return msgs, buff
+
+
+# JSON hands back unicode, but the agent and its transcripts work in byte strings
+def to_str(v):
+    if isinstance(v, unicode):
+        return v.encode('utf-8')
+    return v
+
+
+# per-session state held by the channel server
+class ChannelSession:
+
+    def __init__(self, sid):
+        self.sid = sid
+        self.agent = None  # connection of the agent playing this session, once it says hello
+        self.pending_input = []  # user input that arrived before the agent connected
+        self.say = []  # agent utterances not yet fetched by the web front end
+        self.point = None  # latest agent point not yet fetched by the web front end
+
+
+# multiplex agent and web front end connections for many sessions over one listening socket from a single
+# poll loop; agents connect and stay connected, while the front end sends one-shot 'get'/'guess' messages
+# that are routed to the session's agent, or written to the file protocol when the session has no socket agent
+class ChannelServer:
+
+    def __init__(self, address, monitor, buffer_unclaimed_input=True):
+        self.address = address
+        self.monitor = monitor
+        self.communications = monitor.path
+        self.buffer_unclaimed_input = buffer_unclaimed_input
+        self.lock = threading.Lock()
+        self.sessions = {}  # indexed by session id
+        self.connections = {}  # indexed by fd, valued at [socket, receive buffer, session id or None]
+
+        family, addr = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.remove(addr)
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(addr)
+        if family == socket.AF_UNIX:
+            os.chmod(addr, 0777)
+        self.listener.listen(128)
+        self.listener.setblocking(0)
+        self.publish_address()
+        self.poller = select.poll()
+        self.poller.register(self.listener.fileno(), select.POLLIN)
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # write the listening address where the web front end reads it, so it reaches the channel wherever it is
+    def publish_address(self):
+        fn = os.path.join(self.communications, channel_address_fn)
+        f = open(fn+".tmp", 'w')
+        f.write(self.address)
+        f.close()
+        os.chmod(fn+".tmp", 0666)
+        os.rename(fn+".tmp", fn)
+
+    def run(self):
+        while True:
+            try:
+                events = self.poller.poll()
+            except select.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+            for fd, event in events:
+                if fd == self.listener.fileno():
+                    self.accept()
+                elif fd in self.connections:
+                    self.read(fd)
+
+    def accept(self):
+        try:
+            conn, _ = self.listener.accept()
+        except socket.error, e:
+            if e[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+        conn.setblocking(0)
+        self.connections[conn.fileno()] = [conn, '', None]
+        self.poller.register(conn.fileno(), select.POLLIN)
+
+    def read(self, fd):
+        conn, buff, sid = self.connections[fd]
+        try:
+            data = conn.recv(65536)
+        except socket.error, e:
+            if e[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ''
+        if len(data) == 0:
+            self.drop(fd)
+            return
+        try:
+            msgs, buff = decode_messages(buff + data)
+        except ValueError, e:
+            print "dropping channel connection: "+str(e)
+            self.drop(fd)
+            return
+        self.connections[fd][1] = buff
+        for msg in msgs:
+            self.handle(fd, msg)
+
+    def drop(self, fd):
+        conn, _, sid = self.connections.pop(fd)
+        self.poller.unregister(fd)
+        conn.close()
+        if sid is not None:
+            self.lock.acquire()
+            s = self.sessions.get(sid)
+            if s is not None and s.agent is conn:
+                s.agent = None
+                if len(s.say) == 0 and s.point is None:
+                    del self.sessions[sid]
+            self.lock.release()
+
+    def session(self, sid):
+        if sid not in self.sessions:
+            self.sessions[sid] = ChannelSession(sid)
+        return self.sessions[sid]
+
+    def handle(self, fd, msg):
+        conn = self.connections[fd][0]
+        t = msg.get('type')
+        if t == 'hello':
+            sid = to_str(msg['id'])
+            self.connections[fd][2] = sid
+            self.lock.acquire()
+            s = self.session(sid)
+            s.agent = conn
+            pending = s.pending_input
+            s.pending_input = []
+            self.lock.release()
+            for m in pending:
+                self.send(conn, m)
+        elif t == 'say' or t == 'point':
+            sid = self.connections[fd][2]
+            if sid is None:
+                return
+            self.lock.acquire()
+            s = self.session(sid)
+            if t == 'say':
+                s.say.append(to_str(msg['data']))
+            else:
+                s.point = int(msg['data'])
+            self.lock.release()
+            self.monitor.notify(sid+"."+t+".out")
+        elif t == 'get' or t == 'guess':
+            self.route_input(to_str(msg['id']), {'type': t, 'data': msg['data']})
+            self.send(conn, {'type': 'ok'})
+
+    # hand user input to the session's agent, holding or writing it to file if the agent isn't connected
+    def route_input(self, sid, m):
+        self.lock.acquire()
+        s = self.sessions.get(sid)
+        agent = s.agent if s is not None else None
+        if agent is None and self.buffer_unclaimed_input:
+            self.session(sid).pending_input.append(m)
+        self.lock.release()
+        if agent is not None:
+            self.send(agent, m)
+        elif not self.buffer_unclaimed_input:
+            fn = os.path.join(self.communications, sid+"."+m['type']+".in")
+            f = open(fn, 'w')
+            f.write(to_str(unicode(m['data'])))
+            f.close()
+            os.chmod(fn, 0777)
+
+    def send(self, conn, msg):
+        try:
+            conn.setblocking(1)
+            send_message(conn, msg)
+            conn.setblocking(0)
+        except socket.error, e:
+            print "failed to send on channel connection: "+str(e)
+
+    def has_say(self, sid):
+        self.lock.acquire()
+        r = sid in self.sessions and len(self.sessions[sid].say) > 0
+        self.lock.release()
+        return r
+
+    def has_point(self, sid):
+        self.lock.acquire()
+        r = sid in self.sessions and self.sessions[sid].point is not None
+        self.lock.release()
+        return r
+
+    # return everything the agent has said since the last call, as the say file would have held it
+    def take_say(self, sid):
+        self.lock.acquire()
+        s = self.sessions.get(sid)
+        r = None
+        if s is not None and len(s.say) > 0:
+            r = ''.join([u+"\n" for u in s.say])
+            s.say = []
+            self.forget_if_done(s)
+        self.lock.release()
+        return r
+
+    def take_point(self, sid):
+        self.lock.acquire()
+        s = self.sessions.get(sid)
+        r = None
+        if s is not None and s.point is not None:
+            r = s.point
+            s.point = None
+            self.forget_if_done(s)
+        self.lock.release()
+        return r
+
+    # must be called with self.lock held
+    def forget_if_done(self, s):
+        if s.agent is None and len(s.say) == 0 and s.point is None and len(s.pending_input) == 0:
+            del self.sessions[s.sid]
@@ -2,17 +2,24 @@
 __author__ = 'jesse'
 
 import rospkg
-import ast
 import pickle
+import random
 import IspyAgent
+import transcript_log
 from agent_io import *
 from perception_classifiers.srv import *
 
+# user ids whose games make up each fold
+fold_to_user_ids = [range(0, 10), range(10, 20), range(20, 30), range(30, 42)]
+
 
 # python test_artificial_agent.py
 #   [pickle_dir] [cond]
 #   [folds_to_train] [fold_to_test]
 #   [out_pickle] [log_dir] [out_dir]
+#   [service_ns=None] [seed=None] [prompt=Y|N]
+# service_ns names the classifier_services node to train on if not the default one; with prompt N, an agent
+# already pickled in out_dir is used with its classifiers loaded instead of asking the operator to check them
 def main():
 
     # read command-line args
@@ -23,9 +30,14 @@ def main():
     out_pickle_fn = sys.argv[5]
     log_dir = sys.argv[6]
     out_dir = sys.argv[7]
+    service_ns = sys.argv[8] if len(sys.argv) > 8 and sys.argv[8] != "None" else ''
+    seed = int(sys.argv[9]) if len(sys.argv) > 9 and sys.argv[9] != "None" else None
+    prompt = sys.argv[10] != "N" if len(sys.argv) > 10 else True
+
+    if seed is not None:
+        random.seed(seed)
 
     # calculations from command-line
-    fold_to_user_ids = [range(0, 10), range(10, 20), range(20, 30), range(30, 42)]
     logs_to_train = []
     for fold in folds_to_train:
         logs_to_train.extend(fold_to_user_ids[fold])
@@ -36,18 +48,24 @@ def main():
     stopwords_fn = os.path.join(path_to_perception_classifiers, 'src', 'stopwords_en.txt')
 
     print "calling ROSpy init"
-    rospy.init_node('ispy_retrain')
+    rospy.init_node('ispy_retrain', anonymous=True)
 
     try:
         f = open(os.path.join(out_dir, out_pickle_fn), 'rb')
         a = pickle.load(f)
         f.close()
-        print "loaded requested IspyAgent from file; ensure classifiers are intact!"
-        _ = raw_input()
+        a.service_ns = service_ns
+        if prompt:
+            print "loaded requested IspyAgent from file; ensure classifiers are intact!"
+            _ = raw_input()
+        else:
+            print "loaded requested IspyAgent from file; loading its perceptual classifiers"
+            a.load_classifiers()
     except IOError:
 
         print "instantiating blank ispyAgent"
         a = IspyAgent.IspyAgent(None, None, stopwords_fn)
+        a.service_ns = service_ns
 
         # pass over each requested fold's directory, loading agents, subtracting their base, and unifying
         for fold in folds_to_train:
@@ -104,30 +122,24 @@ def main():
                     valid, object_IDs = get_log_fn_properties(fn, cond, [user_id])
                     if valid:
                         print "... processing log " + fn
-                        f = open(os.path.join(root, fn), 'r')
-                        lines = f.readlines()
-                        f.close()
                         curr_ob = None
-                        for line_idx in range(0, len(lines)):
-                            if len(lines[line_idx].strip()) == 0:
-                                continue
-                            p = lines[line_idx].split(':')
+                        events = transcript_log.read_events(os.path.join(root, fn))
+                        for e, following in transcript_log.lookahead(events, 1):
                             # recognize pointing to a new object
-                            if p[0] == "point":
-                                curr_ob = object_IDs[int(p[1])]
+                            if e.kind == "point":
+                                curr_ob = object_IDs[e.value()]
                             # catch removal of banned preds when they are introduced by training speakers
-                            if p[0] == "cnf_clauses":
-                                cnf_clauses = ast.literal_eval(p[1])
-                                for cnf in cnf_clauses:
+                            if e.kind == "cnf_clauses":
+                                for cnf in e.value():
                                     for pred in cnf:
                                         if pred in test_fold_preds:
                                             print "...... discovered previously banned word '"+pred+"'"
                                             del test_fold_preds[test_fold_preds.index(pred)]
                             # remove training label gathered from pred not introduced in training
-                            if p[0] == "say" and p[1][:len("Would you use the word")] == "Would you use the word":
+                            if e.kind == "say" and e.raw[:len("Would you use the word")] == "Would you use the word":
                                 for pred in test_fold_preds:
-                                    if "'"+pred+"'" in p[1]:  # label to remove
-                                        r = lines[line_idx+1].split(':')[1]
+                                    if "'"+pred+"'" in e.raw and len(following) > 0:  # label to remove
+                                        r = following[0].raw
                                         if '?' not in r.split():
                                             if a.is_no(r):
                                                 print "...... removing negative label for '"+pred+"', "+str(curr_ob)
@@ -157,24 +169,22 @@ def main():
                 valid, object_IDs = get_log_fn_properties(fn, cond, logs_to_test)
                 if valid:
                     print "... processing log " + fn
-                    f_out = open(os.path.join(out_dir, fn), 'w')
-                    f_in = open(os.path.join(root, fn), 'r')
-                    lines = f_in.readlines()
-                    f_in.close()
-                    for line_idx in range(0, len(lines)):
-                        line = lines[line_idx]
-                        if len(line) == 0:
-                            f_out.write(line)
-                            continue
-                        p = line.strip().split(':')
-                        if p[0] == "match_scores":
-                            cnf_clauses = ast.literal_eval(lines[line_idx-1].split(':')[1])
-                            a.object_IDs = object_IDs
-                            match_scores = a.get_match_scores(cnf_clauses)
-                            f_out.write("match_scores:" + str(match_scores) + '\n')
-                        else:
-                            f_out.write(line)
-                    f_out.close()
+                    a.object_IDs = object_IDs
+                    transcript_log.rewrite_transcript(os.path.join(root, fn), os.path.join(out_dir, fn),
+                                                      artificial_match_scores(a))
+
+
+# a transcript rewriter replacing each logged match_scores with agent a's scores for the cnf_clauses before it
+def artificial_match_scores(a):
+    last_cnf = [None]
+
+    def replace(e):
+        if e.kind == "cnf_clauses":
+            last_cnf[0] = e
+        elif e.kind == "match_scores":
+            return str(a.get_match_scores(last_cnf[0].value()))
+        return None
+    return replace
 
 
 def get_fold_dirname(cond, fold):
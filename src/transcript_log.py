@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+__author__ = 'jesse'
+
+import ast
+import collections
+
+# how the payload of each kind of transcript line is parsed; kinds not listed are kept as strings
+payload_parsers = {"object_IDs": ast.literal_eval,
+                   "num_rounds": int,
+                   "point": int,
+                   "guess": lambda v: None if v == "None" else int(v),
+                   "cnf_clauses": ast.literal_eval,
+                   "match_scores": ast.literal_eval,
+                   "pred_scores": ast.literal_eval,
+                   "predicates_chosen": ast.literal_eval,
+                   "lcps": ast.literal_eval}
+
+
+# one 'kind:payload' line of a .trans.log, found at byte offset in its file; the payload is only parsed into
+# its typed value the first time value() is called, so events skipped over cost no more than splitting the line
+class TranscriptEvent:
+
+    def __init__(self, kind, raw, offset):
+        self.kind = kind
+        self.raw = raw
+        self.offset = offset
+        self.parsed = False
+        self.parsed_value = None
+
+    def value(self):
+        if not self.parsed:
+            parser = payload_parsers.get(self.kind)
+            self.parsed_value = parser(self.raw) if parser is not None else self.raw
+            self.parsed = True
+        return self.parsed_value
+
+    def __repr__(self):
+        return self.kind+":"+self.raw+" @"+str(self.offset)
+
+
+# parse one transcript line read at offset, or None if it isn't a 'kind:payload' line
+def parse_line(line, offset):
+    line = line.rstrip('\r\n')
+    sep = line.find(':')
+    if sep == -1:
+        return None
+    return TranscriptEvent(line[:sep], line[sep+1:], offset)
+
+
+# lazily yield the events of a transcript one line at a time, restricted to the given kinds if any; the file is
+# read in binary mode so that offsets can be passed back to read_event_at
+def read_events(fn, kinds=None):
+    if kinds is not None:
+        kinds = set(kinds)
+    f = open(fn, 'rb')
+    try:
+        offset = 0
+        for line in f:
+            line_offset = offset
+            offset += len(line)
+            if kinds is not None and line[:line.find(':')] not in kinds:
+                continue
+            e = parse_line(line, line_offset)
+            if e is not None:
+                yield e
+    finally:
+        f.close()
+
+
+# yield each event of events along with a list of up to n events following it, holding only n+1 in memory
+def lookahead(events, n):
+    window = collections.deque()
+    for e in events:
+        window.append(e)
+        if len(window) > n:
+            head = window.popleft()
+            yield head, list(window)
+    while len(window) > 0:
+        head = window.popleft()
+        yield head, list(window)
+
+
+# byte offsets of every event in a transcript, indexed by kind, for random access with read_event_at
+def index_offsets(fn, kinds=None):
+    idx = {}
+    for e in read_events(fn, kinds=kinds):
+        if e.kind not in idx:
+            idx[e.kind] = []
+        idx[e.kind].append(e.offset)
+    return idx
+
+
+# read the single event starting at offset of an open transcript file
+def read_event_at(f, offset):
+    f.seek(offset)
+    return parse_line(f.readline(), offset)
+
+
+# copy transcript in_fn to out_fn line for line, except where replace(e), called with every event in order,
+# returns a new payload for that event's line
+def rewrite_transcript(in_fn, out_fn, replace):
+    f_in = open(in_fn, 'rb')
+    f_out = open(out_fn, 'wb')
+    try:
+        offset = 0
+        for line in f_in:
+            e = parse_line(line, offset)
+            offset += len(line)
+            payload = replace(e) if e is not None else None
+            if payload is not None:
+                f_out.write(e.kind+":"+payload+'\n')
+            else:
+                f_out.write(line)
+    finally:
+        f_in.close()
+        f_out.close()
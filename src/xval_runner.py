@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+__author__ = 'jesse'
+
+import signal
+import subprocess
+import threading
+import Queue
+import numpy
+import rospy
+import IspyAgent
+
+
+# a classifier_services node of its own, started in namespace ns so that folds trained on it can't disturb
+# classifiers other folds are training; feature requests are remapped to the one shared feature service,
+# so every backend reads the same unchanged feature data
+# classifiers are saved to and loaded from classifier_dir if given, rather than the condition's shared directory
+class XvalBackend:
+
+    def __init__(self, cond, ns, package="perception_classifiers", classifier_dir=None, log=None):
+        self.ns = ns
+        command_args = ['rosrun', package, 'classifier_services', cond]
+        if classifier_dir is not None:
+            command_args.append(classifier_dir)
+        command_args.extend(['__ns:='+ns, 'fetch_feature_service:=/fetch_feature_service'])
+        print "Running command: " + ' '.join(command_args)
+        self.process = subprocess.Popen(command_args, stdout=log, stderr=log)
+        rospy.wait_for_service(ns+'/run_classifier')
+
+    # prefix an agent uses to reach this backend's services
+    def service_ns(self):
+        return self.ns+'/'
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)  # classifier_services frees its classifiers on SIGINT
+            self.process.wait()
+
+
+# the predicates whose classifiers must be (re)trained before evaluating fold oidx on a backend whose
+# classifiers were last trained for fold prev_oidx (None if never trained): those missing oidx's examples,
+# and those that were missing prev_oidx's examples and need them restored
+def predicates_to_retrain(a, oidx, prev_oidx):
+    if prev_oidx is None:
+        return a.predicates[:]
+    return [pred for pred in a.predicates
+            if oidx in a.predicate_examples[pred] or prev_oidx in a.predicate_examples[pred]]
+
+
+# a view of agent a with held-out object oidx's examples hidden, set to retrain the given predicates
+def fold_agent(a, oidx, preds):
+    b = IspyAgent.FoldView(a, masked_oidxs=[oidx])
+    for pred in preds:
+        b.classifier_data_modified[b.predicate_to_classifier_map[pred]] = True
+    return b
+
+
+# name of the slot holding classifiers trained on all of the agent's data, and of the slot for a fold
+full_slot = "xval_full"
+fold_slot = "xval_fold"
+
+
+# a view of agent a reaching the backend at ns
+def backend_agent(a, ns):
+    b = IspyAgent.FoldView(a)
+    b.service_ns = ns
+    return b
+
+
+# the slot active on the backend at ns before xval, to be restored with release_slots; xval slots left parked
+# by an interrupted run are dropped first, and if one of them is still active the default slot is restored
+def claim_slots(a, ns):
+    b = backend_agent(a, ns)
+    prev_slot = b.get_active_classifier_slot()
+    if prev_slot is None:
+        raise RuntimeError("could not ask backend '"+ns+"' for its active classifier slot")
+    if prev_slot in [full_slot, fold_slot]:
+        print "... backend '"+ns+"' was left in slot '"+prev_slot+"' by an earlier run; restoring 'default'"
+        prev_slot = "default"
+        if not b.switch_classifier_slot(prev_slot):
+            raise RuntimeError("could not restore the default classifier slot on backend '"+ns+"'")
+    b.drop_classifier_slot(fold_slot)
+    b.drop_classifier_slot(full_slot)
+    return prev_slot
+
+
+# return the backend at ns to prev_slot and release the slots used by xval
+def release_slots(a, ns, prev_slot):
+    b = backend_agent(a, ns)
+    if not b.switch_classifier_slot(prev_slot):
+        raise RuntimeError("could not restore classifier slot '"+prev_slot+"' on backend '"+ns+"'")
+    b.drop_classifier_slot(fold_slot)
+    b.drop_classifier_slot(full_slot)
+
+
+# train classifiers on all of a's data in the full slot of the backend at ns, leaving that slot active
+def train_full_slot(a, ns):
+    full = backend_agent(a, ns)
+    if not full.create_classifier_slot(full_slot) or not full.switch_classifier_slot(full_slot):
+        raise RuntimeError("could not create classifier slot '"+full_slot+"' on backend '"+ns+"'")
+    for pred in a.predicates:
+        full.classifier_data_modified[full.predicate_to_classifier_map[pred]] = True
+    full.retrain_predicate_classifiers()
+
+
+# clone the full slot for fold oidx, where only the predicates with examples of the held-out object need retraining;
+# a fold slot that couldn't be dropped after the last fold is dropped and cloned again
+def fold_agent_in_slot(a, ns, oidx):
+    preds = [pred for pred in a.predicates if oidx in a.predicate_examples[pred]]
+    b = fold_agent(a, oidx, preds)
+    b.service_ns = ns
+    if not b.clone_classifier_slot(fold_slot, full_slot):
+        if not b.switch_classifier_slot(full_slot) or not b.drop_classifier_slot(fold_slot) or \
+                not b.clone_classifier_slot(fold_slot, full_slot):
+            raise RuntimeError("could not clone classifier slot '"+full_slot+"' on backend '"+ns+"'")
+    if not b.switch_classifier_slot(fold_slot):
+        raise RuntimeError("could not switch to classifier slot '"+fold_slot+"' on backend '"+ns+"'")
+    return b, preds
+
+
+# run leave-one-out folds of agent a over the objects in folds; each worker owns one classifier backend and
+# trains its folds there one after another
+# with use_slots, each backend trains on all data once and every fold retrains only the predicates with examples
+# of its held-out object, in a copy-on-write clone of those classifiers; otherwise classifiers are retrained in
+# place, restoring predicates that differed for the worker's last fold
+# evaluate(b, oidx) is called with the trained fold agent and its result recorded; returns results by oidx
+# if num_workers is None, the single classifier_services node already running in the default namespace is used
+def run_folds(a, cond, folds, evaluate, num_workers=None, use_slots=True):
+    if num_workers is None:
+        namespaces = ['']
+        backends = []
+    else:
+        print "starting "+str(num_workers)+" classifier backends"
+        backends = [XvalBackend(cond, '/xval_'+str(k)) for k in range(0, num_workers)]
+        namespaces = [backend.service_ns() for backend in backends]
+
+    q = Queue.Queue()
+    for oidx in folds:
+        q.put(oidx)
+    results = {}
+    errors = []
+    lock = threading.Lock()
+
+    def fail(oidx, e):
+        lock.acquire()
+        errors.append((oidx, e))
+        lock.release()
+
+    def work(ns):
+        prev_oidx = None
+        prev_slot = None
+        try:
+            if use_slots:
+                prev_slot = claim_slots(a, ns)
+            while True:
+                try:
+                    oidx = q.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    if use_slots:
+                        if prev_oidx is None:
+                            print "... training classifiers on all data on backend '"+ns+"'"
+                            train_full_slot(a, ns)
+                        b, preds = fold_agent_in_slot(a, ns, oidx)
+                    else:
+                        preds = predicates_to_retrain(a, oidx, prev_oidx)
+                        b = fold_agent(a, oidx, preds)
+                        b.service_ns = ns
+                    print "... object "+str(oidx)+" on backend '"+ns+"': retraining "+str(len(preds))+" predicates"
+                    b.retrain_predicate_classifiers()
+                    prev_oidx = oidx
+                    r = evaluate(b, oidx)
+                    if use_slots:
+                        b.switch_classifier_slot(full_slot)
+                        b.drop_classifier_slot(fold_slot)
+                except Exception, e:
+                    fail(oidx, e)
+                    return
+                lock.acquire()
+                results[oidx] = r
+                lock.release()
+        except Exception, e:
+            fail(None, e)
+        finally:
+            if prev_slot is not None:
+                try:
+                    release_slots(a, ns, prev_slot)
+                except Exception, e:
+                    fail(None, e)
+
+    threads = [threading.Thread(target=work, args=(ns,)) for ns in namespaces]
+    try:
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(1)  # joining with a timeout keeps the main thread responsive to ctrl-c
+    finally:
+        for backend in backends:
+            backend.close()
+
+    if len(errors) > 0:
+        raise errors[0][1]
+    return results
+
+
+# sum per-fold maps of confusion matrices into one map
+def merge_confusion_matrices(fold_cms):
+    merged = {}
+    for cms in fold_cms:
+        for key in cms:
+            merged[key] = merged[key] + cms[key] if key in merged else numpy.array(cms[key])
+    return merged
+
+
+# read a classifier_services confidences csv once, keyed by predicate and shaped [behavior][modality]
+def read_confidences(conf_fn, a, num_behaviors, num_modalities):
+    f = open(conf_fn, 'r')
+    conf = {}  # indexed by predicate
+    for line in f.readlines():
+        parts = line.strip().split(',')
+        pred = a.classifier_to_predicate_map[int(parts[0])]
+        conf[pred] = [[float(parts[1+b_idx*num_modalities+m_idx]) for m_idx in range(0, num_modalities)]
+                      for b_idx in range(0, num_behaviors)]
+    f.close()
+    return conf
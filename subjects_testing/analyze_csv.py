@@ -1,18 +1,9 @@
 import sys
-import math
+import numpy
 import scipy.stats
 import operator  # TEMP
 
 
-def sign(a):
-    if a < 0:
-        return -1
-    elif a > 0:
-        return 1
-    else:
-        return 0
-
-
 # read command line and csv data
 try:
     p_paired_header = None if sys.argv[4] == "None" else sys.argv[4]
@@ -39,135 +30,131 @@ if len(sys.argv) == 6:
                     rv = required_value
                 restrictions[header] = [rv, op]
 
-# set up structures
+# load the csv once into a column per header, as floats where the whole column parses and as strings otherwise
 headers = [h.strip() for h in contents[0].split(',')]
-header_batch_data = {}  # indexed first by header, then by batch_header value
-batch_header_values = []
-for header in headers:
-    header_batch_data[header] = {}
-
-# read in data
-for line in contents[1:]:
-    if len(line) > 1:
-        line_parts = line.split(',')
-        restriction_violated = False
-        for restriction in restrictions:
-            if ((restrictions[restriction][1] == '=' and
-                    line_parts[headers.index(restriction)] != restrictions[restriction][0]) or
-                    (restrictions[restriction][1] == '<' and
-                        float(line_parts[headers.index(restriction)]) >= restrictions[restriction][0]) or
-                    (restrictions[restriction][1] == '>' and
-                        float(line_parts[headers.index(restriction)]) <= restrictions[restriction][0])):
-                restriction_violated = True
-        if restriction_violated:
-            continue
-        batch = line_parts[headers.index(batch_header)]
-        if batch not in batch_header_values:
-            batch_header_values.append(batch)
-        for h in range(0, len(headers)):
-            try:
-                data = float(line_parts[h])
-            except:
-                data = line_parts[h]
-            if p_paired_header is None:
-                if batch in header_batch_data[headers[h]]:
-                    header_batch_data[headers[h]][batch].append(data)
-                else:
-                    header_batch_data[headers[h]][batch] = [data]
-            else:
-                if batch in header_batch_data[headers[h]]:
-                    header_batch_data[headers[h]][batch][line_parts[headers.index(p_paired_header)]] = data
-                else:
-                    header_batch_data[headers[h]][batch] = {line_parts[headers.index(p_paired_header)]: data}
+rows = [line.split(',') for line in contents[1:] if len(line) > 1]
+raw_columns = {}  # indexed by header, the column's entries as read
+columns = {}  # indexed by header, the typed column
+for h in range(0, len(headers)):
+    raw_columns[headers[h]] = numpy.array([line_parts[h] for line_parts in rows], dtype=object)
+    try:
+        columns[headers[h]] = raw_columns[headers[h]].astype(numpy.float64)
+    except ValueError:
+        columns[headers[h]] = raw_columns[headers[h]]
+numeric_headers = [h for h in headers if columns[h].dtype == numpy.float64]
+
+# apply restrictions as one boolean mask over all rows
+satisfying = numpy.ones(len(rows), dtype=bool)
+for restriction in restrictions:
+    rv, op = restrictions[restriction]
+    if op == '=':
+        satisfying &= raw_columns[restriction] == rv
+    elif op == '<':
+        satisfying &= raw_columns[restriction].astype(numpy.float64) < rv
+    else:
+        satisfying &= raw_columns[restriction].astype(numpy.float64) > rv
+satisfying_rows = numpy.nonzero(satisfying)[0]
+
+# batches in the order they first appear among satisfying rows, and the rows making up each
+batch_column = raw_columns[batch_header][satisfying_rows]
+_, first_rows = numpy.unique(batch_column, return_index=True)
+batch_header_values = [batch_column[r] for r in sorted(first_rows)]
+batch_rows = {}  # indexed by batch_header value, row indices into columns
+for batch in batch_header_values:
+    batch_rows[batch] = satisfying_rows[batch_column == batch]
 
-# if paired data, transform from dictionaries to matching lists
+# if paired data, keep the last row for each pair key in each batch and line up the keys every batch shares
 if p_paired_header is not None:
-    h_order = [i for i in range(0, len(headers)) if headers[i] != p_paired_header]
-    h_order.append(headers.index(p_paired_header))
-    for h in h_order:
-        batch_lists = {}
-        for batch in batch_header_values:
-            batch_lists[batch] = []
-            for paired_idx in header_batch_data[p_paired_header][batch]:
-                pair_present = True
-                for _batch in batch_header_values:
-                    if _batch == batch:
-                        continue
-                    if paired_idx not in header_batch_data[p_paired_header][_batch].keys():
-                        pair_present = False
-                        print "WARNING: "+paired_idx+" pair key from batch "+batch+" missing from batch "+_batch
-                if pair_present:
-                    batch_lists[batch].append(header_batch_data[headers[h]][batch][paired_idx])
-
-        for batch in batch_header_values:
-            header_batch_data[headers[h]][batch] = batch_lists[batch]
+    batch_key_rows = {}  # indexed by batch_header value, then pair key
+    for batch in batch_header_values:
+        keys = raw_columns[p_paired_header][batch_rows[batch]]
+        batch_key_rows[batch] = dict(zip(keys, batch_rows[batch]))
+    for batch in batch_header_values:
+        for _batch in batch_header_values:
+            if _batch == batch:
+                continue
+            for paired_idx in batch_key_rows[batch]:
+                if paired_idx not in batch_key_rows[_batch]:
+                    print "WARNING: "+paired_idx+" pair key from batch "+batch+" missing from batch "+_batch
+    shared_keys = sorted(set.intersection(*[set(batch_key_rows[batch].keys()) for batch in batch_header_values])) \
+        if len(batch_header_values) > 0 else []
+    for batch in batch_header_values:
+        batch_rows[batch] = numpy.array([batch_key_rows[batch][key] for key in shared_keys], dtype=int)
 
 # print size of satisfying set
-print "\nsatisfying total\t" + str(sum([len(header_batch_data[batch_header][batch]) for batch in batch_header_values]))
+print "\nsatisfying total\t" + str(sum([len(batch_rows[batch]) for batch in batch_header_values]))
 batch_sizes = {}
 for batch in batch_header_values:
-    l = len(header_batch_data[batch_header][batch])
+    l = len(batch_rows[batch])
     print "satisfying batch " + batch + "\t" + str(l)
     batch_sizes[batch] = l
 
+# numeric columns gathered into one matrix per batch, so stats and tests run over every header at once
+numeric_data = numpy.column_stack([columns[h] for h in numeric_headers]) if len(numeric_headers) > 0 \
+    else numpy.zeros((len(rows), 0))
+batch_data = {batch: numeric_data[batch_rows[batch]] for batch in batch_header_values}
+
 # print avg and stddev
 print "\nraw stats"
 print "stat\t\tbatch\tavg\tstddev\tmin\tmax"
-batch_stats = {}
-for header in header_batch_data:
+batch_stats = {}  # indexed by header, then batch_header value, valued at [avg, stddev]
+for header in headers:
     batch_stats[header] = {}
-    for batch in batch_header_values:
-        batch_stats[header][batch] = []
-
-        # get stats
-        if len(header_batch_data[header][batch]):
-            try:
-                avg = sum(header_batch_data[header][batch]) / len(header_batch_data[header][batch])
-                stddev = math.sqrt(sum([math.pow(x - avg, 2.0) for x in header_batch_data[header][batch]]) / len(
-                    header_batch_data[header][batch]))
-            except:
-                avg = stddev = None
-        else:
-            avg = stddev = None
-        batch_stats[header][batch].extend([avg, stddev])
-
-        if batch_sizes[batch] > 0:
-            print "\t".join([header, str(batch), str(avg), str(stddev), str(min(header_batch_data[header][batch])),
-                             str(max(header_batch_data[header][batch]))])
+for batch in batch_header_values:
+    if batch_sizes[batch] > 0:
+        avgs = batch_data[batch].mean(axis=0)
+        stddevs = batch_data[batch].std(axis=0)
+        mins = batch_data[batch].min(axis=0)
+        maxs = batch_data[batch].max(axis=0)
+    for header in headers:
+        if batch_sizes[batch] > 0 and header in numeric_headers:
+            h = numeric_headers.index(header)
+            batch_stats[header][batch] = [float(avgs[h]), float(stddevs[h])]
+            print "\t".join([header, str(batch), str(float(avgs[h])), str(float(stddevs[h])),
+                             str(float(mins[h])), str(float(maxs[h]))])
+        elif batch_sizes[batch] > 0:
+            batch_stats[header][batch] = [None, None]
+            values = columns[header][batch_rows[batch]]
+            print "\t".join([header, str(batch), "None", "None", str(min(values)), str(max(values))])
         else:
+            batch_stats[header][batch] = [None, None]
             print "\t".join([header, str(batch), "EMPTY"])
 
-# calculate the two-side t-test p value
+# calculate the two-side t-test p value for every numeric header of each pair of batches at once
 print "\nstatistical tests"
 stats_header = "\t\t"
-results_under_p_value = []
+batch_pairs = []
 for b1 in range(0, len(batch_header_values)):
     for b2 in range(b1 + 1, len(batch_header_values)):
         stats_header += ",".join([batch_header_values[b1], batch_header_values[b2]]) + "\t\t"
+        batch_pairs.append((batch_header_values[b1], batch_header_values[b2]))
 print stats_header
-for h in header_batch_data:
+pair_p = {}  # indexed by pair of batch_header values, valued at p per numeric header or None if not tested
+for batch1, batch2 in batch_pairs:
+    if batch_sizes[batch1] == 0 or batch_sizes[batch2] == 0 or len(numeric_headers) == 0:
+        pair_p[(batch1, batch2)] = None
+        continue
+    with numpy.errstate(invalid='ignore', divide='ignore'):  # headers with equal averages aren't reported anyway
+        if p_paired_header is not None:
+            pair_p[(batch1, batch2)] = scipy.stats.ttest_rel(batch_data[batch1], batch_data[batch2], axis=0)[1]
+        else:
+            pair_p[(batch1, batch2)] = scipy.stats.ttest_ind(batch_data[batch1], batch_data[batch2], axis=0,
+                                                             equal_var=False)[1]
+results_under_p_value = []
+for h in headers:
     if h == batch_header:
         continue
     results_line = h + "\t"
-    for b1 in range(0, len(batch_header_values)):
-        for b2 in range(b1 + 1, len(batch_header_values)):
-            if batch_sizes[batch_header_values[b1]] == 0 or batch_sizes[batch_header_values[b2]] == 0:
-                p = None
-            elif batch_stats[h][batch_header_values[b1]][0] != batch_stats[h][batch_header_values[b2]][0]:
-                if p_paired_header is not None:
-                    p = scipy.stats.ttest_rel(header_batch_data[h][batch_header_values[b1]],
-                                              header_batch_data[h][batch_header_values[b2]])[1]
-                else:
-                    p = scipy.stats.ttest_ind(header_batch_data[h][batch_header_values[b1]],
-                                              header_batch_data[h][batch_header_values[b2]],
-                                              equal_var=False)[1]
-            else:
-                p = None
-            results_line += str(p) + "\t"
-            if p < p_value and p is not None:
-                results_under_p_value.append(
-                    [str(p), h, str((batch_header_values[b1], batch_stats[h][batch_header_values[b1]][0])),
-                     str((batch_header_values[b2], batch_stats[h][batch_header_values[b2]][0]))])
+    for batch1, batch2 in batch_pairs:
+        if (pair_p[(batch1, batch2)] is None or h not in numeric_headers or
+                batch_stats[h][batch1][0] == batch_stats[h][batch2][0]):
+            p = None
+        else:
+            p = pair_p[(batch1, batch2)][numeric_headers.index(h)]
+        results_line += str(p) + "\t"
+        if p is not None and p < p_value:
+            results_under_p_value.append(
+                [str(p), h, str((batch1, batch_stats[h][batch1][0])), str((batch2, batch_stats[h][batch2][0]))])
     print results_line
 
 # report results below p value
@@ -184,21 +171,18 @@ else:
 header = "f1"
 n = 10
 n_diff_max = 5
-diffs = {}
-print header, n
-print "pred, exp - con, |exp|, |con|"
-for pred in header_batch_data[p_paired_header]["con"]:
-    if (header_batch_data["n"]["exp"][header_batch_data[p_paired_header]["exp"].index(pred)] < n or
-            header_batch_data["n"]["con"][header_batch_data[p_paired_header]["con"].index(pred)] < n):
-        continue
-    diff = header_batch_data[header]["exp"][header_batch_data[p_paired_header]["exp"].index(pred)] - \
-        header_batch_data[header]["con"][header_batch_data[p_paired_header]["con"].index(pred)]
-    n_diff = header_batch_data["n"]["exp"][header_batch_data[p_paired_header]["exp"].index(pred)] - \
-        header_batch_data["n"]["con"][header_batch_data[p_paired_header]["con"].index(pred)]
-    if abs(n_diff) > n_diff_max and sign(n_diff) == sign(diff):
-        continue
-    diffs[pred] = diff
-for pred, diff in sorted(diffs.items(), key=operator.itemgetter(1), reverse=True):
-    print pred, diff, \
-        header_batch_data["n"]["exp"][header_batch_data[p_paired_header]["exp"].index(pred)], \
-        header_batch_data["n"]["con"][header_batch_data[p_paired_header]["con"].index(pred)]
+if p_paired_header is not None and header in columns and "n" in columns and \
+        "con" in batch_rows and "exp" in batch_rows:
+    diffs = {}
+    print header, n
+    print "pred, exp - con, |exp|, |con|"
+    exp_n = columns["n"][batch_rows["exp"]]
+    con_n = columns["n"][batch_rows["con"]]
+    diff = columns[header][batch_rows["exp"]] - columns[header][batch_rows["con"]]
+    n_diff = exp_n - con_n
+    kept = (exp_n >= n) & (con_n >= n) & ~((numpy.abs(n_diff) > n_diff_max) & (numpy.sign(n_diff) == numpy.sign(diff)))
+    preds = raw_columns[p_paired_header][batch_rows["con"]]
+    for idx in numpy.nonzero(kept)[0]:
+        diffs[idx] = diff[idx]
+    for idx, d in sorted(diffs.items(), key=operator.itemgetter(1), reverse=True):
+        print preds[idx], float(d), float(exp_n[idx]), float(con_n[idx])
@@ -1,6 +1,7 @@
 import sys
 import operator
-from scipy.stats.stats import pearsonr
+import numpy
+import scipy.stats
 
 # read command line and csv data
 try:
@@ -12,40 +13,36 @@ except:
     sys.exit("$python correlations.py " +
              "[object_results_file] [measurements_file] [predicates_csv] [cond]")
 
-# read in pred object scores
+measurement_headers = ["height", "width", "weight"]
+
+# read in pred object scores as (oidx, decision) pairs per predicate
 f = open(objs_fn, 'r')
-d = {}
+pred_pairs = {}
 uniform = []
 for line in f.readlines():
     pred, data = line.strip().split(':')
-    d[pred] = [0 for _ in range(0, 32)]
-    pairs = data.split(';')
-    last = None
-    differentiated = False
-    for pair in pairs:
-        oidx, dec = pair.split(',')
-        d[pred][int(oidx)-1] = float(dec)
-        if not differentiated and last is not None and last != float(dec):
-            differentiated = True
-        else:
-            last = float(dec)
-    if not differentiated:
+    pred_pairs[pred] = [(int(oidx)-1, float(dec)) for oidx, dec in [pair.split(',') for pair in data.split(';')]]
+    if len(set([dec for _, dec in pred_pairs[pred]])) < 2:
         uniform.append(pred)
 f.close()
 
-# read in measurements
+# read in measurements as (oidx, values) rows
 f = open(measures_fn, 'r')
 headers = f.readline().strip().split(',')
-m = {}
+measurement_rows = []
 for line in f.readlines():
     data = line.strip().split(',')
-    oidx = int(data[headers.index('new object id')])-1
-    for h in ["height", "width", "weight"]:
-        if h not in m:
-            m[h] = [0 for _ in range(0, 32)]
-        m[h][oidx] = float(data[headers.index(h)])
+    measurement_rows.append((int(data[headers.index('new object id')])-1,
+                             [float(data[headers.index(h)]) for h in measurement_headers]))
 f.close()
 
+# the object count is whatever the largest object id in either file is; unscored or unmeasured objects are 0
+num_objects = max([oidx for pred in pred_pairs for oidx, _ in pred_pairs[pred]] +
+                  [oidx for oidx, _ in measurement_rows]) + 1
+m = numpy.zeros((len(measurement_headers), num_objects))  # measurement by object
+for oidx, values in measurement_rows:
+    m[:, oidx] = values
+
 # read in n
 f = open(pred_fn, 'r')
 headers = f.readline().strip().split(',')
@@ -57,25 +54,36 @@ for line in f.readlines():
         n[data[headers.index('pred')]] = float(data[headers.index('n')])
 f.close()
 
-# calculate correlation between each predicate's decisions and the object's properties
-correlations = {}  # indexed first by header, then by predicate
-significance = {}
+# predicates to correlate, with their decisions by object as rows of one matrix
 n_limit = 10
 p_limit = 0.05
 r_limit = 0.5
-for h in ["height", "width", "weight"]:
-    if h not in correlations:
-        correlations[h] = {}
-        significance[h] = {}
-    for pred in d:
-        if pred in uniform or pred not in n or n[pred] < n_limit:
-            continue
-        r, p = pearsonr(d[pred], m[h])
-        correlations[h][pred] = r
-        significance[h][pred] = p
+preds = [pred for pred in pred_pairs if pred not in uniform and pred in n and n[pred] >= n_limit]
+d = numpy.zeros((len(preds), num_objects))  # predicate by object
+for i in range(0, len(preds)):
+    for oidx, dec in pred_pairs[preds[i]]:
+        d[i, oidx] = dec
+
+# calculate correlation between each predicate's decisions and the object's properties in one product of the
+# standardized rows, with two-sided p-values from the t distribution on num_objects-2 degrees of freedom
+d_std = d - d.mean(axis=1)[:, numpy.newaxis]
+d_std /= numpy.sqrt((d_std ** 2).sum(axis=1))[:, numpy.newaxis]
+m_std = m - m.mean(axis=1)[:, numpy.newaxis]
+m_std /= numpy.sqrt((m_std ** 2).sum(axis=1))[:, numpy.newaxis]
+r = numpy.clip(numpy.dot(m_std, d_std.T), -1.0, 1.0)  # measurement by predicate
+dof = num_objects - 2
+with numpy.errstate(divide='ignore'):
+    t = r * numpy.sqrt(dof / (1.0 - r ** 2))
+p = 2 * scipy.stats.t.sf(numpy.abs(t), dof)
+correlations = {}  # indexed first by header, then by predicate
+significance = {}
+for h_idx in range(0, len(measurement_headers)):
+    h = measurement_headers[h_idx]
+    correlations[h] = {preds[i]: r[h_idx, i] for i in range(0, len(preds))}
+    significance[h] = {preds[i]: p[h_idx, i] for i in range(0, len(preds))}
 
 # sort and print
-for h in ["height", "width", "weight"]:
+for h in measurement_headers:
     print h
     for pred, r in sorted(correlations[h].items(), key=operator.itemgetter(1), reverse=True):
         if significance[h][pred] < p_limit and (r > r_limit or r < -r_limit):
@@ -3,18 +3,26 @@ __author__ = 'jesse'
 
 import sys
 import os
-import ast
 import operator
 import copy
+import pickle
+import multiprocessing
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+import transcript_log
 
 
-# python extract_from_logs.py input_dir output_fn
+# python extract_from_logs.py input_dir output_fn output_obj_utt_fn [cache_fn=output_fn.cache] [num_workers=cpus]
+# the input directory is walked once; logs not already extracted into cache_fn at their current modification
+# time are extracted by a pool of num_workers processes and the cache updated, so a rerun after new sessions
+# only parses the new logs
 def main():
 
     # get command-line args
     in_dir = sys.argv[1]
     out_fn = sys.argv[2]
     out_obj_utt_fn = sys.argv[3]
+    cache_fn = sys.argv[4] if len(sys.argv) > 4 else out_fn+".cache"
+    num_workers = int(sys.argv[5]) if len(sys.argv) > 5 else multiprocessing.cpu_count()
 
     # known info
     fold_user_id_ranges = [range(i*10, (i+1)*10) for i in range(0, 4)]
@@ -22,28 +30,33 @@ def main():
     identifying_headers = ["user_id", "fold", "cond"]
     data_to_extract = ["avg_rg", "avg_hg", "avg_reg", "avg_rr@1", "avg_hr@1"]
 
+    # find every log each (cond, user) record draws from, then bring their extracted data up to date
+    conds = ["", "con", "exp"]
+    index = index_logs(in_dir, conds)
+    needed = set([fn for cond in conds for fold in range(0, 4) for user_id in fold_user_id_ranges[fold]
+                  for fn in index.get((cond, str(user_id)), [])])
+    log_data = update_log_data_cache(cache_fn, needed, num_workers)
+
     # gather data from log files
     d_to_write = []
     obj_utt = {}  # indexed by oidx, value list of utterances used to describe object
-    for cond in ["", "con", "exp"]:
+    for cond in conds:
         for fold in range(0, 4):
             for user_id in fold_user_id_ranges[fold]:
 
                 # get log file names
-                log_fns = []
-                for root, dirs, files in os.walk(in_dir):
-                    for f in files:
-                        if ((f[:3] == cond and f.split("_")[1] == str(user_id)) or
-                                (len(cond) == 0 and f.split("_")[0] == str(user_id))):
-                            log_fns.append(os.path.join(root, f))
+                log_fns = index.get((cond, str(user_id)), [])
                 if len(log_fns) == 0:
                     continue
 
-                # extract and unify information from each
+                # unify information from each
                 d = []
                 for fn in log_fns:
-                    d.append(extract_data_from_log(fn))
-                    update_obj_utt_from_log(fn, obj_utt)
+                    d.append(log_data[fn][0])
+                    for oid, toids, u in log_data[fn][1]:
+                        if oid not in obj_utt:
+                            obj_utt[oid] = []
+                        obj_utt[oid].append((toids, u))
                 d_avg = {key: sum([d[i][key] for i in range(0, len(d))])/float(len(d)) for key in d[0]}
 
                 # create and add record
@@ -72,36 +85,93 @@ def main():
                 f.write(str(oid) + ',' + ','.join([str(toid) for toid in toids]) + ',' + u + '\n')
 
 
+# walk in_dir once and index log file names by the (cond, user id) records they contribute to: those named
+# [cond]_[user id]_... and, for the empty condition, [user id]_...
+def index_logs(in_dir, conds):
+    index = {}
+    for root, dirs, files in os.walk(in_dir):
+        for f in files:
+            ps = f.split("_")
+            keys = []
+            for cond in conds:
+                if f[:3] == cond and len(ps) > 1:
+                    keys.append((cond, ps[1]))
+                if len(cond) == 0:
+                    keys.append((cond, ps[0]))
+            for key in keys:
+                if key not in index:
+                    index[key] = []
+                if os.path.join(root, f) not in index[key]:
+                    index[key].append(os.path.join(root, f))
+    return index
+
+
+# metrics and object/utterance triples of a single log, with the modification time they were extracted at
+def extract_log_data(fn):
+    ou = {}
+    update_obj_utt_from_log(fn, ou)
+    return (fn, os.path.getmtime(fn), extract_data_from_log(fn),
+            [(oid, toids, u) for oid in ou for toids, u in ou[oid]])
+
+
+# return extracted data indexed by log file name for each of fns, reading logs unchanged since cache_fn was
+# written from it and extracting the others in a pool of num_workers processes; the cache is rewritten with only
+# the logs in fns, through a temporary file so an interrupted run can't leave a partial cache behind
+def update_log_data_cache(cache_fn, fns, num_workers):
+    cache = {}
+    if os.path.isfile(cache_fn):
+        try:
+            f = open(cache_fn, 'rb')
+            cache = pickle.load(f)
+            f.close()
+        except (IOError, EOFError, pickle.UnpicklingError), e:
+            print "ignoring unreadable log cache "+cache_fn+": "+str(e)
+    stale = [fn for fn in fns if fn not in cache or cache[fn][0] != os.path.getmtime(fn)]
+    print "extracting "+str(len(stale))+" new or changed logs of "+str(len(fns))
+
+    if len(stale) > 0:
+        if num_workers > 1 and len(stale) > 1:
+            pool = multiprocessing.Pool(min(num_workers, len(stale)))
+            extracted = pool.map(extract_log_data, sorted(stale))
+            pool.close()
+            pool.join()
+        else:
+            extracted = [extract_log_data(fn) for fn in sorted(stale)]
+        for fn, mtime, d, ou in extracted:
+            cache[fn] = (mtime, d, ou)
+
+    cache = {fn: cache[fn] for fn in fns}
+    f = open(cache_fn+".tmp", 'wb')
+    pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+    f.close()
+    os.rename(cache_fn+".tmp", cache_fn)
+    return {fn: (cache[fn][1], cache[fn][2]) for fn in fns}
+
+
 # given a filename and dictionary, pass over log and extract object/utterance relationships
 def update_obj_utt_from_log(fn, d):
 
     toids = None  # oidxs of objects on table
     target_oids = []  # oidxs chosen as targets
     target_utterances = []  # the corresponding utterances used
-    with open(fn, 'r') as f:
-        curr_desc = None
-        last_get = None
-        last_point = None
-        last_say = None
-        for line in f.readlines():
-            ps = line.strip().split(':')
-            if len(ps) != 2:
-                continue
-            cmd, v = ps
-
-            if cmd == "object_IDs":
-                toids = [int(oidx) for oidx in v.strip('[]').split(', ')]
-            elif cmd == "get":
-                last_get = v
-            elif cmd == "say":
-                if curr_desc is None and "Is this the object" in v:
-                    curr_desc = last_get
-                last_say = v
-            elif cmd == "point":
-                if v == "-1" and "Is this the object" in last_say:
-                    target_oids.append(toids[last_point])
-                    target_utterances.append(curr_desc)
-                last_point = int(v)
+    curr_desc = None
+    last_get = None
+    last_point = None
+    last_say = None
+    for e in transcript_log.read_events(fn, kinds=["object_IDs", "get", "say", "point"]):
+        if e.kind == "object_IDs":
+            toids = e.value()
+        elif e.kind == "get":
+            last_get = e.raw
+        elif e.kind == "say":
+            if curr_desc is None and "Is this the object" in e.raw:
+                curr_desc = last_get
+            last_say = e.raw
+        elif e.kind == "point":
+            if e.value() == -1 and "Is this the object" in last_say:
+                target_oids.append(toids[last_point])
+                target_utterances.append(curr_desc)
+            last_point = e.value()
 
     for idx in range(len(target_oids)):
         oid = target_oids[idx]
@@ -114,15 +184,10 @@ def update_obj_utt_from_log(fn, d):
 # given a filename, makes a pass to extract data returned as a dictionary
 def extract_data_from_log(fn):
 
-    # read in file lines
-    f = open(fn, 'r')
-    lines = f.readlines()
-    f.close()
-
     # dictionary to return
     d = {}
 
-    # pass through the lines to calculate the average guesses taken by the human and robot
+    # pass through the events to calculate the average guesses taken by the human and robot
     human_guesses = 0
     human_first_guess = 0
     robot_guesses = 0
@@ -133,15 +198,11 @@ def extract_data_from_log(fn):
     first_guess_worth = -1
     num_rounds = 0
     game_started = False
-    for l_idx in range(0, len(lines)):
-        line = lines[l_idx]
-
-        if len(line) == 0:
-            continue
-        p = line.strip().split(':')
+    prev = None
+    for e, following in transcript_log.lookahead(transcript_log.read_events(fn), 2):
 
         # zero everything if the game started over
-        if p[0] == "object_IDs":
+        if e.kind == "object_IDs":
             if game_started:
                 print "Likely mechanical failure in '"+fn+"'"
             human_guesses = 0
@@ -156,19 +217,19 @@ def extract_data_from_log(fn):
             game_started = False
 
         # record number of rounds
-        elif p[0] == "num_rounds":
-            num_rounds = int(p[1])
+        elif e.kind == "num_rounds":
+            num_rounds = e.value()
 
-        elif p[0] == "get":
+        elif e.kind == "get":
             game_started = True
 
         # count robot guesses
-        elif p[0] == "say" and p[1] == "Is this the object you have in mind?":
+        elif e.kind == "say" and e.raw == "Is this the object you have in mind?":
             robot_guesses += 1
             if first_guess_worth == -1:
-                first_guess_worth = robot_expectation_rewards[int(lines[l_idx-1].strip().split(':')[1])]
-            if lines[l_idx+2].strip().split(':')[1] == "-1":  # this is the correct guess, so add expected reward
-                correct_idx = int(lines[l_idx-1].strip().split(':')[1])
+                first_guess_worth = robot_expectation_rewards[int(prev.raw)]
+            if len(following) > 1 and following[1].raw == "-1":  # this is the correct guess, so add expected reward
+                correct_idx = int(prev.raw)
                 robot_expectation_guesses += robot_expectation_rewards[correct_idx]
                 # in set of first guess, so get a 1st guess reward based on expected average position
                 if robot_expectation_rewards[correct_idx] == first_guess_worth:
@@ -183,17 +244,18 @@ def extract_data_from_log(fn):
                 first_guess_worth = -1
 
         # count human guesses, discarding guessing the same object twice in a row
-        elif p[0] == "guess" and p[1] != "None" and (len(last_guesses) == 0 or int(p[1]) != last_guesses[-1]):
+        elif e.kind == "guess" and e.value() is not None and (len(last_guesses) == 0 or
+                                                              e.value() != last_guesses[-1]):
             human_guesses += 1
-            last_guesses.append(int(p[1]))
-            if lines[l_idx+2].strip().split(':')[1] == p[1]:  # this was correct guess
+            last_guesses.append(e.value())
+            if len(following) > 1 and following[1].raw == e.raw:  # this was correct guess
                 if human_guesses == 1:
                     human_first_guess += 1
                 last_guesses = []
 
         # calculate net reward based on match scores to remove noise of guessing randomly
-        elif p[0] == "match_scores":
-            ms = ast.literal_eval(":".join(p[1:]))
+        elif e.kind == "match_scores":
+            ms = e.value()
             mss = sorted(ms.items(), key=operator.itemgetter(1), reverse=True)
             t = 1
             while len(mss) > 0:
@@ -212,6 +274,8 @@ def extract_data_from_log(fn):
                 for kn in o:
                     robot_expectation_rewards[kn] = robot_expectation_rewards[k]
 
+        prev = e
+
     # calculate averages
     d["avg_rg"] = robot_guesses / float(num_rounds)
     d["avg_hg"] = human_guesses / float(num_rounds)
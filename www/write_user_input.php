@@ -16,25 +16,58 @@ if (!isset($_POST['user_input']) && !isset($_POST['user_guess']))
 $path_to_dialog = '';
 $user_id = $_POST['user_id'];
 
+// the ispy server's session channel as a stream address, read from the file the server publishes it to;
+// addresses are a Unix domain socket path or 'host:port' for local TCP, as the server parses them
+function channel_address($path_to_dialog)
+{
+	$address = @file_get_contents($path_to_dialog.'communications/ispy.channel');
+	if ($address === false || strlen(trim($address)) == 0)
+		$address = $path_to_dialog.'communications/ispy.sock';
+	$address = trim($address);
+	if (strpos($address, ':') !== false && $address[0] != '/')
+		return 'tcp://'.$address;
+	return 'unix://'.$address;
+}
+
+// hand input to the ispy server's session channel as a length-prefixed JSON message;
+// returns false if the server isn't listening so the caller can fall back to the file protocol
+function send_to_channel($path_to_dialog, $user_id, $type, $data)
+{
+	$sock = @stream_socket_client(channel_address($path_to_dialog), $errno, $errstr, 1);
+	if (!$sock)
+		return false;
+	$msg = json_encode(array('type' => $type, 'id' => $user_id, 'data' => $data));
+	fwrite($sock, pack('N', strlen($msg)).$msg);
+	$header = fread($sock, 4);
+	fclose($sock);
+	return strlen($header) == 4;
+}
+
 // write user input, if any, to file to be read by agent to generate a response
 if (isset($_POST['user_input']))
 {
 	$user_input_raw = $_POST['user_input'];
 	$user_input = htmlspecialchars($user_input_raw);
-	$input_file = fopen($path_to_dialog.'communications/'.$user_id.'.get.in', 'w');
-	fwrite($input_file, $user_input);
-	fclose($input_file);
-	exec("chmod 777 ".$input_file);
+	if (!send_to_channel($path_to_dialog, $user_id, 'get', $user_input))
+	{
+		$input_file = fopen($path_to_dialog.'communications/'.$user_id.'.get.in', 'w');
+		fwrite($input_file, $user_input);
+		fclose($input_file);
+		exec("chmod 777 ".$input_file);
+	}
 }
 
 // write user guess, if any, to file to be read by agent to generate a response
 if (isset($_POST['user_guess']))
 {
 	$user_guess = $_POST['user_guess'];
-	$input_file = fopen($path_to_dialog.'communications/'.$user_id.'.guess.in', 'w');
-	fwrite($input_file, $user_guess);
-	fclose($input_file);
-	exec("chmod 777 ".$input_file);
+	if (!send_to_channel($path_to_dialog, $user_id, 'guess', $user_guess))
+	{
+		$input_file = fopen($path_to_dialog.'communications/'.$user_id.'.guess.in', 'w');
+		fwrite($input_file, $user_guess);
+		fclose($input_file);
+		exec("chmod 777 ".$input_file);
+	}
 }
 
 ?>